@@ -0,0 +1,131 @@
+# Measure writing of large output files with newline translation
+#
+# Usage: uv run python -m benchmarks.benchmark_output [REPETITIONS]
+
+import io
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+from stempelwerk.StempelWerk import StempelWerk
+
+# 50 files of 2 MB each, written with Windows newlines
+FILE_COUNT = 50
+LINE = 'INSERT INTO spam (eggs, ham) VALUES (42, "Lovely spam!");\n'
+CONTENT = LINE * (2 * 1024 * 1024 // len(LINE))
+NEWLINE = '\r\n'
+
+
+def write_text_mode(
+    output_path,
+):
+    output_path.write_text(
+        CONTENT,
+        encoding='utf-8',
+        newline=NEWLINE,
+    )
+
+
+def write_binary(
+    output_path,
+):
+    output_data = StempelWerk.encode_content(
+        CONTENT,
+        NEWLINE,
+        'utf-8',
+    )
+
+    output_path.write_bytes(output_data)
+
+
+def convert_text_mode(
+    _,
+):
+    # file system excluded
+    with io.TextIOWrapper(
+        io.BytesIO(),
+        encoding='utf-8',
+        newline=NEWLINE,
+    ) as output_file:
+        output_file.write(CONTENT)
+        output_file.flush()
+
+
+def convert_binary(
+    _,
+):
+    # file system excluded
+    StempelWerk.encode_content(
+        CONTENT,
+        NEWLINE,
+        'utf-8',
+    )
+
+
+SCENARIOS = {
+    'text mode (write_text)': write_text_mode,
+    'binary (encode_content)': write_binary,
+    'text mode, in memory': convert_text_mode,
+    'binary, in memory': convert_binary,
+}
+
+
+def measure(
+    write_file,
+    output_dir,
+    repetitions,
+):
+    timings = []
+
+    for _ in range(repetitions):
+        # always create new files
+        for output_path in output_dir.glob('spam_*.sql'):
+            output_path.unlink()
+
+        start = time.perf_counter()
+
+        for file_number in range(FILE_COUNT):
+            write_file(output_dir / f'spam_{file_number:03d}.sql')
+
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), statistics.median(timings)
+
+
+def main(
+    repetitions,
+):
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        output_dir = pathlib.Path(temporary_dir)
+
+        # both ways must produce identical files
+        write_text_mode(output_dir / 'text.sql')
+        write_binary(output_dir / 'binary.sql')
+
+        text_data = (output_dir / 'text.sql').read_bytes()
+        binary_data = (output_dir / 'binary.sql').read_bytes()
+        assert text_data == binary_data
+
+        total_megabytes = FILE_COUNT * len(binary_data) / 1024 / 1024
+
+        print()
+        print(f'writing {FILE_COUNT} files ({total_megabytes:.0f} MB)')
+        print()
+        print(f'{"scenario":40s}  {"minimum":>10s}  {"median":>10s}')
+        print()
+
+        for name, write_file in SCENARIOS.items():
+            minimum, median = measure(write_file, output_dir, repetitions)
+            minimum = f'{minimum * 1000:8.1f}ms'
+            median = f'{median * 1000:8.1f}ms'
+
+            print(f'{name:40s}  {minimum}  {median}')
+
+        print()
+
+
+if __name__ == '__main__':
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    main(repetitions)
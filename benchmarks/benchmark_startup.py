@@ -0,0 +1,122 @@
+# Measure start-up time of StempelWerk in fresh interpreters
+#
+# Usage: uv run python -m benchmarks.benchmark_startup [REPETITIONS]
+
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    'import StempelWerk': [
+        '-c',
+        'import stempelwerk.StempelWerk',
+    ],
+    'import StempelWerk and Jinja (eager)': [
+        '-c',
+        'import stempelwerk.StempelWerk, jinja2, herkules.Herkules, argparse',
+    ],
+    'stempelwerk --version': [
+        '-m',
+        'stempelwerk.StempelWerk',
+        '--version',
+    ],
+}
+
+
+def create_project(
+    project_dir,
+):
+    template_dir = project_dir / '10-templates'
+    template_dir.mkdir()
+    (project_dir / '20-output').mkdir()
+
+    template_path = template_dir / 'spam.jinja'
+    template_path.write_text(
+        "{{- 'spam.txt' | start_new_file -}}\neggs\n",
+    )
+
+    # StempelWerk treats templates modified shortly before a run as modified
+    # (see "_store_last_run"), so pretend the template is old
+    os.utime(template_path, (0, 0))
+
+    settings = {
+        'root_dir': project_dir.as_posix(),
+        'template_dir': '10-templates',
+        'output_dir': '20-output',
+        'included_file_names': ['*.jinja'],
+    }
+
+    settings_path = project_dir / 'settings.json'
+    settings_path.write_text(json.dumps(settings))
+
+    return settings_path
+
+
+def measure(
+    arguments,
+    repetitions,
+):
+    timings = []
+
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *arguments],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), statistics.median(timings)
+
+
+def main(
+    repetitions,
+):
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        settings_path = create_project(pathlib.Path(temporary_dir))
+
+        # full run, so that the following partial runs have nothing to do
+        subprocess.run(
+            [
+                sys.executable,
+                '-m',
+                'stempelwerk.StempelWerk',
+                '-qq',
+                str(settings_path),
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+        scenarios = dict(SCENARIOS)
+        scenarios['partial run without changes'] = [
+            '-m',
+            'stempelwerk.StempelWerk',
+            '-qq',
+            '--only-modified',
+            str(settings_path),
+        ]
+
+        print()
+        print(f'{"scenario":40s}  {"minimum":>10s}  {"median":>10s}')
+        print()
+
+        for name, arguments in scenarios.items():
+            minimum, median = measure(arguments, repetitions)
+            minimum = f'{minimum * 1000:8.1f}ms'
+            median = f'{median * 1000:8.1f}ms'
+
+            print(f'{name:40s}  {minimum}  {median}')
+
+        print()
+
+
+if __name__ == '__main__':
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    main(repetitions)
@@ -0,0 +1,14 @@
+Write-Output ""
+
+Get-ChildItem -Path "benchmarks" -Filter "benchmark_*.py" | ForEach-Object {
+    $Module = $_.BaseName
+
+    Write-Output "[$Module]"
+    uv run python -m "benchmarks.$Module" $args
+
+    If (-Not $?)
+    {
+        Write-Output ""
+        exit
+    }
+}
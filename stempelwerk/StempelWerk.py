@@ -41,19 +41,30 @@
 #
 # ----------------------------------------------------------------------------
 
-import argparse
-import copy
+# NOTE: heavy modules such as "jinja2", "herkules" and "argparse" are
+# NOTE  imported where they are needed; this keeps the start-up of the
+# NOTE  command line and of partial runs without modified templates fast
 import dataclasses
 import datetime
-import importlib
 import json
 import math
 import os
 import pathlib
 import sys
 
-import jinja2
-from herkules.Herkules import herkules
+from stempelwerk.StempelWerkErrors import (
+    ChangeDetectionError,
+    ConfigurationError,
+    CoordinatorError,
+    MissingDirectoryError,
+    MissingTemplatesError,
+    OutputError,
+    RenderingError,
+    StempelWerkError,
+    SyntaxCheckError,
+    TemplateBudgetExceeded,
+)
+from stempelwerk.StempelWerkTracking import DYNAMIC_REFERENCE, GlobalsTracker
 
 __version__ = '1.1.1'
 
@@ -73,6 +84,9 @@ class StempelWerk:
     VERBOSITY_LOW = -1
     VERBOSITY_VERY_LOW = -2
 
+    # the complete profile of templates is stored in the cache directory
+    HOT_LINES_SHOWN = 10
+
     @staticmethod
     def format_version(
         verbosity=VERBOSITY_NORMAL,
@@ -102,46 +116,163 @@ class StempelWerk:
     ):
         version_message = self.format_version(verbosity)
 
-        print()
+        self.printer.notice()
         if verbosity < self.VERBOSITY_NORMAL:  # pragma: no coverage
-            print(version_message)
+            self.printer.notice(version_message)
         else:
             for line in version_message.split('\n'):
-                print(f'[ {line:<48} ]')
-        print()
+                self.printer.notice(f'[ {line:<48} ]')
+        self.printer.notice()
 
     # ---------------------------------------------------------------------
 
+    # All console output goes through this class
+    #
+    # Messages are passed to a level-filtered logger that writes them in
+    # batches, optionally from a background thread and as JSON lines.
+    # Messages about single templates and files may be collapsed into
+    # summaries.
     class LinePrinter:
+        # same values as the levels of Python's "logging" module
+        DEBUG = 10
+        DETAIL = 15
+        INFO = 20
+        NOTICE = 25
+        WARNING = 30
+        ERROR = 40
+
         def __init__(
             self,
             verbosity,
+            json_log_path=None,
+            summary_interval=None,
+            background=False,
         ):
+            from stempelwerk.StempelWerkLogging import create_logger
+
             self.verbosity = verbosity
 
-        def _print_context(
+            self.logger, self._handlers, self._listener = create_logger(
+                self._get_log_level(verbosity),
+                json_log_path,
+                summary_interval,
+                background,
+            )
+
+        def _get_log_level(
+            self,
+            verbosity,
+        ):
+            if verbosity > StempelWerk.VERBOSITY_NORMAL:  # pragma: no coverage
+                return self.DEBUG
+            elif verbosity == StempelWerk.VERBOSITY_NORMAL:
+                return self.DETAIL
+            elif verbosity == StempelWerk.VERBOSITY_LOW:  # pragma: no coverage
+                return self.INFO
+            else:  # pragma: no coverage
+                return self.NOTICE
+
+        def _log(
             self,
-            context,
+            level,
             message,
+            end='\n',
+            summary=None,
+            cosmetic=False,
+            fields=None,
+            status=False,
         ):
-            if message:
-                message = f'{context}: {message}'
-            print(message)
+            self.logger.log(
+                level,
+                message,
+                extra={
+                    'end': end,
+                    'summary': summary,
+                    'cosmetic': cosmetic,
+                    'fields': fields or {},
+                    'status': status,
+                },
+            )
 
         def error(
             self,
             message='',
         ):
-            self._print_context('ERROR', message)
+            self._log(self.ERROR, message)
+
+        def warning(
+            self,
+            message='',
+        ):
+            self._log(self.WARNING, message)
+
+        def notice(
+            self,
+            message='',
+            end='\n',
+            cosmetic=False,
+            **fields,
+        ):
+            self._log(
+                self.NOTICE,
+                message,
+                end=end,
+                cosmetic=cosmetic,
+                fields=fields,
+            )
+
+        def status(
+            self,
+            message,
+        ):
+            # update status line in place; an empty message removes it
+            self._log(self.NOTICE, message, cosmetic=True, status=True)
+
+        def info(
+            self,
+            message='',
+            summary=None,
+            **fields,
+        ):
+            self._log(self.INFO, message, summary=summary, fields=fields)
+
+        def detail(
+            self,
+            message='',
+            summary=None,
+            **fields,
+        ):
+            self._log(self.DETAIL, message, summary=summary, fields=fields)
 
         def debug(
             self,
             message='',
         ):
-            if (
-                self.verbosity > StempelWerk.VERBOSITY_NORMAL
-            ):  # pragma: no coverage
-                self._print_context('DEBUG', message)
+            self._log(self.DEBUG, message)
+
+        def flush(
+            self,
+        ):
+            # wait for background thread to write all pending messages
+            if self._listener is not None:
+                self._listener.stop()
+
+            for handler in self._handlers:
+                handler.flush()
+
+            if self._listener is not None:
+                self._listener.start()
+
+        def close(
+            self,
+        ):
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+            for handler in self._handlers:
+                handler.flush()
+                handler.close()
 
     # ---------------------------------------------------------------------
 
@@ -162,13 +293,31 @@ class StempelWerk:
         included_file_names: list
         stencil_dir_name: str = ''
         create_directories: bool = False
+        output_archive: str = ''
+        deduplicate_output: bool = False
         # ----------------------------------------
         global_namespace: list = dataclasses.field(default_factory=dict)
+        data_sources: dict = dataclasses.field(default_factory=dict)
+        output_formats: dict = dataclasses.field(default_factory=dict)
         jinja_options: list = dataclasses.field(default_factory=dict)
         jinja_extensions: list = dataclasses.field(default_factory=list)
         custom_modules: list = dataclasses.field(default_factory=list)
         # ----------------------------------------
         last_run_file: str = '.last_run'
+        cache_dir: str = '.stempelwerk_cache'
+        cache_globals: bool = False
+        cache_fragments: bool = False
+        cache_directory_index: bool = False
+        fragment_cache_megabytes: int = 64
+        template_time_limit_seconds: float = 0
+        template_memory_limit_megabytes: int = 0
+        measure_peak_memory: bool = False
+        peak_memory_warning_megabytes: int = 0
+        profile_templates: bool = False
+        async_rendering: bool = False
+        async_rendering_tasks: int = 8
+        globals_tracking_depth: int = 1
+        track_globals: bool = False
         marker_new_file: str = '### New file:'
         marker_content: str = '### Content:'
         newline: str = None
@@ -212,6 +361,18 @@ class StempelWerk:
                 self.last_run_file,
             )
 
+            self.cache_dir = self.finalize_path(
+                self.root_dir,
+                self.cache_dir,
+            )
+
+            # output files are written into output directory by default
+            if self.output_archive:
+                self.output_archive = self.finalize_path(
+                    self.root_dir,
+                    self.output_archive,
+                )
+
         def __str__(
             self,
         ):
@@ -226,13 +387,31 @@ class StempelWerk:
                 'included_file_names',
                 'stencil_dir_name',
                 'create_directories',
+                'output_archive',
+                'deduplicate_output',
                 separator,
                 'global_namespace',
+                'data_sources',
+                'output_formats',
                 'jinja_options',
                 'jinja_extensions',
                 'custom_modules',
                 separator,
                 'last_run_file',
+                'cache_dir',
+                'cache_globals',
+                'cache_fragments',
+                'cache_directory_index',
+                'fragment_cache_megabytes',
+                'template_time_limit_seconds',
+                'template_memory_limit_megabytes',
+                'measure_peak_memory',
+                'peak_memory_warning_megabytes',
+                'profile_templates',
+                'async_rendering',
+                'async_rendering_tasks',
+                'globals_tracking_depth',
+                'track_globals',
                 'marker_new_file',
                 'marker_content',
                 'newline',
@@ -259,6 +438,11 @@ class StempelWerk:
     # ---------------------------------------------------------------------
 
     # Template class for customizing the Jinja environment
+    #
+    # "update_environment()" is called when the Jinja environment is created
+    # and "teardown()" at the end of every run. Resources registered in
+    # "self.resources" (such as database connections) are shared by all
+    # custom modules of a project and pooled across templates.
     class CustomCodeTemplate:
         def __init__(
             self,
@@ -270,12 +454,20 @@ class StempelWerk:
             self.settings = copy_of_settings
             self.printer = printer
 
+            # set by StempelWerk before the environment is updated
+            self.resources = None
+
         def update_environment(
             self,
             jinja_environment,
         ):
             return jinja_environment
 
+        def teardown(
+            self,
+        ):
+            pass
+
         def print_error(  # pragma: no coverage
             self,
             message='',
@@ -295,6 +487,8 @@ class StempelWerk:
         def parser(
             self,
         ):
+            import argparse
+
             class HelpfulArgumentParser(argparse.ArgumentParser):
                 def exit(
                     self,
@@ -326,7 +520,9 @@ class StempelWerk:
                 version=StempelWerk.APPLICATION_VERSION,
             )
 
-            parser.add_argument(
+            incremental_group = parser.add_mutually_exclusive_group()
+
+            incremental_group.add_argument(
                 '-m',
                 '--only-modified',
                 action='store_true',
@@ -334,6 +530,28 @@ class StempelWerk:
                 dest='process_only_modified',
             )
 
+            incremental_group.add_argument(
+                '--since',
+                action='store',
+                help=(
+                    'only process templates affected by changes since a git '
+                    'reference (such as "origin/main")'
+                ),
+                metavar='GIT_REF',
+                dest='changed_since',
+            )
+
+            incremental_group.add_argument(
+                '--changed',
+                action='store_const',
+                const='HEAD',
+                help=(
+                    'only process templates affected by uncommitted changes '
+                    '(same as "--since HEAD")'
+                ),
+                dest='changed_since',
+            )
+
             parser.add_argument(
                 '-g',
                 '--globals',
@@ -378,8 +596,120 @@ class StempelWerk:
             )
 
             parser.add_argument(
-                'settings_file_path',
-                help='path to JSON file containing application settings',
+                '--log-json',
+                action='store',
+                help=(
+                    'write log messages as JSON lines to a file ("-" writes '
+                    'to standard output instead of text)'
+                ),
+                metavar='LOG_FILE',
+                dest='json_log_path',
+            )
+
+            parser.add_argument(
+                '--summarize',
+                action='store',
+                type=float,
+                help=(
+                    'show a summary of processed templates and files at '
+                    'most every SECONDS instead of listing them'
+                ),
+                metavar='SECONDS',
+                dest='summary_interval',
+            )
+
+            parser.add_argument(
+                '--log-thread',
+                action='store_true',
+                help='write log messages from a background thread',
+                dest='background_logging',
+            )
+
+            parser.add_argument(
+                '--progress',
+                action='store_true',
+                help=(
+                    'show throughput and estimated time of arrival while '
+                    'rendering'
+                ),
+                dest='show_progress',
+            )
+
+            parser.add_argument(
+                '-k',
+                '--keep-going',
+                action='store_true',
+                help=(
+                    'carry on after templates fail and list all failed '
+                    'templates at the end'
+                ),
+                dest='keep_going',
+            )
+
+            parser.add_argument(
+                '--coordinate',
+                action='store',
+                help=(
+                    'hand out templates to render workers connecting to '
+                    'ADDRESS ("host:port" or path of a Unix socket)'
+                ),
+                metavar='ADDRESS',
+                dest='coordinator_address',
+            )
+
+            parser.add_argument(
+                '--local-workers',
+                action='store',
+                type=int,
+                default=0,
+                help='start N render workers on this host (with --coordinate)',
+                metavar='N',
+                dest='local_workers',
+            )
+
+            parser.add_argument(
+                '--worker',
+                action='store',
+                help='render templates for the coordinator at ADDRESS',
+                metavar='ADDRESS',
+                dest='worker_address',
+            )
+
+            syntax_group = parser.add_mutually_exclusive_group()
+
+            syntax_group.add_argument(
+                '--check-syntax',
+                action='store_true',
+                help=(
+                    'compile all templates and stencils in parallel and '
+                    'report all syntax errors before rendering'
+                ),
+                dest='check_syntax',
+            )
+
+            syntax_group.add_argument(
+                '--syntax-only',
+                action='store_true',
+                help='only check the syntax of templates and stencils',
+                dest='syntax_only',
+            )
+
+            parser.add_argument(
+                '-w',
+                '--workspace',
+                action='store',
+                help='JSON file listing settings files of several projects',
+                metavar='WORKSPACE_FILE',
+                dest='workspace_file_path',
+            )
+
+            parser.add_argument(
+                'settings_file_paths',
+                nargs='*',
+                help=(
+                    'path to JSON file containing application settings; '
+                    'specify several files to process multiple projects'
+                ),
                 metavar='SETTINGS_FILE',
             )
 
@@ -390,65 +720,189 @@ class StempelWerk:
             command_line_arguments,
         ):
             cla_without_scriptname = command_line_arguments[1:]
-            args = self.parser.parse_args(cla_without_scriptname)
 
-            self.printer = StempelWerk.LinePrinter(args.verbosity)
+            parser = self.parser
+            args = parser.parse_args(cla_without_scriptname)
 
-            # all paths are relative to the root directory, except for the path
-            # of the settings file, which is relative to the current working
-            # directory
-            settings_file_path = StempelWerk.Settings.finalize_path(
-                '',
-                args.settings_file_path,
+            # shared by all projects
+            self.printer = StempelWerk.LinePrinter(
+                args.verbosity,
+                args.json_log_path,
+                args.summary_interval,
+                args.background_logging,
             )
 
-            # parse settings file
-            loaded_settings = self._load_json_file(settings_file_path)
+            self.settings_file_paths = self._get_settings_file_paths(args)
+            if not self.settings_file_paths:
+                parser.error(
+                    'the following arguments are required: SETTINGS_FILE'
+                )
 
-            # parse global variables for Jinja environment
-            #
-            # provide default global namespace
-            if args.global_namespace is None:
-                loaded_settings['global_namespace'] = {}
-            # parse JSON-formatted dictionary
-            elif args.global_namespace.strip().startswith('{'):
-                loaded_settings['global_namespace'] = json.loads(
-                    args.global_namespace
+            # workers only receive template names, so they must render the
+            # same project as their coordinator
+            if len(self.settings_file_paths) > 1 and (
+                args.coordinator_address or args.worker_address
+            ):
+                parser.error(
+                    'argument --coordinate/--worker: render workers only '
+                    'support a single project'
                 )
-            # load JSON file
-            else:
-                loaded_settings['global_namespace'] = self._load_json_file(
-                    args.global_namespace
+
+            # here's where the magic happens: unpack JSON files into classes
+            self.all_settings = [
+                StempelWerk.Settings(
+                    **self._load_json_file(settings_file_path)
                 )
+                for settings_file_path in self.settings_file_paths
+            ]
 
-            # here's where the magic happens: unpack JSON file into class
-            self.settings = StempelWerk.Settings(**loaded_settings)
+            # settings of the first project (and the only one in most cases)
+            self.settings = self.all_settings[0]
+
+            self._load_global_namespaces(args.global_namespace)
 
             # store settings that may be overwritten at runtime separately
             self.process_only_modified = args.process_only_modified
+            self.changed_since = args.changed_since
             self.verbosity = args.verbosity
+            self.show_progress = args.show_progress
+            self.check_syntax = args.check_syntax
+            self.keep_going = args.keep_going
+            self.coordinator_address = args.coordinator_address
+            self.local_workers = args.local_workers
+            self.worker_address = args.worker_address
+            self.syntax_only = args.syntax_only
+
+        def _get_settings_file_paths(
+            self,
+            args,
+        ):
+            settings_file_paths = []
+
+            # paths in a workspace file are relative to the workspace file
+            if args.workspace_file_path:
+                workspace_file_path = StempelWerk.Settings.finalize_path(
+                    '',
+                    args.workspace_file_path,
+                )
+
+                workspace = self._load_json_file(workspace_file_path)
+
+                for settings_file_name in workspace['settings_files']:
+                    settings_file_path = StempelWerk.Settings.finalize_path(
+                        workspace_file_path.parent,
+                        settings_file_name,
+                    )
+
+                    settings_file_paths.append(settings_file_path)
+
+            # all paths are relative to the root directory, except for the path
+            # of the settings file, which is relative to the current working
+            # directory
+            for settings_file_name in args.settings_file_paths:
+                settings_file_path = StempelWerk.Settings.finalize_path(
+                    '',
+                    settings_file_name,
+                )
+
+                settings_file_paths.append(settings_file_path)
+
+            return settings_file_paths
+
+        def _load_global_namespaces(
+            self,
+            global_namespace,
+        ):
+            # parse global variables for Jinja environment only once per
+            # snapshot directory; projects get their own shallow copy, as they
+            # add their own data sources
+            loaded_namespaces = {}
+
+            for settings in self.all_settings:
+                snapshot_dir = None
+                if settings.cache_globals:
+                    snapshot_dir = settings.cache_dir / 'globals'
+
+                if snapshot_dir not in loaded_namespaces:
+                    loaded_namespaces[snapshot_dir] = (
+                        self._load_global_namespace(
+                            global_namespace,
+                            snapshot_dir,
+                        )
+                    )
+
+                settings.global_namespace = dict(
+                    loaded_namespaces[snapshot_dir]
+                )
+
+        def _load_global_namespace(
+            self,
+            global_namespace,
+            snapshot_dir=None,
+        ):
+            # provide default global namespace
+            if global_namespace is None:
+                return {}
+
+            # parse JSON-formatted dictionary
+            if global_namespace.strip().startswith('{'):
+                return json.loads(global_namespace)
+
+            # load JSON file, re-using a snapshot of an earlier run
+            snapshot = None
+            if snapshot_dir is not None:
+                from stempelwerk.StempelWerkSnapshot import JsonSnapshot
+
+                snapshot = JsonSnapshot(snapshot_dir)
+
+            start_of_loading = datetime.datetime.now()
+            parsed_json = self._load_json_file(global_namespace, snapshot)
+            loading_time = datetime.datetime.now() - start_of_loading
+
+            self.printer.debug(f'Loaded global variables in {loading_time}.')
+
+            if snapshot is not None and snapshot.write_error is not None:
+                self.printer.warning(
+                    'Cannot store snapshot of global variables: '
+                    f'{snapshot.write_error}'
+                )
+                self.printer.warning()
+
+            if snapshot is not None:
+                self.printer.debug(' ')
+
+                for step, step_time in snapshot.timings.items():
+                    self.printer.debug(f'  - {step + ":":16s}  {step_time}')
+
+                self.printer.debug(' ')
+
+            self.printer.debug()
+            return parsed_json
 
         def _load_json_file(
             self,
             json_file_path,
+            snapshot=None,
         ):
             try:
                 # "json_file_path" may be a string, so convert it to a path
                 json_file_path = pathlib.Path(json_file_path)
 
-                json_string = json_file_path.read_text()
-                parsed_json = json.loads(json_string)
+                if snapshot is not None:
+                    parsed_json = snapshot.load(json_file_path)
+                else:
+                    json_string = json_file_path.read_text()
+                    parsed_json = json.loads(json_string)
 
-            except FileNotFoundError:
-                self.printer.error(f'File "{json_file_path}" not found.')
-                self.printer.error()
-                exit(1)
+            except FileNotFoundError as err:
+                raise ConfigurationError(
+                    f'File "{json_file_path}" not found.'
+                ) from err
 
             except json.decoder.JSONDecodeError as err:
-                self.printer.error(f'File "{json_file_path}" is broken:')
-                self.printer.error(f'{err}')
-                self.printer.error()
-                exit(1)
+                raise ConfigurationError(
+                    f'File "{json_file_path}" is broken:\n{err}'
+                ) from err
 
             except TypeError as err:
                 self.printer.error(
@@ -464,15 +918,26 @@ class StempelWerk:
 
     # ---------------------------------------------------------------------
 
+    # custom modules imported by any instance: (resolved root directory,
+    # module name) => (digest of code, module)
+    _imported_modules = {}
+
     def __init__(
         self,
         settings,
         verbosity=VERBOSITY_NORMAL,
+        show_version=True,
+        printer=None,
         _testing_autocreate_main_directories=False,
+        _is_render_worker=False,
     ):
         self.verbosity = verbosity
-        self.printer = self.LinePrinter(self.verbosity)
-        self._display_version(self.verbosity)
+
+        # several instances may share a printer
+        self.printer = printer or self.LinePrinter(self.verbosity)
+
+        if show_version:
+            self._display_version(self.verbosity)
 
         self.printer.debug('Loading settings:')
         self.printer.debug(' ')
@@ -494,6 +959,11 @@ class StempelWerk:
             '.sh': '\n',
         }
 
+        # Jinja2 encodes all strings in UTF-8, so this is the default
+        self.encoding_exceptions = {}
+
+        self._load_output_formats()
+
         # ease testing
         if _testing_autocreate_main_directories:
             self.settings.template_dir.mkdir(
@@ -507,24 +977,191 @@ class StempelWerk:
         # ease trouble shooting
         else:
             if not self.settings.template_dir.exists():
-                self.printer.error(
-                    f'template directory "{self.settings.template_dir}"'
+                raise MissingDirectoryError(
+                    f'template directory "{self.settings.template_dir}"\n'
+                    'does not exist.'
                 )
-                self.printer.error('does not exist.')
-                self.printer.error()
-                exit(1)
 
-            if not self.settings.output_dir.exists():
-                self.printer.error(
-                    f'output directory "{self.settings.output_dir}"'
+            # archives are created in their parent directory
+            output_dir = self.settings.output_dir
+            if self.settings.output_archive:
+                output_dir = self.settings.output_archive.parent
+
+            if not output_dir.exists():
+                raise MissingDirectoryError(
+                    f'output directory "{output_dir}"\ndoes not exist.'
                 )
-                self.printer.error('does not exist.')
-                self.printer.error()
-                exit(1)
+
+        # custom module => time needed for loading it
+        self.module_load_times = {}
+
+        # created together with the Jinja environment
+        self.fragment_cache = None
+
+        # names of all files in template directory when using an index
+        self._indexed_template_names = None
+
+        # render workers hand rendered content to their supervisor, which
+        # saves it
+        self._is_render_worker = _is_render_worker
+        self.supervised_renderer = None
+        self.budget_overruns = []
+
+        # errors of templates are collected instead of raised on request
+        self.keep_going = False
+        self.failed_templates = []
+
+        # templates may be rendered by workers that connect to this process
+        self.coordinator_address = None
+        self.local_workers = 0
+        self.render_workers = {}
+
+        # peak memory is only measured on request
+        self.memory_tracker = None
+
+        # so are lines of templates that take the most time
+        self.template_profiler = None
+
+        # result of a template that has been rendered asynchronously
+        self._prerendered_result = None
+
+        # custom modules and the resources they share
+        self.custom_code = []
+        self.resources = None
+
+        # progress is only shown on request
+        self.progress_reporter = None
+        self.written_bytes = 0
+
+        self._check_budget_settings()
+        self._open_output_archive()
+
+        # identical output files are only written once on request
+        self.output_store = None
+
+        # keep track of the global variables accessed by each template
+        self.globals_tracker = GlobalsTracker(
+            self.settings.cache_dir / 'globals_dependencies.json',
+            self.settings.globals_tracking_depth,
+        )
+
+        self._open_data_sources()
+
+    def _load_output_formats(
+        self,
+    ):
+        import codecs
+
+        # settings extend and overwrite the default exceptions
+        for suffix, output_format in self.settings.output_formats.items():
+            if 'newline' in output_format:
+                self.newline_exceptions[suffix] = output_format['newline']
+
+            if 'encoding' in output_format:
+                encoding = output_format['encoding']
+
+                # catch typos before rendering anything
+                try:
+                    codecs.lookup(encoding)
+                except LookupError as err:
+                    raise ConfigurationError(
+                        f'unknown encoding "{encoding}" for "{suffix}" files.'
+                    ) from err
+
+                self.encoding_exceptions[suffix] = encoding
+
+    def _open_output_archive(
+        self,
+    ):
+        self.output_archive = None
+
+        # output files of render workers are saved by their supervisor
+        if not self.settings.output_archive or self._is_render_worker:
+            return
+
+        from stempelwerk.StempelWerkArchive import OutputArchive
+
+        try:
+            self.output_archive = OutputArchive(self.settings.output_archive)
+        except ValueError as err:
+            raise ConfigurationError(f'{err}') from err
+
+    def _check_budget_settings(
+        self,
+    ):
+        if not self._uses_supervised_renderer():
+            return
+
+        # templates with budgets are rendered in a worker process, so
+        # measuring this process would be misleading
+        for setting_name in ('measure_peak_memory', 'profile_templates'):
+            if getattr(self.settings, setting_name):
+                raise ConfigurationError(
+                    f'"{setting_name}" cannot be combined with time or '
+                    'memory limits for templates.'
+                )
+
+    def _open_output_store(
+        self,
+    ):
+        self.output_store = None
+
+        # archives are written as a whole
+        if not self.settings.deduplicate_output or self.output_archive:
+            return
+
+        from stempelwerk.StempelWerkOutputStore import OutputStore
+
+        self.output_store = OutputStore(self.settings.cache_dir / 'outputs')
+
+    def _open_data_sources(
+        self,
+    ):
+        self.data_sources = {}
+
+        if not self.settings.data_sources:
+            return
+
+        from stempelwerk.StempelWerkDataSources import open_data_source
+
+        self.printer.debug('Opening data sources:')
+        self.printer.debug(' ')
+
+        # data sources are opened lazily, so only their settings are checked
+        for source_name, source_settings in self.settings.data_sources.items():
+            self.printer.debug(f'  - {source_name}')
+
+            try:
+                self.data_sources[source_name] = open_data_source(
+                    self.settings.root_dir,
+                    source_settings,
+                )
+            except (FileNotFoundError, KeyError, ValueError) as err:
+                raise ConfigurationError(
+                    f'cannot open data source "{source_name}":\n{err!r}'
+                ) from err
+
+        self.printer.debug(' ')
+        self.printer.debug('Done.')
+        self.printer.debug()
+
+    def _close_data_sources(
+        self,
+    ):
+        # release database connections and file handles between runs
+        for data_source in self.data_sources.values():
+            data_source.close()
 
     def create_environment(
         self,
     ):
+        import jinja2
+
+        from stempelwerk.StempelWerkEnvironment import (
+            StempelWerkEnvironment,
+            shared_bytecode_cache,
+        )
+
         self.printer.debug('Loading templates ...')
 
         # NOTE: Jinja loads templates from sub-directories;
@@ -538,9 +1175,24 @@ class StempelWerk:
             encoding='utf-8',
         )
 
-        self.jinja_environment = jinja2.Environment(
+        # async rendering allows filters and global functions to be
+        # coroutines
+        jinja_options = dict(self.settings.jinja_options)
+        if self.settings.async_rendering:
+            jinja_options['enable_async'] = True
+
+        # templates and stencils shared by several projects are compiled only
+        # once per process
+        self.jinja_environment = StempelWerkEnvironment(
             loader=template_loader,
-            **self.settings.jinja_options,
+            bytecode_cache=shared_bytecode_cache,
+            **jinja_options,
+        )
+
+        # templates importing a stencil depend on the global variables
+        # accessed while evaluating it, even when it is re-used
+        self.jinja_environment.stencil_modules.recorder = (
+            self.globals_tracker.recorder
         )
 
         # load Jinja extensions first so they can be used in custom modules
@@ -561,7 +1213,13 @@ class StempelWerk:
     ):
         template_paths = []
 
-        for template_filename in self.jinja_environment.list_templates():
+        # re-use the directory index instead of scanning the template
+        # directory once more
+        template_filenames = self._indexed_template_names
+        if template_filenames is None:
+            template_filenames = self.jinja_environment.list_templates()
+
+        for template_filename in template_filenames:
             template_path = pathlib.Path(template_filename)
             template_paths.append(template_path)
 
@@ -572,10 +1230,7 @@ class StempelWerk:
         template_paths,
     ):
         if not template_paths:
-            self.printer.error()
-            self.printer.error('No templates found.')
-            self.printer.error()
-            exit(1)
+            raise MissingTemplatesError('No templates found.')
 
     def _get_stencils(
         self,
@@ -598,10 +1253,7 @@ class StempelWerk:
 
         # check whether stencil directories contain any stencils
         if not stencil_paths:
-            self.printer.error()
-            self.printer.error('No stencils found.')
-            self.printer.error()
-            exit(1)
+            raise MissingTemplatesError('No stencils found.')
 
         # list all templates in cache
         if (
@@ -652,27 +1304,46 @@ class StempelWerk:
         assert 'start_new_file' not in self.jinja_environment.filters
         self.jinja_environment.filters['start_new_file'] = start_new_file
 
+        # memoize expensive parts of templates with "{% cache key %}"
+        from stempelwerk.StempelWerkFragmentCache import (
+            FragmentCache,
+            FragmentCacheExtension,
+        )
+
+        fragment_cache_dir = None
+        if self.settings.cache_fragments:
+            fragment_cache_dir = self.settings.cache_dir / 'fragments'
+
+        self.fragment_cache = FragmentCache(
+            self.globals_tracker,
+            fragment_cache_dir,
+            self.settings.fragment_cache_megabytes * 1024 * 1024,
+        )
+
+        self.jinja_environment.add_extension(FragmentCacheExtension)
+        self.jinja_environment.fragment_cache = self.fragment_cache
+
+        # create a new file with "{% file name %}"; unlike "start_new_file",
+        # contents are saved directly and need not be split
+        from stempelwerk.StempelWerkFileTag import FileExtension
+
+        self.jinja_environment.add_extension(FileExtension)
+        self.jinja_environment.file_writer = self._save_tagged_file
+
     def _execute_custom_modules(
         self,
     ):
+        import copy
+
+        from stempelwerk.StempelWerkResources import ResourceRegistry
+
         self._add_stempelwerk_helpers()
 
         if not self.settings.custom_modules:
             return
 
-        self.printer.debug('Appending root directory to module search path:')
-        self.printer.debug(' ')
-
-        # NOTE: "abspath" normalizes the path (seems to be required
-        # NOTE  when loading modules), but may interfere with the
-        # NOTE  interpretation of symlinks
-        root_dir_module = os.path.abspath(self.settings.root_dir)
-
-        self.printer.debug(f'  {root_dir_module}')
-        self.printer.debug(' ')
-
-        # allow loading modules from shell client
-        sys.path.append(root_dir_module)
+        self._extend_module_search_path()
+        self.resources = ResourceRegistry(self.settings.root_dir)
 
         self.printer.debug('Loading custom modules:')
         self.printer.debug(' ')
@@ -680,12 +1351,16 @@ class StempelWerk:
         for module_name in self.settings.custom_modules:
             self.printer.debug(f'  [ {module_name} ]')
 
-            # import code as module
-            module_spec = importlib.util.find_spec(module_name)
-            imported_module = importlib.util.module_from_spec(module_spec)
+            start_of_loading = datetime.datetime.now()
+            imported_module, is_cached = self._import_custom_module(
+                module_name
+            )
+            loading_time = datetime.datetime.now() - start_of_loading
+
+            self.module_load_times[module_name] = loading_time
 
-            # execute module its own namespace
-            module_spec.loader.exec_module(imported_module)
+            cached = ' (cached)' if is_cached else ''
+            self.printer.debug(f'  - Loaded in {loading_time}{cached}.')
 
             # prevent changes to settings
             custom_code = imported_module.CustomCode(
@@ -693,6 +1368,9 @@ class StempelWerk:
                 self.printer,
             )
 
+            custom_code.resources = self.resources
+            self.custom_code.append(custom_code)
+
             self.printer.debug('  - Updating environment ...')
 
             # execute custom code and store updated Jinja environment
@@ -703,35 +1381,194 @@ class StempelWerk:
             self.printer.debug('  - Done.')
             self.printer.debug(' ')
 
+        # fragments rendered with other custom code must not be re-used
+        self.fragment_cache.custom_code_digest = self._get_custom_code_digest()
+
         self.printer.debug('Done.')
         self.printer.debug()
 
+    def _get_custom_code_digest(
+        self,
+    ):
+        import hashlib
+
+        hasher = hashlib.blake2b(digest_size=16)
+
+        for module_path in self._get_custom_module_paths():
+            hasher.update(module_path.read_bytes())
+
+        return hasher.hexdigest()
+
+    def _extend_module_search_path(
+        self,
+    ):
+        self.printer.debug('Appending root directory to module search path:')
+        self.printer.debug(' ')
+
+        # NOTE: "abspath" normalizes the path (seems to be required
+        # NOTE  when loading modules), but may interfere with the
+        # NOTE  interpretation of symlinks
+        root_dir_module = os.path.abspath(self.settings.root_dir)
+
+        self.printer.debug(f'  {root_dir_module}')
+        self.printer.debug(' ')
+
+        # allow loading modules from shell client; long-lived applications
+        # create many instances, so do not let the search path grow
+        if root_dir_module not in sys.path:
+            sys.path.append(root_dir_module)
+
+    def _get_custom_module_paths(
+        self,
+    ):
+        if not self.settings.custom_modules:
+            return []
+
+        self._extend_module_search_path()
+
+        return [
+            self._find_custom_module(module_name)[1]
+            for module_name in self.settings.custom_modules
+        ]
+
+    def _find_custom_module(
+        self,
+        module_name,
+    ):
+        import importlib.util
+
+        # modules in the root directory of a project take precedence; the
+        # regular search imports parent packages into "sys.modules", where
+        # the next project would find them instead of its own
+        module_spec = self._find_module_in_root_dir(module_name)
+
+        # such as modules in installed packages
+        if module_spec is None:
+            try:
+                module_spec = importlib.util.find_spec(module_name)
+            except ModuleNotFoundError:
+                module_spec = None
+
+        # namespace packages have no code of their own
+        if module_spec is None or module_spec.origin is None:
+            raise ConfigurationError(
+                f'cannot find custom module "{module_name}"'
+            )
+
+        return module_spec, pathlib.Path(module_spec.origin).resolve()
+
+    def _find_module_in_root_dir(
+        self,
+        module_name,
+    ):
+        import importlib.machinery
+
+        search_path = [os.path.abspath(self.settings.root_dir)]
+        module_spec = None
+
+        # find parent packages without importing them
+        name_parts = module_name.split('.')
+        for index in range(len(name_parts)):
+            if search_path is None:
+                return None
+
+            module_spec = importlib.machinery.PathFinder.find_spec(
+                '.'.join(name_parts[: index + 1]),
+                search_path,
+            )
+
+            if module_spec is None:
+                return None
+
+            search_path = module_spec.submodule_search_locations
+
+        return module_spec
+
+    def _import_custom_module(
+        self,
+        module_name,
+    ):
+        import hashlib
+        import importlib.util
+
+        module_spec, module_path = self._find_custom_module(module_name)
+
+        # instances re-use imported modules until their code changes
+        module_digest = hashlib.blake2b(
+            module_path.read_bytes(),
+            digest_size=16,
+        ).hexdigest()
+
+        # projects may have different modules with the same name
+        module_key = (
+            pathlib.Path(self.settings.root_dir).resolve(),
+            module_name,
+        )
+
+        cached_module = self._imported_modules.get(module_key)
+        if cached_module and cached_module[0] == module_digest:
+            return cached_module[1], True
+
+        # import code as module
+        imported_module = importlib.util.module_from_spec(module_spec)
+
+        # execute module its own namespace
+        module_spec.loader.exec_module(imported_module)
+
+        self._imported_modules[module_key] = (module_digest, imported_module)
+        return imported_module, False
+
     def render_template(
         self,
         template_path,
         custom_global_namespace=None,
     ):
-        relative_template_path = template_path.relative_to(
-            self.settings.template_dir
-        )
-
         global_namespace = self._prepare_global_namespace(
             custom_global_namespace
         )
 
+        # global variables may change between calls, so render workers are
+        # not re-used
+        try:
+            return self._process_template(
+                template_path,
+                global_namespace,
+            )
+        finally:
+            self._close_supervised_renderer()
+
+    def _process_template(
+        self,
+        template_path,
+        global_namespace,
+    ):
+        relative_template_path = template_path.relative_to(
+            self.settings.template_dir
+        )
+
         # create environment automatically
         if not hasattr(self, 'jinja_environment'):
             self.create_environment()
 
-        raw_content_of_multiple_files = self._render_content(
-            relative_template_path,
-            global_namespace,
-        )
+        # files created with "{% file name %}" are saved while rendering
+        self._saved_tagged_files = 0
+
+        if self.memory_tracker is not None:
+            self.memory_tracker.start_template(
+                relative_template_path.as_posix()
+            )
+
+        with self._measure_memory('render'):
+            raw_content_of_multiple_files = self._render_content(
+                relative_template_path,
+                global_namespace,
+            )
 
         # "run_results" contains number of processed and saved files
         run_results = self._save_content(
             raw_content_of_multiple_files,
         )
+        run_results['saved_files'] += self._saved_tagged_files
 
         return run_results
 
@@ -749,30 +1586,45 @@ class StempelWerk:
         if custom_global_namespace:
             global_namespace.update(custom_global_namespace)
 
+        # add data sources, unless global variables use the same name
+        for source_name, data_source in self.data_sources.items():
+            global_namespace.setdefault(source_name, data_source)
+
+        # record which global variables are accessed by templates
+        tracked_global_namespace = self.globals_tracker.wrap(global_namespace)
+
+        # modules of stencils evaluated with earlier global variables cannot
+        # be re-used
+        if hasattr(self, 'jinja_environment'):
+            self.jinja_environment.stencil_modules.clear()
+
         # force users to explicitly mark global variables in code
-        return {'globals': global_namespace}
+        return {'globals': tracked_global_namespace}
 
     def _render_content(
         self,
         template_path,
         global_namespace,
     ):
-        if self.verbosity >= self.VERBOSITY_LOW:  # pragma: no branch
-            print(f'- {template_path}')
+        import jinja2
 
         # Jinja2 cannot handle Windows paths
         template_filename = template_path.as_posix()
 
+        self.printer.info(
+            f'- {template_path}',
+            summary='templates',
+            template=template_filename,
+        )
+
         try:
-            jinja_template = self.jinja_environment.get_template(
+            content_of_multiple_files = self._render_jinja_template(
                 template_filename,
-                globals=global_namespace,
+                global_namespace,
             )
 
-            # the Jinja2 documentation suggests that applications should use
-            # environment globals instead of (local) template context
-            # (https://jinja.palletsprojects.com/en/3.1.x/api/#global-namespace)
-            content_of_multiple_files = jinja_template.render()
+        except TemplateBudgetExceeded:
+            raise
 
         except (
             jinja2.exceptions.TemplateSyntaxError,
@@ -786,6 +1638,7 @@ class StempelWerk:
 
             self.printer.error(f'{err.message} (line {err.lineno})')
             self.printer.error()
+            self.printer.flush()
 
             # show full backtrace to simplify debugging templates
             raise err
@@ -797,20 +1650,189 @@ class StempelWerk:
                 self.printer.error(f'in file "{template_filename}"')
 
             self.printer.error()
+            self.printer.flush()
 
             # show full backtrace to simplify debugging templates
             raise err
 
         return content_of_multiple_files
 
+    def _render_jinja_template(
+        self,
+        template_filename,
+        global_namespace,
+    ):
+        if self._uses_supervised_renderer():
+            return self._render_supervised(template_filename)
+
+        if self._prerendered_result is not None:
+            return self._use_prerendered_result(template_filename)
+
+        jinja_template = self.jinja_environment.get_template(
+            template_filename,
+            globals=global_namespace,
+        )
+
+        # the Jinja2 documentation suggests that applications should use
+        # environment globals instead of (local) template context
+        # (https://jinja.palletsprojects.com/en/3.1.x/api/#global-namespace)
+        with self.globals_tracker.recorder.recording() as accessed_paths:
+            content_of_multiple_files = jinja_template.render()
+
+        self._record_global_dependencies(
+            template_filename,
+            accessed_paths,
+        )
+
+        return content_of_multiple_files
+
+    def _use_prerendered_result(
+        self,
+        template_filename,
+    ):
+        render_result = self._prerendered_result
+        self._prerendered_result = None
+
+        if render_result.error is not None:
+            raise render_result.error
+
+        # files created with "{% file name %}" are saved in order
+        for output_file_name, content in render_result.tagged_files:
+            self._save_tagged_file(output_file_name, content)
+
+        # render workers have already analyzed their templates
+        referenced_templates = getattr(
+            render_result,
+            'referenced_templates',
+            None,
+        )
+
+        if referenced_templates is None:
+            self._record_global_dependencies(
+                template_filename,
+                render_result.accessed_paths,
+            )
+        else:
+            self.globals_tracker.record(
+                template_filename,
+                render_result.accessed_paths,
+                referenced_templates,
+            )
+
+        return render_result.content
+
+    def _uses_supervised_renderer(
+        self,
+    ):
+        # render workers render templates themselves
+        if self._is_render_worker:
+            return False
+
+        return bool(
+            self.settings.template_time_limit_seconds
+            or self.settings.template_memory_limit_megabytes
+        )
+
+    def _render_supervised(
+        self,
+        template_filename,
+    ):
+        from stempelwerk.StempelWerkWorker import SupervisedRenderer
+
+        if self.supervised_renderer is None:
+            self.supervised_renderer = SupervisedRenderer(
+                self.settings,
+                # debug output has already been printed by this process
+                min(self.verbosity, self.VERBOSITY_NORMAL),
+                self.settings.template_time_limit_seconds,
+                self.settings.template_memory_limit_megabytes,
+            )
+
+            if (
+                self.settings.template_memory_limit_megabytes
+                and not self.supervised_renderer.is_memory_limit_supported()
+            ):  # pragma: no coverage
+                self.printer.debug('Memory limits are not supported here.')
+                self.printer.debug()
+
+        try:
+            render_result = self.supervised_renderer.render(template_filename)
+        except Exception:
+            self._display_worker_traceback()
+            raise
+
+        # files created with "{% file name %}" are saved as if they had been
+        # rendered in this process
+        for output_file_name, content in render_result.tagged_files:
+            self._save_tagged_file(output_file_name, content)
+
+        self.globals_tracker.record(
+            template_filename,
+            render_result.accessed_paths,
+            render_result.referenced_templates,
+        )
+
+        return render_result.content
+
+    def _display_worker_traceback(
+        self,
+    ):
+        worker_traceback = self.supervised_renderer.worker_traceback
+
+        if not worker_traceback:
+            return
+
+        for line in worker_traceback.rstrip().splitlines():
+            self.printer.error(line)
+
+        self.printer.error()
+
+    def _close_supervised_renderer(
+        self,
+    ):
+        if self.supervised_renderer is not None:
+            self.supervised_renderer.close()
+            self.supervised_renderer = None
+
+    def _record_global_dependencies(
+        self,
+        template_filename,
+        accessed_paths,
+    ):
+        if not self.globals_tracker.is_enabled:
+            return
+
+        # static analysis finds global variables in code paths that have not
+        # been executed; runtime tracking finds computed keys such as
+        # "globals[key]"
+        static_analysis = getattr(
+            self.jinja_environment,
+            'static_analysis',
+            {},
+        )
+
+        static_paths, referenced_templates = (
+            self.globals_tracker.get_static_dependencies(
+                static_analysis,
+                template_filename,
+            )
+        )
+
+        self.globals_tracker.record(
+            template_filename,
+            accessed_paths | static_paths,
+            referenced_templates,
+        )
+
     def _save_content(
         self,
         raw_content_of_multiple_files,
     ):
         # split content into multiple files
-        split_contents = raw_content_of_multiple_files.split(
-            self.settings.marker_new_file
-        )
+        with self._measure_memory('split'):
+            split_contents = raw_content_of_multiple_files.split(
+                self.settings.marker_new_file
+            )
 
         processed_templates = 1
         saved_files = 0
@@ -821,16 +1843,30 @@ class StempelWerk:
             if not raw_content_of_single_file.strip():
                 continue
 
-            saved_files += self._save_single_file(raw_content_of_single_file)
+            with self._measure_memory('write'):
+                saved_files += self._save_single_file(
+                    raw_content_of_single_file
+                )
 
-        if self.verbosity >= self.VERBOSITY_NORMAL:  # pragma: no branch
-            print()
+        # separate templates
+        self.printer.detail(summary='')
 
         return {
             'processed_templates': processed_templates,
             'saved_files': saved_files,
         }
 
+    def _measure_memory(
+        self,
+        phase,
+    ):
+        import contextlib
+
+        if self.memory_tracker is None:
+            return contextlib.nullcontext()
+
+        return self.memory_tracker.measure(phase)
+
     def _save_single_file(
         self,
         raw_content,
@@ -839,18 +1875,37 @@ class StempelWerk:
             raw_content
         )
 
-        if self.verbosity >= self.VERBOSITY_NORMAL:  # pragma: no branch
-            print(f'  - {output_file_name}')
+        return self._write_output_file(
+            output_file_name,
+            processed_content,
+        )
+
+    def _save_tagged_file(
+        self,
+        output_file_name,
+        content,
+    ):
+        self._saved_tagged_files += self._write_output_file(
+            output_file_name.strip(),
+            content,
+        )
+
+    def _write_output_file(
+        self,
+        output_file_name,
+        processed_content,
+    ):
+        self.printer.detail(
+            f'  - {output_file_name}',
+            summary='files',
+            file=output_file_name,
+        )
 
         output_file_path = self.Settings.finalize_path(
             self.settings.output_dir,
             output_file_name,
         )
 
-        self._create_output_directory(
-            output_file_path,
-        )
-
         # use default newline character unless there is an exception (such as
         # for Windows batch files)
         newline = self.newline_exceptions.get(
@@ -858,15 +1913,92 @@ class StempelWerk:
             self.settings.newline,
         )
 
-        # Jinja2 encodes all strings in UTF-8
-        output_file_path.write_text(
+        encoding = self.encoding_exceptions.get(
+            output_file_path.suffix,
+            'utf-8',
+        )
+
+        output_data = self.encode_content(
             processed_content,
-            encoding='utf-8',
-            newline=newline,
+            newline,
+            encoding,
+        )
+
+        self.written_bytes += len(output_data)
+
+        if self.output_archive is not None:
+            self._save_to_archive(
+                output_file_path,
+                output_data,
+            )
+            return 1
+
+        self._create_output_directory(
+            output_file_path,
         )
 
+        if self.output_store is not None:
+            self.output_store.write(
+                output_file_path,
+                output_data,
+            )
+            return 1
+
+        import contextlib
+
+        # output files that were linked to the output store in an earlier run
+        # share their data with other output files
+        with contextlib.suppress(FileNotFoundError):
+            if output_file_path.stat().st_nlink > 1:
+                output_file_path.unlink()
+
+        # write all data at once
+        output_file_path.write_bytes(output_data)
+
         return 1
 
+    @staticmethod
+    def encode_content(
+        content,
+        newline,
+        encoding='utf-8',
+    ):
+        # behave like text mode of "open()", but skip the overhead of text
+        # wrappers, which translate and encode in small chunks
+        if newline is None:
+            newline = os.linesep
+
+        if newline in ('', '\n'):
+            return content.encode(encoding)
+
+        # translating encoded data is considerably faster, but only safe for
+        # encodings that leave ASCII characters as they are
+        if encoding == 'utf-8':
+            return content.encode(encoding).replace(b'\n', newline.encode())
+
+        return content.replace('\n', newline).encode(encoding)
+
+    def _save_to_archive(
+        self,
+        output_file_path,
+        output_data,
+    ):
+        # paths in archive are relative to the output directory
+        try:
+            relative_output_path = output_file_path.relative_to(
+                self.settings.output_dir
+            )
+        except ValueError as err:
+            raise OutputError(
+                f'file "{output_file_path}" is located outside\n'
+                'of output directory and cannot be archived.'
+            ) from err
+
+        self.output_archive.write(
+            relative_output_path.as_posix(),
+            output_data,
+        )
+
     def _process_raw_content(
         self,
         raw_content,
@@ -880,14 +2012,10 @@ class StempelWerk:
 
         # catch problems with file separation markers early
         if new_file_markers != 0 or content_markers != 1:
-            self.printer.error(
-                'there was a problem with splitting the output into files,'
-            )
-            self.printer.error(
+            raise OutputError(
+                'there was a problem with splitting the output into files,\n'
                 'check "marker_new_file", "marker_content" and your templates.'
             )
-            self.printer.error()
-            exit(1)
 
         # extract name and content of output file
         output_file_name, processed_content = raw_content.split(
@@ -912,41 +2040,96 @@ class StempelWerk:
         if self.settings.create_directories:
             output_directory.mkdir(parents=True)
 
-            if self.verbosity >= self.VERBOSITY_NORMAL:  # pragma: no branch
-                print(f'  - created directory "{output_directory}"')
+            self.printer.detail(f'  - created directory "{output_directory}"')
         else:
-            self.printer.error(f'directory "{output_directory}"')
-            self.printer.error('does not exist.')
-            self.printer.error()
-            exit(1)
+            raise MissingDirectoryError(
+                f'directory "{output_directory}"\ndoes not exist.'
+            )
+
+    def _is_tracking_needed(
+        self,
+        process_only_modified,
+        changed_since,
+        keep_going,
+    ):
+        # tracking accessed global variables slows down rendering, so it is
+        # only done when partial runs may use the results
+        if self.settings.track_globals or self.globals_tracker.has_state():
+            return True
+
+        if process_only_modified or changed_since is not None:
+            return True
+
+        # failed templates are rendered again in the next partial run
+        return bool(
+            keep_going
+            or self.settings.template_time_limit_seconds
+            or self.settings.template_memory_limit_megabytes
+        )
 
     def render_all_templates(
         self,
         process_only_modified=False,
         custom_global_namespace=None,
+        changed_since=None,
+        show_progress=False,
+        check_syntax=False,
+        keep_going=False,
+        coordinator_address=None,
+        local_workers=0,
     ):
         start_of_processing = datetime.datetime.now()
 
-        template_filenames = self._find_templates(process_only_modified)
+        self.globals_tracker.is_enabled = self._is_tracking_needed(
+            process_only_modified,
+            changed_since,
+            keep_going,
+        )
 
-        processed_templates = 0
-        saved_files = 0
+        # prepare global variables once, they are needed to find templates
+        # that depend on modified global variables
+        global_namespace = self._prepare_global_namespace(
+            custom_global_namespace
+        )
 
-        for template_filename in template_filenames:
-            # "run_results" contains number of processed and saved files
-            run_results = self.render_template(
-                template_filename,
-                custom_global_namespace,
+        template_filenames = self._find_templates(
+            process_only_modified,
+            changed_since,
+        )
+
+        # report all syntax errors before anything is rendered
+        if check_syntax and template_filenames:
+            self.check_syntax(self._all_template_names)
+
+        self.budget_overruns = []
+        self.failed_templates = []
+        self.keep_going = keep_going
+        self.coordinator_address = coordinator_address
+        self.local_workers = local_workers
+        self.render_workers = {}
+        self.written_bytes = 0
+
+        # embedding applications carry on after errors, so threads, worker
+        # processes, and open files must not outlive a failed run
+        is_finished = False
+
+        try:
+            self._open_output_store()
+            self._start_memory_tracking()
+            self._start_profiling()
+            self._start_progress_reporter(template_filenames, show_progress)
+
+            processed_templates, saved_files = self._process_templates(
+                template_filenames,
+                global_namespace,
             )
 
-            processed_templates += run_results['processed_templates']
-            saved_files += run_results['saved_files']
+            is_finished = True
+        finally:
+            self._finish_run(is_finished)
 
-            if self.verbosity < self.VERBOSITY_LOW:  # pragma: no coverage
-                self._show_progress(
-                    processed_templates,
-                    is_finished=False,
-                )
+        # partial runs need dependencies, even when nothing was rendered
+        self.globals_tracker.store_state(self._all_template_names)
 
         # only save time of current run and show statistics when files have
         # actually been processed
@@ -958,11 +2141,477 @@ class StempelWerk:
                 saved_files,
             )
 
+        # messages are written in batches
+        self.printer.flush()
+
         return {
             'processed_templates': processed_templates,
             'saved_files': saved_files,
+            'budget_overruns': [
+                {
+                    'template': err.template_name,
+                    'reason': err.reason,
+                    'running_time': err.running_time,
+                }
+                for err in self.budget_overruns
+            ],
+            'failed_templates': self.failed_templates,
+            'peak_memory': self._get_peak_memory(),
         }
 
+    def check_syntax(
+        self,
+        template_names=None,
+    ):
+        from stempelwerk.StempelWerkSyntax import SyntaxChecker
+
+        start_of_check = datetime.datetime.now()
+
+        if template_names is None:
+            template_names = [
+                self._get_template_name(template_path)
+                for template_path in self._find_templates(False)
+            ]
+
+        if not hasattr(self, 'jinja_environment'):
+            self.create_environment()
+
+        # stencils are checked even when no template uses them
+        stencil_names = [
+            stencil_path.as_posix()
+            for stencil_path in self._get_stencils(self._get_templates())
+        ]
+
+        template_names = set(template_names) | set(stencil_names)
+
+        syntax_checker = SyntaxChecker(
+            self.settings,
+            self.jinja_environment,
+        )
+        problems = syntax_checker.check(template_names)
+
+        check_time = datetime.datetime.now() - start_of_check
+        self.printer.debug(
+            f'Checked syntax of {len(template_names)} templates '
+            f'in {check_time}.'
+        )
+        self.printer.debug()
+
+        if problems:
+            raise SyntaxCheckError(problems)
+
+        return len(template_names)
+
+    def _process_templates(
+        self,
+        template_filenames,
+        global_namespace,
+    ):
+        import contextlib
+
+        processed_templates = 0
+        saved_files = 0
+
+        rendered_templates = self._prerender_templates(
+            template_filenames,
+            global_namespace,
+        )
+
+        # the Jinja environment is created when the first template is
+        # rendered, so runs without modified templates never import Jinja
+        with contextlib.closing(rendered_templates):
+            for template_filename in rendered_templates:
+                # "run_results" contains number of processed and saved files
+                run_results = self._process_template_with_progress(
+                    template_filename,
+                    global_namespace,
+                )
+
+                processed_templates += run_results['processed_templates']
+                saved_files += run_results['saved_files']
+
+                if self._shows_progress_dots():  # pragma: no coverage
+                    self._show_progress(
+                        processed_templates,
+                        is_finished=False,
+                    )
+
+        return processed_templates, saved_files
+
+    def _uses_async_rendering(
+        self,
+    ):
+        # templates with a budget are rendered in a separate process
+        return (
+            self.settings.async_rendering
+            and not self._uses_supervised_renderer()
+        )
+
+    def _uses_coordinator(
+        self,
+    ):
+        # templates with a budget are rendered in a separate process
+        return (
+            bool(self.coordinator_address)
+            and not self._uses_supervised_renderer()
+        )
+
+    def _prerender_templates(
+        self,
+        template_filenames,
+        global_namespace,
+    ):
+        if template_filenames and self._uses_coordinator():
+            yield from self._prerender_coordinated(template_filenames)
+            return
+
+        if not template_filenames or not self._uses_async_rendering():
+            yield from template_filenames
+            return
+
+        from stempelwerk.StempelWerkAsync import AsyncRenderer
+
+        if not hasattr(self, 'jinja_environment'):
+            self.create_environment()
+
+        async_renderer = AsyncRenderer(
+            self.jinja_environment,
+            self.globals_tracker.recorder,
+            global_namespace,
+            self.settings.async_rendering_tasks,
+        )
+
+        render_results = async_renderer.render_all(
+            self._get_template_name(template_filename)
+            for template_filename in template_filenames
+        )
+
+        try:
+            yield from self._hand_over_results(
+                template_filenames,
+                render_results,
+            )
+        finally:
+            async_renderer.close()
+
+    def _prerender_coordinated(
+        self,
+        template_filenames,
+    ):
+        from stempelwerk.StempelWerkCoordinator import RenderCoordinator
+
+        try:
+            coordinator = RenderCoordinator(
+                self.coordinator_address,
+                self.settings,
+                # debug output has already been printed by this process
+                min(self.verbosity, self.VERBOSITY_NORMAL),
+                self.local_workers,
+            )
+        except OSError as err:
+            raise CoordinatorError(
+                f'cannot listen for render workers on '
+                f'"{self.coordinator_address}":\n{err}'
+            ) from err
+
+        render_results = coordinator.render_all(
+            self._get_template_name(template_filename)
+            for template_filename in template_filenames
+        )
+
+        try:
+            yield from self._hand_over_results(
+                template_filenames,
+                render_results,
+            )
+        finally:
+            coordinator.close()
+            self.render_workers = dict(coordinator.rendered_templates)
+
+    def _hand_over_results(
+        self,
+        template_filenames,
+        render_results,
+    ):
+        # templates are rendered ahead and processed in order; results are
+        # picked up by "_render_jinja_template()"
+        try:
+            for template_filename, render_result in zip(
+                template_filenames,
+                render_results,
+                strict=True,
+            ):
+                self._prerendered_result = render_result
+                yield template_filename
+
+        finally:
+            self._prerendered_result = None
+            render_results.close()
+
+    def _process_template_with_progress(
+        self,
+        template_path,
+        global_namespace,
+    ):
+        if self.progress_reporter is None:
+            return self._process_template_within_budget(
+                template_path,
+                global_namespace,
+            )
+
+        written_bytes = self.written_bytes
+        self.progress_reporter.start_template()
+
+        run_results = self._process_template_within_budget(
+            template_path,
+            global_namespace,
+        )
+
+        self.progress_reporter.finish_template(
+            self._get_template_name(template_path),
+            run_results['saved_files'],
+            self.written_bytes - written_bytes,
+        )
+
+        return run_results
+
+    def _process_template_within_budget(
+        self,
+        template_path,
+        global_namespace,
+    ):
+        try:
+            return self._process_template(
+                template_path,
+                global_namespace,
+            )
+        except TemplateBudgetExceeded as err:
+            self.printer.error(f'{err}')
+            self.printer.error()
+
+            # render template again in the next partial run
+            self.globals_tracker.forget(err.template_name)
+            self.budget_overruns.append(err)
+
+            # carry on with the remaining templates
+            return {
+                'processed_templates': 0,
+                'saved_files': 0,
+            }
+        except Exception as err:
+            if not self.keep_going:
+                raise
+
+            return self._record_failed_template(template_path, err)
+
+    def _record_failed_template(
+        self,
+        template_path,
+        err,
+    ):
+        template_name = self._get_template_name(template_path)
+
+        # render template again in the next partial run, even if it has not
+        # been modified
+        self.globals_tracker.forget(template_name)
+
+        self.failed_templates.append(
+            {
+                'template': template_name,
+                'location': self._find_error_location(err, template_name),
+                'error': f'{type(err).__name__}: '
+                f'{getattr(err, "message", None) or err}',
+            }
+        )
+
+        # carry on with the remaining templates
+        return {
+            'processed_templates': 0,
+            'saved_files': 0,
+        }
+
+    def _find_error_location(
+        self,
+        err,
+        template_name,
+    ):
+        import traceback
+
+        template_dir = self.settings.template_dir.resolve()
+
+        # Jinja rewrites tracebacks to point at templates; the innermost
+        # frame may be located in a stencil
+        for frame in reversed(traceback.extract_tb(err.__traceback__)):
+            frame_path = pathlib.Path(frame.filename).resolve()
+
+            if frame_path.is_relative_to(template_dir):
+                frame_name = frame_path.relative_to(template_dir).as_posix()
+                return f'{frame_name}:{frame.lineno}'
+
+        # errors raised in render workers have lost their traceback
+        line_number = getattr(err, 'lineno', None)
+        if line_number is not None:
+            return (
+                f'{getattr(err, "name", None) or template_name}:{line_number}'
+            )
+
+        return template_name
+
+    def _start_memory_tracking(
+        self,
+    ):
+        self.memory_tracker = None
+
+        if not self.settings.measure_peak_memory:
+            return
+
+        from stempelwerk.StempelWerkMemory import MEGABYTE, PeakMemoryTracker
+
+        self.memory_tracker = PeakMemoryTracker(
+            self.settings.peak_memory_warning_megabytes * MEGABYTE,
+        )
+        self.memory_tracker.start()
+
+    def _start_profiling(
+        self,
+    ):
+        self.template_profiler = None
+
+        if not self.settings.profile_templates:
+            return
+
+        # only this thread is sampled; the event loop of async rendering runs
+        # here as well, but worker processes cannot be sampled
+        if self._uses_coordinator():
+            self.printer.warning(
+                'Templates rendered by workers cannot be profiled.'
+            )
+            self.printer.warning()
+            return
+
+        from stempelwerk.StempelWerkProfiler import TemplateProfiler
+
+        self.template_profiler = TemplateProfiler()
+        self.template_profiler.start()
+
+    def _finish_profiling(
+        self,
+    ):
+        if self.template_profiler is None:
+            return
+
+        self.template_profiler.stop()
+
+        # folded stacks can be turned into flame graphs
+        self.template_profiler.store_folded_stacks(
+            self.settings.cache_dir / 'template_profile.folded'
+        )
+        self.template_profiler.store_report(
+            self.settings.cache_dir / 'template_profile.txt',
+            self.settings.template_dir,
+        )
+
+    def _start_progress_reporter(
+        self,
+        template_filenames,
+        show_progress,
+    ):
+        self.progress_reporter = None
+
+        if not show_progress or not template_filenames:
+            return
+
+        from stempelwerk.StempelWerkProgress import (
+            ProgressReporter,
+            TemplateTimings,
+        )
+
+        # estimate remaining time from timings of earlier runs
+        timings = TemplateTimings(
+            self.settings.cache_dir / 'template_timings.json',
+        )
+
+        self.progress_reporter = ProgressReporter(
+            self.printer,
+            [
+                self._get_template_name(template_path)
+                for template_path in template_filenames
+            ],
+            timings,
+        )
+
+    def _finish_progress_reporter(
+        self,
+    ):
+        if self.progress_reporter is None:
+            return
+
+        self.progress_reporter.finish()
+        self.progress_reporter.timings.store_state(self._all_template_names)
+
+    def _shows_progress_dots(
+        self,
+    ):
+        # the progress reporter replaces dots
+        return (
+            self.verbosity < self.VERBOSITY_LOW
+            and self.progress_reporter is None
+        )
+
+    def _get_peak_memory(
+        self,
+    ):
+        if self.memory_tracker is None:
+            return {}
+
+        return self.memory_tracker.peak_memory
+
+    def _finish_run(
+        self,
+        is_finished=True,
+    ):
+        self._close_supervised_renderer()
+        self._finish_profiling()
+        self._finish_progress_reporter()
+        self._tear_down_custom_code()
+
+        # provide peak memory in machine-readable form
+        if self.memory_tracker is not None:
+            self.memory_tracker.stop()
+            self.memory_tracker.store(
+                self.settings.cache_dir / 'peak_memory.json'
+            )
+
+        self._close_data_sources()
+
+        # finish archive, so it can be processed further
+        if self.output_archive is not None and is_finished:
+            self.output_archive.close()
+        elif self.output_archive is not None:
+            self.output_archive.discard()
+
+        # a failed run has not used every entry, so keep them all; messages
+        # are shown before the error is reported
+        if not is_finished:
+            self.printer.flush()
+            return
+
+        if self.fragment_cache is not None:
+            self.fragment_cache.prune()
+
+        if self.output_store is not None:
+            self.output_store.prune()
+
+    def _tear_down_custom_code(
+        self,
+    ):
+        for custom_code in self.custom_code:
+            custom_code.teardown()
+
+        # idle resources are created again when they are needed
+        if self.resources is not None:
+            self.resources.close()
+
     def _show_progress(  # pragma: no coverage
         self,
         processed_templates,
@@ -971,14 +2620,14 @@ class StempelWerk:
         if is_finished:
             # finish last line
             remaining_dots = processed_templates % 10
-            print('.' * remaining_dots, end='')
+            self.printer.notice('.' * remaining_dots, end='', cosmetic=True)
 
             if (processed_templates % 40) != 0:
-                print()
+                self.printer.notice()
         elif (processed_templates % 40) == 0:
-            print('..........', end='\n')
+            self.printer.notice('..........', end='\n', cosmetic=True)
         elif (processed_templates % 10) == 0:
-            print('..........', end=' ')
+            self.printer.notice('..........', end=' ', cosmetic=True)
 
     def _get_last_run(
         self,
@@ -1014,35 +2663,416 @@ class StempelWerk:
     ):
         processing_time = datetime.datetime.now() - start_of_processing
 
-        time_per_template = processing_time / processed_templates
-        time_per_file = processing_time / saved_files
+        # templates that exceed their budget are neither processed nor saved
+        time_per_template = processing_time / max(processed_templates, 1)
+        time_per_file = processing_time / max(saved_files, 1)
 
         self.printer.debug(f'Time per template file: {time_per_template}')
         self.printer.debug(f'Time per output file:   {time_per_file}')
         self.printer.debug()
 
-        if self.verbosity < self.VERBOSITY_LOW:  # pragma: no coverage
+        if self.module_load_times:
+            self.printer.debug('Time for loading custom modules:')
+            self.printer.debug(' ')
+
+            for module_name, loading_time in self.module_load_times.items():
+                self.printer.debug(f'  - {module_name}: {loading_time}')
+
+            self.printer.debug()
+
+        self._display_stencil_modules()
+        self._display_render_workers()
+        self._display_output_store()
+        self._display_peak_memory()
+        self._display_hot_lines()
+
+        if self._shows_progress_dots():  # pragma: no coverage
             # finish last line
             self._show_progress(processed_templates, is_finished=True)
 
         if self.verbosity < self.VERBOSITY_NORMAL:  # pragma: no coverage
-            print()
-            print(
-                f'{processed_templates} =>',
-                f'{saved_files} in {processing_time}',
+            self.printer.notice()
+            self.printer.notice(
+                f'{processed_templates} => {saved_files} in {processing_time}'
             )
-            print()
+            self.printer.notice()
         else:
-            print(
-                f'TOTAL: {processed_templates} templates =>',
-                f'{saved_files} files in {processing_time}',
+            self.printer.notice(
+                f'TOTAL: {processed_templates} templates => '
+                f'{saved_files} files in {processing_time}'
+            )
+            self.printer.notice()
+
+        self._display_budget_overruns()
+        self._display_failed_templates()
+
+    def _display_stencil_modules(
+        self,
+    ):
+        if not hasattr(self, 'jinja_environment'):
+            return
+
+        stencil_modules = self.jinja_environment.stencil_modules
+
+        self.printer.debug(
+            f'Imported stencils:      {stencil_modules.misses} evaluated, '
+            f'{stencil_modules.hits} re-used'
+        )
+        self.printer.debug()
+
+    def _display_render_workers(
+        self,
+    ):
+        if not self.render_workers:
+            return
+
+        self.printer.debug('Templates per render worker:')
+        self.printer.debug(' ')
+
+        for worker_name, rendered_templates in sorted(
+            self.render_workers.items()
+        ):
+            self.printer.debug(f'  - {worker_name}: {rendered_templates}')
+
+        self.printer.debug()
+
+    def _display_output_store(
+        self,
+    ):
+        if self.output_store is None:
+            return
+
+        statistics = self.output_store.statistics
+
+        self.printer.debug(
+            f'Output store:           {statistics["stored"]} stored, '
+            f'{statistics["reflink"]} reflinked, '
+            f'{statistics["hardlink"]} hardlinked, '
+            f'{statistics["copy"]} copied, '
+            f'{statistics["unchanged"]} unchanged'
+        )
+        self.printer.debug()
+
+    def _display_peak_memory(
+        self,
+    ):
+        if self.memory_tracker is None:
+            return
+
+        from stempelwerk.StempelWerkMemory import format_megabytes
+
+        self.printer.debug('Peak memory per template (render, split, write):')
+        self.printer.debug(' ')
+
+        for template_name, phases in self.memory_tracker.peak_memory.items():
+            peak_memory = ', '.join(
+                format_megabytes(phase_memory)
+                for phase_memory in phases.values()
+            )
+            self.printer.debug(f'  - {template_name}: {peak_memory}')
+
+        self.printer.debug()
+
+        memory_warnings = self.memory_tracker.get_warnings()
+        if not memory_warnings:
+            return
+
+        for template_name, phase, phase_memory in memory_warnings:
+            self.printer.warning(
+                f'"{template_name}" needed {format_megabytes(phase_memory)} '
+                f'of memory ({phase}).'
+            )
+
+        self.printer.warning()
+
+    def _display_hot_lines(
+        self,
+    ):
+        if self.template_profiler is None:
+            return
+
+        hot_lines = self.template_profiler.get_hot_lines(
+            self.HOT_LINES_SHOWN,
+        )
+
+        if not hot_lines:
+            return
+
+        self.printer.notice('Slowest template lines (total, self):')
+        self.printer.notice(' ')
+
+        for (template_name, line_number), times in hot_lines:
+            total_time, self_time = times
+            self.printer.notice(
+                f'  - {template_name}:{line_number}: '
+                f'{total_time * 1000:.1f} ms, {self_time * 1000:.1f} ms'
+            )
+
+        self.printer.notice()
+
+    def _display_budget_overruns(
+        self,
+    ):
+        if not self.budget_overruns:
+            return
+
+        self.printer.error(
+            f'{len(self.budget_overruns)} templates exceeded their budget:'
+        )
+
+        for err in self.budget_overruns:
+            self.printer.error(f'  - {err}')
+
+        self.printer.error()
+
+    def _display_failed_templates(
+        self,
+    ):
+        if not self.failed_templates:
+            return
+
+        self.printer.error(
+            f'{len(self.failed_templates)} templates could not be rendered:'
+        )
+
+        for failed_template in self.failed_templates:
+            self.printer.error(
+                f'  - {failed_template["template"]} '
+                f'(at {failed_template["location"]}): '
+                f'{failed_template["error"]}'
+            )
+
+        self.printer.error()
+
+    @staticmethod
+    def render_projects(
+        all_settings,
+        verbosity=VERBOSITY_NORMAL,
+        process_only_modified=False,
+        custom_global_namespace=None,
+        changed_since=None,
+        printer=None,
+        show_progress=False,
+        check_syntax=False,
+        keep_going=False,
+        coordinator_address=None,
+        local_workers=0,
+    ):
+        # process several projects in a single process, so they share the
+        # Python interpreter, imported modules, and compiled templates
+        start_of_processing = datetime.datetime.now()
+        project_statistics = []
+
+        # all projects write to the same log
+        if printer is None:
+            printer = StempelWerk.LinePrinter(verbosity)
+
+        for settings in all_settings:
+            start_of_project = datetime.datetime.now()
+
+            if len(all_settings) > 1:
+                printer.detail(
+                    f'PROJECT: {os.path.abspath(settings.root_dir)}',
+                    root_dir=os.path.abspath(settings.root_dir),
+                )
+
+            sw = StempelWerk(
+                settings,
+                verbosity,
+                # display version only once
+                show_version=not project_statistics,
+                printer=printer,
+            )
+
+            run_results = sw.render_all_templates(
+                process_only_modified,
+                custom_global_namespace,
+                changed_since,
+                show_progress,
+                check_syntax,
+                keep_going,
+                coordinator_address,
+                local_workers,
+            )
+
+            run_results['root_dir'] = settings.root_dir
+            run_results['processing_time'] = (
+                datetime.datetime.now() - start_of_project
+            )
+
+            project_statistics.append(run_results)
+
+        total_results = {
+            'processed_templates': sum(
+                run_results['processed_templates']
+                for run_results in project_statistics
+            ),
+            'saved_files': sum(
+                run_results['saved_files']
+                for run_results in project_statistics
+            ),
+            'budget_overruns': [
+                budget_overrun
+                for run_results in project_statistics
+                for budget_overrun in run_results['budget_overruns']
+            ],
+            'failed_templates': [
+                failed_template
+                for run_results in project_statistics
+                for failed_template in run_results['failed_templates']
+            ],
+            'projects': project_statistics,
+        }
+
+        if len(all_settings) > 1:
+            StempelWerk._display_project_statistics(
+                start_of_processing,
+                total_results,
+                printer,
+            )
+
+        printer.flush()
+        return total_results
+
+    @staticmethod
+    def check_projects(
+        all_settings,
+        verbosity=VERBOSITY_NORMAL,
+        printer=None,
+    ):
+        # all projects write to the same log
+        if printer is None:
+            printer = StempelWerk.LinePrinter(verbosity)
+
+        checked_templates = 0
+
+        for settings in all_settings:
+            sw = StempelWerk(
+                settings,
+                verbosity,
+                # display version only once
+                show_version=not checked_templates,
+                printer=printer,
+            )
+
+            checked_templates += sw.check_syntax()
+
+        printer.notice(f'SYNTAX: {checked_templates} templates are fine')
+        printer.notice()
+
+        printer.flush()
+        return checked_templates
+
+    @staticmethod
+    def serve_coordinator(
+        settings,
+        coordinator_address,
+        verbosity=VERBOSITY_NORMAL,
+    ):
+        import multiprocessing
+
+        from stempelwerk.StempelWerkCoordinator import (
+            AUTHKEY_VARIABLE,
+            get_authkey,
+            run_coordinated_worker,
+        )
+
+        # coordinators only accept workers that know their key
+        authkey = get_authkey()
+        if authkey is None:
+            raise CoordinatorError(
+                f'please set "{AUTHKEY_VARIABLE}" to the key of the '
+                'coordinator.'
             )
-            print()
+
+        try:
+            run_coordinated_worker(
+                coordinator_address,
+                authkey,
+                settings,
+                verbosity,
+            )
+        except (OSError, multiprocessing.AuthenticationError) as err:
+            raise CoordinatorError(
+                f'cannot render templates for "{coordinator_address}":\n{err}'
+            ) from err
+
+    @staticmethod
+    def _display_project_statistics(
+        start_of_processing,
+        total_results,
+        printer,
+    ):
+        processing_time = datetime.datetime.now() - start_of_processing
+        project_statistics = total_results['projects']
+
+        printer.detail('PROJECTS:')
+
+        for run_results in project_statistics:
+            printer.detail(
+                f'  - {os.path.abspath(run_results["root_dir"])}: '
+                f'{run_results["processed_templates"]} templates => '
+                f'{run_results["saved_files"]} files in '
+                f'{run_results["processing_time"]}'
+            )
+
+        printer.detail()
+
+        printer.notice(
+            f'ALL PROJECTS: {len(project_statistics)} projects, '
+            f'{total_results["processed_templates"]} templates => '
+            f'{total_results["saved_files"]} files in {processing_time}'
+        )
+        printer.notice()
 
     def _find_templates(
         self,
         process_only_modified,
+        changed_since=None,
     ):
+        start_of_scan = datetime.datetime.now()
+
+        # find matching files in template directory
+        if self.settings.cache_directory_index:
+            template_entries = self._find_templates_with_index()
+        else:
+            template_entries = self._find_templates_with_herkules()
+
+        scan_time = datetime.datetime.now() - start_of_scan
+        self.printer.debug(f'Scanned template directory in {scan_time}.')
+        self.printer.debug()
+
+        # allow forgetting about templates that have been deleted
+        self._all_template_names = [
+            self._get_template_name(template_entry.path)
+            for template_entry in template_entries
+        ]
+
+        if changed_since is not None:
+            return self._find_affected_templates(
+                template_entries,
+                changed_since,
+            )
+
+        modified_since = None
+        if process_only_modified:
+            # get time of last run
+            modified_since = self._get_last_run()
+
+        if modified_since is None:
+            return [template_entry.path for template_entry in template_entries]
+
+        return [
+            template_entry.path
+            for template_entry in template_entries
+            if self._is_template_outdated(template_entry, modified_since)
+        ]
+
+    def _find_templates_with_herkules(
+        self,
+    ):
+        from herkules.Herkules import herkules_with_metadata
+
         herkules_selector = {
             # do not render stencils
             'excluded_directory_names': [
@@ -1052,38 +3082,279 @@ class StempelWerk:
             'included_file_names': self.settings.included_file_names,
         }
 
-        modified_since = None
-        if process_only_modified:
-            # get time of last run
-            modified_since = self._get_last_run()
-
-        # find matching files in template directory
-        template_filenames = herkules(
+        return herkules_with_metadata(
             self.settings.template_dir,
             selector=herkules_selector,
-            modified_since=modified_since,
             relative_to_root=False,
         )
 
-        return template_filenames
+    def _find_templates_with_index(
+        self,
+    ):
+        from stempelwerk.StempelWerkIndex import DirectoryIndex
+
+        self.directory_index = DirectoryIndex(
+            self.settings.template_dir,
+            self.settings.cache_dir / 'directory_index.json',
+        )
+
+        index_entries = self.directory_index.scan()
 
+        listed_directories = self.directory_index.listed_directories
+        cached_directories = self.directory_index.cached_directories
 
-def main_cli():  # pragma: no coverage
-    command_line_arguments = sys.argv
-    parsed_args = StempelWerk.CommandLineParser(command_line_arguments)
+        self.printer.debug(
+            f'Directory index: {listed_directories} listed, '
+            f'{cached_directories} cached directories'
+        )
 
-    sw = StempelWerk(parsed_args.settings, parsed_args.verbosity)
+        # the Jinja environment needs all files, including stencils
+        self._indexed_template_names = [
+            index_entry.name for index_entry in index_entries
+        ]
 
-    # if you want to modify the global namespace programmatically, here is the
-    # right place to do so; this will extend / overwrite the global variables
-    # specified on the command line
-    custom_global_namespace = {}
+        return [
+            index_entry
+            for index_entry in index_entries
+            if self._is_template_selected(index_entry.name)
+        ]
+
+    def _is_template_selected(
+        self,
+        template_name,
+    ):
+        template_path = pathlib.PurePosixPath(template_name)
+
+        # do not render stencils
+        if self.settings.stencil_dir_name in template_path.parts[:-1]:
+            return False
+
+        # include all files if no globs are specified (just like Herkules)
+        included_file_names = self.settings.included_file_names or ['*']
+
+        return any(
+            template_path.match(file_name_pattern)
+            for file_name_pattern in included_file_names
+        )
 
-    sw.render_all_templates(
+    def _find_affected_templates(
+        self,
+        template_entries,
+        changed_since,
+    ):
+        from stempelwerk.StempelWerkGit import get_changed_paths
+
+        try:
+            changed_paths = get_changed_paths(
+                self.settings.template_dir,
+                changed_since,
+            )
+        except RuntimeError as err:
+            raise ChangeDetectionError(
+                f'cannot find changes since "{changed_since}":\n{err}'
+            ) from err
+
+        # custom modules may change the output of any template
+        for module_path in self._get_custom_module_paths():
+            if module_path in changed_paths:
+                self.printer.debug(f'Custom module "{module_path}" changed.')
+                self.printer.debug()
+
+                return [
+                    template_entry.path for template_entry in template_entries
+                ]
+
+        template_dir = self.settings.template_dir.resolve()
+
+        # changed templates and stencils
+        changed_templates = {
+            changed_path.relative_to(template_dir).as_posix()
+            for changed_path in changed_paths
+            if changed_path.is_relative_to(template_dir)
+        }
+
+        return [
+            template_entry.path
+            for template_entry in template_entries
+            if self._is_template_affected(
+                self._get_template_name(template_entry.path),
+                changed_templates,
+            )
+        ]
+
+    def _is_template_affected(
+        self,
+        template_name,
+        changed_templates,
+    ):
+        if template_name in changed_templates:
+            return True
+
+        referenced_templates = self.globals_tracker.get_referenced_templates(
+            template_name
+        )
+
+        # templates that have never been rendered successfully, such as in
+        # fresh clones without cache directory
+        if referenced_templates is None:
+            return self._is_template_affected_statically(
+                template_name,
+                changed_templates,
+            )
+
+        if self._references_changed_templates(
+            referenced_templates,
+            changed_templates,
+        ):
+            return True
+
+        # re-render templates when global variables they access have changed
+        return self.globals_tracker.is_outdated(template_name)
+
+    def _is_template_affected_statically(
+        self,
+        template_name,
+        changed_templates,
+    ):
+        import jinja2
+
+        if not hasattr(self, 'jinja_environment'):
+            self.create_environment()
+
+        # find stencils from the code of the template; broken templates are
+        # rendered, so their errors are shown
+        try:
+            referenced_templates = (
+                self.jinja_environment.find_referenced_templates(template_name)
+            )
+        except jinja2.TemplateError:
+            return True
+
+        return self._references_changed_templates(
+            referenced_templates,
+            changed_templates,
+        )
+
+    @staticmethod
+    def _references_changed_templates(
+        referenced_templates,
+        changed_templates,
+    ):
+        # templates referenced by variables may be any template
+        if changed_templates and DYNAMIC_REFERENCE in referenced_templates:
+            return True
+
+        return not changed_templates.isdisjoint(referenced_templates)
+
+    def _get_template_name(
+        self,
+        template_path,
+    ):
+        relative_template_path = template_path.relative_to(
+            self.settings.template_dir
+        )
+
+        # Jinja2 cannot handle Windows paths
+        return relative_template_path.as_posix()
+
+    def _is_template_outdated(
+        self,
+        template_entry,
+        modified_since,
+    ):
+        if template_entry.mtime >= modified_since:
+            return True
+
+        # re-render templates when global variables they access have changed
+        template_name = self._get_template_name(template_entry.path)
+        return self.globals_tracker.is_outdated(template_name)
+
+
+def _render_from_command_line(  # pragma: no coverage
+    parsed_args,
+    custom_global_namespace,
+):
+    total_results = StempelWerk.render_projects(
+        parsed_args.all_settings,
+        parsed_args.verbosity,
         parsed_args.process_only_modified,
         custom_global_namespace,
+        parsed_args.changed_since,
+        parsed_args.printer,
+        parsed_args.show_progress,
+        parsed_args.check_syntax,
+        parsed_args.keep_going,
+        parsed_args.coordinator_address,
+        parsed_args.local_workers,
     )
 
+    # templates that failed have already been listed
+    if total_results['failed_templates']:
+        raise RenderingError(
+            f'{len(total_results["failed_templates"])} templates '
+            'could not be rendered.'
+        )
+
+    # templates that exceeded their budget have already been listed, so the
+    # first one stands in for all of them
+    if total_results['budget_overruns']:
+        budget_overrun = total_results['budget_overruns'][0]
+
+        raise TemplateBudgetExceeded(
+            budget_overrun['template'],
+            budget_overrun['reason'],
+            budget_overrun['running_time'],
+        )
+
+
+def main_cli():  # pragma: no coverage
+    command_line_arguments = sys.argv
+    printer = None
+
+    try:
+        parsed_args = StempelWerk.CommandLineParser(command_line_arguments)
+        printer = parsed_args.printer
+
+        # if you want to modify the global namespace programmatically, here is
+        # the right place to do so; this will extend / overwrite the global
+        # variables specified on the command line
+        custom_global_namespace = {}
+
+        if parsed_args.worker_address:
+            StempelWerk.serve_coordinator(
+                parsed_args.settings,
+                parsed_args.worker_address,
+                parsed_args.verbosity,
+            )
+        elif parsed_args.syntax_only:
+            StempelWerk.check_projects(
+                parsed_args.all_settings,
+                parsed_args.verbosity,
+                printer,
+            )
+        else:
+            _render_from_command_line(
+                parsed_args,
+                custom_global_namespace,
+            )
+
+    # the library raises errors, the command line turns them into exit codes
+    except StempelWerkError as err:
+        if printer is None:
+            printer = StempelWerk.LinePrinter(StempelWerk.VERBOSITY_NORMAL)
+
+        printer.error()
+        for line in str(err).splitlines():
+            printer.error(line)
+        printer.error()
+
+        sys.exit(err.exit_code)
+
+    # write all pending log messages
+    finally:
+        if printer is not None:
+            printer.close()
+
 
 if __name__ == '__main__':  # pragma: no coverage
     main_cli()
@@ -0,0 +1,155 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+# file suffix => mode for writing a tar stream
+TAR_MODES = {
+    '.tar': 'w|',
+    '.tar.gz': 'w|gz',
+    '.tgz': 'w|gz',
+    '.tar.bz2': 'w|bz2',
+    '.tar.xz': 'w|xz',
+}
+
+# file suffix => compression method of zip archive
+ZIP_COMPRESSIONS = {
+    '.zip': zipfile.ZIP_DEFLATED,
+}
+
+
+class OutputArchive:
+    # Sequential archive containing all output files of a run
+    #
+    # Writing a single archive avoids creating lots of small files, which is
+    # slow on network file systems. The archive is written to a temporary
+    # file and replaces the previous archive when it is closed, so that
+    # readers never see an incomplete archive.
+    def __init__(
+        self,
+        archive_path,
+    ):
+        self.archive_path = archive_path
+        self.archive_format = self.get_archive_format(archive_path)
+
+        self._temporary_path = archive_path.with_name(
+            archive_path.name + '.tmp'
+        )
+        self._archive = None
+
+    @staticmethod
+    def get_archive_format(
+        archive_path,
+    ):
+        archive_name = archive_path.name.lower()
+
+        for suffix in TAR_MODES | ZIP_COMPRESSIONS:
+            if archive_name.endswith(suffix):
+                return suffix
+
+        supported_suffixes = ', '.join(TAR_MODES | ZIP_COMPRESSIONS)
+        raise ValueError(
+            f'unsupported archive "{archive_path.name}" '
+            f'(supported: {supported_suffixes})'
+        )
+
+    def _open(
+        self,
+    ):
+        # archives stay open until "close()" is called
+        if self.archive_format in ZIP_COMPRESSIONS:
+            self._archive = zipfile.ZipFile(
+                self._temporary_path,
+                mode='w',
+                compression=ZIP_COMPRESSIONS[self.archive_format],
+            )
+        else:
+            # stream mode does not accept path objects
+            self._archive = tarfile.open(  # noqa: SIM115
+                str(self._temporary_path),
+                mode=TAR_MODES[self.archive_format],
+            )
+
+    def write(
+        self,
+        member_name,
+        data,
+    ):
+        if self._archive is None:
+            self._open()
+
+        if isinstance(self._archive, zipfile.ZipFile):
+            self._archive.writestr(member_name, data)
+            return
+
+        member_info = tarfile.TarInfo(member_name)
+        member_info.size = len(data)
+        member_info.mtime = int(time.time())
+        member_info.mode = 0o644
+
+        self._archive.addfile(member_info, io.BytesIO(data))
+
+    def close(
+        self,
+    ):
+        if self._archive is None:
+            return
+
+        self._archive.close()
+        self._archive = None
+
+        os.replace(self._temporary_path, self.archive_path)
+
+    def discard(
+        self,
+    ):
+        if self._archive is None:
+            return
+
+        # keep the previous archive when a run has failed
+        self._archive.close()
+        self._archive = None
+
+        self._temporary_path.unlink(missing_ok=True)
@@ -0,0 +1,162 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import asyncio
+import collections
+import contextvars
+
+AsyncRenderResult = collections.namedtuple(
+    'AsyncRenderResult',
+    ['content', 'tagged_files', 'accessed_paths', 'error'],
+)
+
+
+class AsyncRenderer:
+    # Render several templates concurrently on a single event loop
+    #
+    # Filters and global functions of custom modules may be coroutines, such
+    # as for looking up data in databases or files. While one template waits
+    # for a lookup, other templates are rendered. Results are returned in the
+    # order of the templates, so output files and log messages do not depend
+    # on timing.
+    def __init__(
+        self,
+        jinja_environment,
+        recorder,
+        global_namespace,
+        maximum_tasks=8,
+    ):
+        self.jinja_environment = jinja_environment
+        self.recorder = recorder
+        self.global_namespace = global_namespace
+        self.maximum_tasks = max(1, maximum_tasks)
+
+        self._loop = asyncio.new_event_loop()
+
+        # files created with "{% file name %}" are collected for each
+        # template and saved in order
+        self._tagged_files = contextvars.ContextVar('tagged_files')
+        self._original_file_writer = jinja_environment.file_writer
+        jinja_environment.file_writer = self._collect_tagged_file
+
+    def _collect_tagged_file(
+        self,
+        output_file_name,
+        content,
+    ):
+        self._tagged_files.get().append((output_file_name, content))
+
+    async def _render(
+        self,
+        template_name,
+    ):
+        tagged_files = []
+        self._tagged_files.set(tagged_files)
+
+        # errors are raised when the result is used, so they are reported
+        # for the correct template
+        try:
+            jinja_template = self.jinja_environment.get_template(
+                template_name,
+                globals=self.global_namespace,
+            )
+
+            with self.recorder.recording() as accessed_paths:
+                content = await jinja_template.render_async()
+
+        except Exception as err:
+            return AsyncRenderResult(None, tagged_files, set(), err)
+
+        return AsyncRenderResult(content, tagged_files, accessed_paths, None)
+
+    def _schedule(
+        self,
+        pending_tasks,
+        template_names,
+    ):
+        for template_name in template_names:
+            # every task runs in a copy of the current context
+            task = self._loop.create_task(self._render(template_name))
+            pending_tasks.append(task)
+
+            if len(pending_tasks) >= self.maximum_tasks:
+                break
+
+    def render_all(
+        self,
+        template_names,
+    ):
+        template_names = iter(template_names)
+        pending_tasks = collections.deque()
+
+        try:
+            self._schedule(pending_tasks, template_names)
+
+            # running the loop until the oldest task is done also advances
+            # all other tasks
+            while pending_tasks:
+                render_result = self._loop.run_until_complete(
+                    pending_tasks.popleft()
+                )
+
+                self._schedule(pending_tasks, template_names)
+                yield render_result
+
+        finally:
+            self._cancel(pending_tasks)
+
+    def _cancel(
+        self,
+        pending_tasks,
+    ):
+        for task in pending_tasks:
+            task.cancel()
+
+        if pending_tasks:
+            self._loop.run_until_complete(
+                asyncio.gather(*pending_tasks, return_exceptions=True)
+            )
+
+    def close(
+        self,
+    ):
+        self.jinja_environment.file_writer = self._original_file_writer
+        self._loop.close()
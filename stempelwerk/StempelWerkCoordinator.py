@@ -0,0 +1,487 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import contextlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import socket
+import threading
+import time
+
+from stempelwerk.StempelWerkErrors import CoordinatorError
+
+# render workers on other hosts share this key with their coordinator
+AUTHKEY_VARIABLE = 'STEMPELWERK_AUTHKEY'
+
+CoordinatedResult = collections.namedtuple(
+    'CoordinatedResult',
+    [
+        'content',
+        'tagged_files',
+        'accessed_paths',
+        'referenced_templates',
+        'error',
+    ],
+)
+
+
+def parse_address(
+    address,
+):
+    # "host:port" is a TCP address, anything else the path of a Unix socket
+    host, separator, port = address.rpartition(':')
+
+    if separator and port.isdigit() and '/' not in address:
+        return (host or '127.0.0.1', int(port)), 'AF_INET'
+
+    return address, 'AF_UNIX'
+
+
+def format_address(
+    address,
+):
+    if isinstance(address, tuple):
+        host, port = address
+        return f'{host}:{port}'
+
+    return address
+
+
+def get_authkey():
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+
+    if not authkey:
+        return None
+
+    return authkey.encode('utf-8')
+
+
+class RenderCoordinator:
+    # Hand out templates to render workers whenever they ask for work
+    #
+    # Templates take very different times to render, so splitting them up
+    # in advance balances poorly. Render workers on this host or on other
+    # hosts with the same checkout connect to the coordinator and ask for
+    # the next template as soon as they are done; fast workers simply render
+    # more templates. Results are returned in the order of the templates, so
+    # output files are saved just like in a regular run.
+    MAXIMUM_ATTEMPTS = 2
+    WORKER_TIMEOUT = 60.0
+    ITEM_TIMEOUT = 600.0
+    BACKLOG = 64
+
+    def __init__(
+        self,
+        address,
+        settings,
+        verbosity,
+        local_workers=0,
+        authkey=None,
+    ):
+        self.settings = settings
+        self.verbosity = verbosity
+
+        # without a shared key, only local workers can connect
+        self.authkey = authkey or get_authkey() or os.urandom(32)
+
+        # clients are authenticated by the thread serving them, so a client
+        # that stalls during the handshake cannot block other workers
+        listener_address, self._family = parse_address(address)
+        self._listener = multiprocessing.connection.Listener(
+            listener_address,
+            self._family,
+            backlog=self.BACKLOG,
+        )
+
+        # port may have been chosen by the operating system
+        self.address = format_address(self._listener.address)
+
+        # worker name => number of rendered templates
+        self.rendered_templates = collections.Counter()
+
+        # (index, template name, attempts)
+        self._work_items = queue.Queue()
+        self._results = {}
+        self._remaining_templates = None
+        self._connected_workers = 0
+        self._worker_error = None
+        self._condition = threading.Condition()
+        self._is_closing = threading.Event()
+
+        self._worker_threads = []
+        self._acceptor = threading.Thread(
+            target=self._accept_workers,
+            name='StempelWerk coordinator',
+            daemon=True,
+        )
+        self._acceptor.start()
+
+        self._local_workers = [
+            self._start_local_worker() for _ in range(local_workers)
+        ]
+
+    def _start_local_worker(
+        self,
+    ):
+        # "spawn" works on all platforms and does not copy the state of
+        # threads, open files, or archives of this process
+        context = multiprocessing.get_context('spawn')
+
+        process = context.Process(
+            target=run_coordinated_worker,
+            args=(
+                self.address,
+                self.authkey,
+                self.settings,
+                self.verbosity,
+            ),
+            daemon=True,
+        )
+        process.start()
+
+        return process
+
+    def _accept_workers(
+        self,
+    ):
+        while not self._is_closing.is_set():
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                continue
+
+            # woken up by "close()"
+            if self._is_closing.is_set():
+                connection.close()
+                break
+
+            worker_thread = threading.Thread(
+                target=self._serve_worker,
+                args=(connection,),
+                name='StempelWerk coordinator connection',
+                daemon=True,
+            )
+            worker_thread.start()
+
+            self._worker_threads.append(worker_thread)
+
+    def _authenticate_worker(
+        self,
+        connection,
+    ):
+        # same handshake as "Listener.accept()" with a key
+        multiprocessing.connection.deliver_challenge(connection, self.authkey)
+        multiprocessing.connection.answer_challenge(connection, self.authkey)
+
+    def _set_up_worker(
+        self,
+        connection,
+    ):
+        self._authenticate_worker(connection)
+        worker_name = connection.recv()
+
+        # global variables have been prepared by the coordinator
+        connection.send(self.settings.global_namespace)
+
+        # wait until templates and custom modules have been loaded
+        status, payload = connection.recv()
+
+        if status == 'error':
+            with self._condition:
+                self._worker_error = payload
+                self._condition.notify_all()
+
+            return None
+
+        return worker_name
+
+    def _serve_worker(
+        self,
+        connection,
+    ):
+        with connection:
+            try:
+                worker_name = self._set_up_worker(connection)
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                # clients with the wrong key are turned away
+                return
+
+            if worker_name is None:
+                return
+
+            with self._condition:
+                self._connected_workers += 1
+
+            try:
+                self._serve_templates(connection, worker_name)
+            finally:
+                with self._condition:
+                    self._connected_workers -= 1
+                    self._condition.notify_all()
+
+    def _serve_templates(
+        self,
+        connection,
+        worker_name,
+    ):
+        while True:
+            work_item = self._take_work_item()
+
+            # all templates have been rendered
+            if work_item is None:
+                with contextlib.suppress(OSError):
+                    connection.send(None)
+
+                return
+
+            index, template_name, attempts = work_item
+
+            try:
+                connection.send(template_name)
+
+                # workers that hang are dropped like workers that died
+                if not connection.poll(self.ITEM_TIMEOUT):
+                    raise TimeoutError(template_name)
+
+                status, payload = connection.recv()
+            except (OSError, EOFError):
+                # another worker renders the template
+                self._return_work_item(index, template_name, attempts + 1)
+                return
+
+            self._store_result(index, worker_name, status, payload)
+
+    def _take_work_item(
+        self,
+    ):
+        while not self._is_closing.is_set():
+            try:
+                return self._work_items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+            # templates of workers that died are handed out again, so wait
+            # until all templates have been rendered
+            if self._remaining_templates == 0:
+                break
+
+        return None
+
+    def _return_work_item(
+        self,
+        index,
+        template_name,
+        attempts,
+    ):
+        if attempts < self.MAXIMUM_ATTEMPTS:
+            self._work_items.put((index, template_name, attempts))
+            return
+
+        # do not let a single template kill all workers
+        self._store_result(
+            index,
+            None,
+            'error',
+            CoordinatorError(
+                f'render workers died or timed out {attempts} times while '
+                f'rendering\n"{template_name}".'
+            ),
+        )
+
+    def _store_result(
+        self,
+        index,
+        worker_name,
+        status,
+        payload,
+    ):
+        if status == 'done':
+            render_result = CoordinatedResult(
+                payload.content,
+                payload.tagged_files,
+                payload.accessed_paths,
+                payload.referenced_templates,
+                None,
+            )
+        else:
+            render_result = CoordinatedResult(None, [], set(), [], payload)
+
+        with self._condition:
+            self._results[index] = render_result
+            self._remaining_templates -= 1
+
+            if worker_name is not None:
+                self.rendered_templates[worker_name] += 1
+
+            self._condition.notify_all()
+
+    def _check_workers(
+        self,
+        last_seen_worker,
+    ):
+        # called with the condition held
+        if self._worker_error is not None:
+            raise self._worker_error
+
+        now = time.monotonic()
+
+        if not self._connected_workers:
+            if now - last_seen_worker > self.WORKER_TIMEOUT:
+                raise CoordinatorError(
+                    'no render worker has connected to '
+                    f'"{self.address}"\n'
+                    f'within {self.WORKER_TIMEOUT} seconds.'
+                )
+
+            return last_seen_worker
+
+        return now
+
+    def _wait_for_result(
+        self,
+        index,
+    ):
+        last_seen_worker = time.monotonic()
+
+        with self._condition:
+            while index not in self._results:
+                last_seen_worker = self._check_workers(last_seen_worker)
+                self._condition.wait(timeout=1.0)
+
+            return self._results.pop(index)
+
+    def render_all(
+        self,
+        template_names,
+    ):
+        template_names = list(template_names)
+
+        with self._condition:
+            self._remaining_templates = len(template_names)
+
+        for index, template_name in enumerate(template_names):
+            self._work_items.put((index, template_name, 0))
+
+        for index in range(len(template_names)):
+            yield self._wait_for_result(index)
+
+    def close(
+        self,
+    ):
+        self._is_closing.set()
+
+        # blocking calls to "accept()" are not interrupted by closing the
+        # listener, so connect once more
+        with contextlib.suppress(OSError):
+            multiprocessing.connection.Client(
+                self._listener.address,
+                self._family,
+            ).close()
+
+        self._acceptor.join(timeout=5)
+        self._listener.close()
+
+        # workers are told to finish once they ask for work; clients that
+        # stall during the handshake are not waited for
+        deadline = time.monotonic() + 5
+
+        for worker_thread in self._worker_threads:
+            worker_thread.join(timeout=max(deadline - time.monotonic(), 0))
+
+        for process in self._local_workers:
+            process.join(timeout=5)
+
+            if process.is_alive():  # pragma: no coverage
+                process.kill()
+                process.join()
+
+
+def connect_to_coordinator(
+    address,
+    authkey,
+    timeout=30.0,
+):
+    listener_address, family = parse_address(address)
+    deadline = time.monotonic() + timeout
+
+    # workers may be started before their coordinator
+    while True:
+        try:
+            return multiprocessing.connection.Client(
+                listener_address,
+                family,
+                authkey=authkey,
+            )
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+
+            time.sleep(0.2)
+
+
+def run_coordinated_worker(
+    address,
+    authkey,
+    settings,
+    verbosity,
+):
+    from stempelwerk.StempelWerkWorker import run_worker
+
+    connection = connect_to_coordinator(address, authkey)
+
+    with connection:
+        connection.send(f'{socket.gethostname()}:{os.getpid()}')
+
+        try:
+            settings.global_namespace = connection.recv()
+        except EOFError:  # pragma: no coverage
+            return
+
+        # render templates until the coordinator has run out of them
+        run_worker(
+            connection,
+            settings,
+            verbosity,
+            memory_limit=0,
+        )
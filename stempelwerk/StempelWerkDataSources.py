@@ -0,0 +1,615 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import abc
+import collections.abc
+import csv
+import pathlib
+
+from stempelwerk.StempelWerkResources import ConnectionPool
+
+
+def _quote_identifier(
+    identifier,
+):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+# ----------------------------------------------------------------------------
+
+
+class DataSource:
+    def __init__(
+        self,
+        path,
+    ):
+        self.path = pathlib.Path(path)
+
+    def _get_files(
+        self,
+    ):
+        return [self.path]
+
+    def fingerprint(
+        self,
+    ):
+        # used to find templates that depend on modified data sources
+        fingerprint = []
+
+        for file_path in self._get_files():
+            file_stats = file_path.stat()
+            fingerprint.append(
+                [str(file_path), file_stats.st_size, file_stats.st_mtime_ns]
+            )
+
+        return fingerprint
+
+    def close(
+        self,
+    ):
+        pass
+
+    # data sources are read-only, so there is no need to copy them (settings
+    # are deep-copied for custom modules)
+    def __copy__(
+        self,
+    ):
+        return self
+
+    def __deepcopy__(
+        self,
+        memo,
+    ):
+        return self
+
+
+class LazyTable(abc.ABC):
+    # Read-only collection of rows that are fetched on access
+    #
+    # Iterate over a table to get all rows, use "table[key]" to look up a
+    # single row by its key column and "table.where(column=value)" to filter
+    # rows.
+    @abc.abstractmethod
+    def __iter__(
+        self,
+    ):
+        pass
+
+    @abc.abstractmethod
+    def lookup(
+        self,
+        key,
+    ):
+        pass
+
+    @abc.abstractmethod
+    def where(
+        self,
+        **conditions,
+    ):
+        pass
+
+    def __getitem__(
+        self,
+        key,
+    ):
+        row = self.lookup(key)
+
+        if row is None:
+            raise KeyError(key)
+
+        return row
+
+    def get(
+        self,
+        key,
+        default=None,
+    ):
+        row = self.lookup(key)
+
+        if row is None:
+            return default
+
+        return row
+
+
+# ----------------------------------------------------------------------------
+
+
+class SqliteTable(LazyTable):
+    FETCH_SIZE = 1000
+
+    def __init__(
+        self,
+        database,
+        table_name,
+        key_column=None,
+    ):
+        self.database = database
+        self.table_name = table_name
+
+        self._key_column = key_column
+        self._column_names = None
+
+    def __repr__(
+        self,
+    ):
+        return f'<SqliteTable {self.table_name!r}>'
+
+    def _query(
+        self,
+        sql_suffix,
+        parameters=(),
+    ):
+        sql = f'SELECT * FROM {_quote_identifier(self.table_name)} '
+        sql += sql_suffix
+
+        # rows are streamed, so the connection is only returned to the pool
+        # when all rows have been read or the generator is closed (loops
+        # that stop early drop the generator, which closes it)
+        with self.database.pool.connection() as connection:
+            cursor = connection.execute(sql, parameters)
+            column_names = [column[0] for column in cursor.description]
+
+            try:
+                while rows := cursor.fetchmany(self.FETCH_SIZE):
+                    for row in rows:
+                        yield dict(zip(column_names, row, strict=True))
+            finally:
+                cursor.close()
+
+    def _fetch_scalar(
+        self,
+        sql,
+    ):
+        with self.database.pool.connection() as connection:
+            return connection.execute(sql).fetchone()
+
+    @property
+    def column_names(
+        self,
+    ):
+        if self._column_names is None:
+            table_name = _quote_identifier(self.table_name)
+
+            with self.database.pool.connection() as connection:
+                table_info = connection.execute(
+                    f'PRAGMA table_info({table_name})'
+                ).fetchall()
+
+            self._column_names = [column[1] for column in table_info]
+
+            # use single-column primary key as key column
+            primary_key = [column[1] for column in table_info if column[5]]
+            if self._key_column is None and len(primary_key) == 1:
+                self._key_column = primary_key[0]
+
+        return self._column_names
+
+    @property
+    def key_column(
+        self,
+    ):
+        # reading column names also determines the primary key
+        column_names = self.column_names
+
+        if self._key_column is None:
+            return 'rowid'
+
+        if self._key_column not in column_names:
+            raise KeyError(f'unknown column "{self._key_column}"')
+
+        return self._key_column
+
+    def __iter__(
+        self,
+    ):
+        return self._query('')
+
+    def __len__(
+        self,
+    ):
+        table_name = _quote_identifier(self.table_name)
+        return self._fetch_scalar(f'SELECT COUNT(*) FROM {table_name}')[0]
+
+    def __bool__(
+        self,
+    ):
+        table_name = _quote_identifier(self.table_name)
+        row = self._fetch_scalar(f'SELECT 1 FROM {table_name} LIMIT 1')
+
+        return row is not None
+
+    def lookup(
+        self,
+        key,
+    ):
+        key_column = _quote_identifier(self.key_column)
+        rows = self._query(f'WHERE {key_column} = ? LIMIT 1', (key,))
+
+        # return connection to pool right away
+        try:
+            return next(rows, None)
+        finally:
+            rows.close()
+
+    def where(
+        self,
+        **conditions,
+    ):
+        # only allow known column names, which are then quoted
+        for column_name in conditions:
+            if column_name not in self.column_names:
+                raise KeyError(f'unknown column "{column_name}"')
+
+        sql_conditions = ' AND '.join(
+            f'{_quote_identifier(column_name)} = ?'
+            for column_name in conditions
+        )
+
+        return self._query(
+            f'WHERE {sql_conditions}' if conditions else '',
+            tuple(conditions.values()),
+        )
+
+
+class SqliteDataSource(DataSource, collections.abc.Mapping):
+    # SQLite database; tables and views are accessed by name
+    def __init__(
+        self,
+        path,
+        key_columns=None,
+    ):
+        super().__init__(path)
+
+        self.key_columns = key_columns or {}
+        self.pool = ConnectionPool(self.path)
+
+        self._table_names = None
+        self._tables = {}
+
+    def __repr__(
+        self,
+    ):
+        return f'<SqliteDataSource {str(self.path)!r}>'
+
+    def _get_files(
+        self,
+    ):
+        # changes may still be stored in the write-ahead log
+        wal_path = self.path.with_name(self.path.name + '-wal')
+
+        if wal_path.is_file():
+            return [self.path, wal_path]
+
+        return [self.path]
+
+    @property
+    def table_names(
+        self,
+    ):
+        if self._table_names is None:
+            with self.pool.connection() as connection:
+                rows = connection.execute(
+                    'SELECT name FROM sqlite_master '
+                    + "WHERE type IN ('table', 'view') ORDER BY name"
+                ).fetchall()
+
+            self._table_names = [row[0] for row in rows]
+
+        return self._table_names
+
+    def __getitem__(
+        self,
+        table_name,
+    ):
+        if table_name not in self._tables:
+            if table_name not in self.table_names:
+                raise KeyError(table_name)
+
+            self._tables[table_name] = SqliteTable(
+                self,
+                table_name,
+                self.key_columns.get(table_name),
+            )
+
+        return self._tables[table_name]
+
+    def __iter__(
+        self,
+    ):
+        return iter(self.table_names)
+
+    def __len__(
+        self,
+    ):
+        return len(self.table_names)
+
+    def close(
+        self,
+    ):
+        self.pool.close()
+
+    # connections cannot be passed to other processes
+    def __getstate__(
+        self,
+    ):
+        return {
+            'path': self.path,
+            'key_columns': self.key_columns,
+        }
+
+    def __setstate__(
+        self,
+        state,
+    ):
+        self.__init__(**state)
+
+
+# ----------------------------------------------------------------------------
+
+
+class CsvTable(DataSource, LazyTable):
+    # CSV file with a header row; the file is read when the table is first
+    # accessed, and indices are created when they are first needed
+    def __init__(
+        self,
+        path,
+        key_column=None,
+        encoding='utf-8',
+        delimiter=',',
+    ):
+        super().__init__(path)
+
+        self.key_column = key_column
+        self.encoding = encoding
+        self.delimiter = delimiter
+
+        self._rows = None
+        self._indices = {}
+
+    def __repr__(
+        self,
+    ):
+        return f'<CsvTable {str(self.path)!r}>'
+
+    @property
+    def rows(
+        self,
+    ):
+        if self._rows is None:
+            with self.path.open(encoding=self.encoding, newline='') as file:
+                reader = csv.DictReader(file, delimiter=self.delimiter)
+                self._rows = list(reader)
+
+        return self._rows
+
+    def _get_index(
+        self,
+        column_name,
+    ):
+        if column_name not in self._indices:
+            index = {}
+
+            for row in self.rows:
+                if column_name not in row:
+                    raise KeyError(f'unknown column "{column_name}"')
+
+                index.setdefault(row[column_name], []).append(row)
+
+            self._indices[column_name] = index
+
+        return self._indices[column_name]
+
+    def __iter__(
+        self,
+    ):
+        return iter(self.rows)
+
+    def __len__(
+        self,
+    ):
+        return len(self.rows)
+
+    def lookup(
+        self,
+        key,
+    ):
+        if self.key_column is None:
+            raise KeyError('CSV table has no "key" column')
+
+        # CSV files only contain strings
+        matching_rows = self._get_index(self.key_column).get(str(key))
+
+        return matching_rows[0] if matching_rows else None
+
+    def where(
+        self,
+        **conditions,
+    ):
+        if not conditions:
+            return iter(self.rows)
+
+        # CSV files only contain strings
+        conditions = {
+            column_name: str(value)
+            for column_name, value in conditions.items()
+        }
+
+        # narrow down rows using the index of the first column
+        index_column, index_value = next(iter(conditions.items()))
+        matching_rows = self._get_index(index_column).get(index_value, [])
+
+        return (
+            row
+            for row in matching_rows
+            if all(row.get(key) == value for key, value in conditions.items())
+        )
+
+    def __getstate__(
+        self,
+    ):
+        return {
+            'path': self.path,
+            'key_column': self.key_column,
+            'encoding': self.encoding,
+            'delimiter': self.delimiter,
+        }
+
+    def __setstate__(
+        self,
+        state,
+    ):
+        self.__init__(**state)
+
+
+class CsvDirectoryDataSource(DataSource, collections.abc.Mapping):
+    # directory of CSV files; each file is accessed by its name without suffix
+    def __init__(
+        self,
+        path,
+        key_columns=None,
+        encoding='utf-8',
+        delimiter=',',
+    ):
+        super().__init__(path)
+
+        self.key_columns = key_columns or {}
+        self.encoding = encoding
+        self.delimiter = delimiter
+
+        self._tables = {
+            file_path.stem: CsvTable(
+                file_path,
+                self.key_columns.get(file_path.stem),
+                encoding,
+                delimiter,
+            )
+            for file_path in sorted(self.path.glob('*.csv'))
+        }
+
+    def __repr__(
+        self,
+    ):
+        return f'<CsvDirectoryDataSource {str(self.path)!r}>'
+
+    def _get_files(
+        self,
+    ):
+        return [table.path for table in self._tables.values()]
+
+    def __getitem__(
+        self,
+        table_name,
+    ):
+        return self._tables[table_name]
+
+    def __iter__(
+        self,
+    ):
+        return iter(self._tables)
+
+    def __len__(
+        self,
+    ):
+        return len(self._tables)
+
+    def __getstate__(
+        self,
+    ):
+        return {
+            'path': self.path,
+            'key_columns': self.key_columns,
+            'encoding': self.encoding,
+            'delimiter': self.delimiter,
+        }
+
+    def __setstate__(
+        self,
+        state,
+    ):
+        self.__init__(**state)
+
+
+# ----------------------------------------------------------------------------
+
+
+def open_data_source(
+    root_dir,
+    source_settings,
+):
+    source_settings = dict(source_settings)
+
+    source_type = source_settings.pop('type', None)
+    source_path = pathlib.Path(root_dir) / source_settings.pop('path')
+
+    if source_type == 'sqlite':
+        if not source_path.is_file():
+            raise FileNotFoundError(source_path)
+
+        return SqliteDataSource(
+            source_path,
+            key_columns=source_settings.get('keys'),
+        )
+
+    if source_type == 'csv':
+        csv_options = {
+            'encoding': source_settings.get('encoding', 'utf-8'),
+            'delimiter': source_settings.get('delimiter', ','),
+        }
+
+        if source_path.is_dir():
+            return CsvDirectoryDataSource(
+                source_path,
+                key_columns=source_settings.get('keys'),
+                **csv_options,
+            )
+
+        if not source_path.is_file():
+            raise FileNotFoundError(source_path)
+
+        return CsvTable(
+            source_path,
+            key_column=source_settings.get('key'),
+            **csv_options,
+        )
+
+    raise ValueError(f'unknown type of data source: {source_type!r}')
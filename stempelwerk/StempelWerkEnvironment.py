@@ -0,0 +1,517 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import contextlib
+import hashlib
+import threading
+
+import jinja2
+
+from stempelwerk.StempelWerkTracking import (
+    DYNAMIC_REFERENCE,
+    analyze_template,
+)
+
+
+class StencilModuleCache:
+    # Modules of imported stencils, evaluated once per set of global variables
+    #
+    # Templates are loaded with their own global variables, so Jinja evaluates
+    # a stencil again whenever it is imported ("{% import ... as x %}"). All
+    # templates of a run share the same global variables, so the module of
+    # the first import can be re-used. Modules imported "with context" are
+    # not cached.
+    MAXIMUM_ENTRIES = 1_000
+
+    Entry = collections.namedtuple(
+        'Entry',
+        ['template', 'variables', 'module', 'accessed_paths'],
+    )
+
+    def __init__(
+        self,
+        recorder=None,
+    ):
+        self.recorder = recorder
+        self._entries = collections.OrderedDict()
+        self._pending_evaluations = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get_key(
+        self,
+        template,
+        variables,
+    ):
+        # entries keep their template and variables alive, so their ids
+        # cannot be re-used
+        return (
+            id(template),
+            tuple(
+                (name, id(value)) for name, value in sorted(variables.items())
+            ),
+        )
+
+    def _lookup(
+        self,
+        key,
+    ):
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        # templates importing a cached module depend on the global variables
+        # accessed while evaluating it
+        if self.recorder is not None:
+            for path in entry.accessed_paths:
+                self.recorder.record(path)
+
+        return entry.module
+
+    def _recording(
+        self,
+    ):
+        if self.recorder is None:
+            return contextlib.nullcontext(set())
+
+        return self.recorder.recording()
+
+    def _store(
+        self,
+        key,
+        template,
+        variables,
+        module,
+        accessed_paths,
+    ):
+        self._entries[key] = self.Entry(
+            template,
+            variables,
+            module,
+            frozenset(accessed_paths),
+        )
+
+        # evict least recently used entries
+        while len(self._entries) > self.MAXIMUM_ENTRIES:
+            self._entries.popitem(last=False)
+
+        return module
+
+    def get_module(
+        self,
+        template,
+        variables,
+    ):
+        key = self._get_key(template, variables)
+        module = self._lookup(key)
+
+        if module is not None:
+            return module
+
+        with self._recording() as accessed_paths:
+            module = template.make_module(variables)
+
+        return self._store(key, template, variables, module, accessed_paths)
+
+    async def get_module_async(
+        self,
+        template,
+        variables,
+    ):
+        import asyncio
+
+        key = self._get_key(template, variables)
+
+        # templates rendered concurrently wait for the first evaluation
+        pending_evaluation = self._pending_evaluations.get(key)
+        if pending_evaluation is not None:
+            await asyncio.shield(pending_evaluation)
+
+        module = self._lookup(key)
+
+        if module is not None:
+            return module
+
+        pending_evaluation = asyncio.get_running_loop().create_future()
+        self._pending_evaluations[key] = pending_evaluation
+
+        try:
+            with self._recording() as accessed_paths:
+                module = await template.make_module_async(variables)
+
+            return self._store(
+                key,
+                template,
+                variables,
+                module,
+                accessed_paths,
+            )
+        finally:
+            del self._pending_evaluations[key]
+            pending_evaluation.set_result(None)
+
+    def clear(
+        self,
+    ):
+        self._entries.clear()
+
+
+class StempelWerkTemplate(jinja2.Template):
+    # Template that re-uses modules of imported stencils
+    def _get_import_variables(
+        self,
+        ctx,
+    ):
+        # global variables of the importing template; see
+        # "jinja2.Template._get_default_module()"
+        if ctx is None or self.environment.stencil_modules is None:
+            return None
+
+        names = ctx.globals_keys - self.globals.keys()
+        return {name: ctx.parent[name] for name in names}
+
+    def _get_default_module(
+        self,
+        ctx=None,
+    ):
+        variables = self._get_import_variables(ctx)
+
+        if not variables or self.environment.is_async:
+            return super()._get_default_module(ctx)
+
+        return self.environment.stencil_modules.get_module(self, variables)
+
+    async def _get_default_module_async(
+        self,
+        ctx=None,
+    ):
+        variables = self._get_import_variables(ctx)
+
+        if not variables:
+            return await super()._get_default_module_async(ctx)
+
+        return await self.environment.stencil_modules.get_module_async(
+            self,
+            variables,
+        )
+
+
+class StempelWerkEnvironment(jinja2.Environment):
+    # Jinja environment that analyzes templates while compiling them
+    #
+    # Parsing is the only time the abstract syntax tree of a template is
+    # available, so analyzing it here comes at no additional cost.
+    template_class = StempelWerkTemplate
+
+    def __init__(
+        self,
+        *args,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+
+        # template name => (accessed global variables, referenced templates)
+        self.static_analysis = {}
+
+        # imported stencils are only evaluated once per set of global
+        # variables
+        self.stencil_modules = StencilModuleCache()
+
+    def _parse(
+        self,
+        source,
+        name,
+        filename,
+    ):
+        template_ast = super()._parse(source, name, filename)
+
+        # extensions may reject templates they cannot handle correctly
+        for extension in self.iter_extensions():
+            check_template = getattr(extension, 'check_template', None)
+
+            if check_template is not None:
+                check_template(template_ast, name, filename)
+
+        if name is not None:
+            self.static_analysis[name] = analyze_template(template_ast)
+
+        return template_ast
+
+    def find_referenced_templates(
+        self,
+        template_name,
+    ):
+        # templates and stencils used by a template, directly or through
+        # other stencils; templates that have not been loaded yet are loaded
+        # and thereby analyzed
+        referenced_templates = set()
+        pending_templates = [template_name]
+
+        while pending_templates:
+            current_template = pending_templates.pop()
+
+            if current_template in referenced_templates:
+                continue
+            referenced_templates.add(current_template)
+
+            # templates referenced by variables may be any template
+            if current_template == DYNAMIC_REFERENCE:
+                continue
+
+            if current_template not in self.static_analysis:
+                try:
+                    self.get_template(current_template)
+                except jinja2.TemplateNotFound:
+                    continue
+
+            _, current_references = self.static_analysis.get(
+                current_template,
+                (set(), set()),
+            )
+            pending_templates.extend(current_references)
+
+        referenced_templates.discard(template_name)
+        return referenced_templates
+
+
+def _get_callable_name(
+    value,
+):
+    if callable(value):
+        module_name = getattr(value, '__module__', '')
+        qualified_name = getattr(value, '__qualname__', repr(value))
+
+        return f'{module_name}.{qualified_name}'
+
+    return repr(value)
+
+
+def _get_callable_signature(
+    value,
+):
+    # compiled code depends on how filters and tests are called (such as
+    # "@pass_context"); custom modules may define different functions with
+    # the same name
+    code = getattr(value, '__code__', None)
+    code_digest = None
+
+    if code is not None:
+        code_digest = hashlib.blake2b(
+            code.co_code + repr(code.co_consts).encode('utf-8'),
+            digest_size=16,
+        ).hexdigest()
+
+    return (
+        _get_callable_name(value),
+        repr(getattr(value, 'jinja_pass_arg', None)),
+        code_digest,
+    )
+
+
+def _get_callables_signature(
+    environment,
+):
+    # computing the signature of all filters and tests for every template is
+    # slow, so it is only computed again when they have been replaced
+    callables = (
+        tuple(environment.filters.items()),
+        tuple(environment.tests.items()),
+    )
+
+    cached_signature = getattr(environment, '_callables_signature', None)
+    if cached_signature is not None and cached_signature[0] == callables:
+        return cached_signature[1]
+
+    signature = hashlib.blake2b(
+        repr(
+            [
+                sorted(
+                    (name, _get_callable_signature(value))
+                    for name, value in named_callables
+                )
+                for named_callables in callables
+            ]
+        ).encode('utf-8'),
+        digest_size=16,
+    ).hexdigest()
+
+    environment._callables_signature = (callables, signature)
+    return signature
+
+
+def _get_environment_signature(
+    environment,
+):
+    # Jinja's cache key only depends on the name and file name of a template,
+    # but the compiled code also depends on the configuration of the
+    # environment; projects with different Jinja options must not share code
+    return repr(
+        (
+            _get_callable_name(type(environment)),
+            environment.block_start_string,
+            environment.block_end_string,
+            environment.variable_start_string,
+            environment.variable_end_string,
+            environment.comment_start_string,
+            environment.comment_end_string,
+            environment.line_statement_prefix,
+            environment.line_comment_prefix,
+            environment.trim_blocks,
+            environment.lstrip_blocks,
+            environment.newline_sequence,
+            environment.keep_trailing_newline,
+            environment.optimized,
+            environment.is_async,
+            _get_callable_name(environment.autoescape),
+            _get_callable_name(environment.finalize),
+            sorted(environment.extensions),
+            _get_callables_signature(environment),
+        )
+    )
+
+
+class SharedBytecodeCache(jinja2.BytecodeCache):
+    # Compiled templates shared by all environments of this process
+    #
+    # Every project has its own Jinja environment.  When several projects are
+    # processed in a single run, templates and stencils they have in common
+    # are compiled only once.  Code objects are kept in memory, so there is
+    # no need to marshal them.
+    MAXIMUM_ENTRIES = 10_000
+
+    Entry = collections.namedtuple(
+        'Entry',
+        ['checksum', 'code', 'static_analysis'],
+    )
+
+    def __init__(
+        self,
+    ):
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_bucket(
+        self,
+        environment,
+        name,
+        filename,
+        source,
+    ):
+        cache_key = self.get_cache_key(
+            name,
+            filename,
+        )
+
+        signature = _get_environment_signature(environment)
+
+        bucket = jinja2.bccache.Bucket(
+            environment,
+            (cache_key, signature),
+            self.get_source_checksum(source),
+        )
+
+        # the results of static analysis are stored alongside the code
+        bucket.template_name = name
+
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(
+        self,
+        bucket,
+    ):
+        with self._lock:
+            entry = self._entries.get(bucket.key)
+
+            # source code has changed
+            if entry is None or entry.checksum != bucket.checksum:
+                self.misses += 1
+                return
+
+            self._entries.move_to_end(bucket.key)
+            self.hits += 1
+
+        bucket.code = entry.code
+
+        # templates loaded from cache are not parsed again
+        static_analysis = getattr(bucket.environment, 'static_analysis', None)
+        if static_analysis is not None and entry.static_analysis is not None:
+            static_analysis[bucket.template_name] = entry.static_analysis
+
+    def dump_bytecode(
+        self,
+        bucket,
+    ):
+        static_analysis = getattr(bucket.environment, 'static_analysis', {})
+
+        entry = self.Entry(
+            bucket.checksum,
+            bucket.code,
+            static_analysis.get(bucket.template_name),
+        )
+
+        with self._lock:
+            self._entries[bucket.key] = entry
+            self._entries.move_to_end(bucket.key)
+
+            # evict least recently used entries
+            while len(self._entries) > self.MAXIMUM_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def clear(
+        self,
+    ):
+        with self._lock:
+            self._entries.clear()
+
+
+# a single cache is shared by all environments of this process
+shared_bytecode_cache = SharedBytecodeCache()
@@ -0,0 +1,123 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+
+class StempelWerkError(Exception):
+    # Base class of all errors raised by StempelWerk
+    #
+    # StempelWerk may be embedded in long-running processes, so it never
+    # exits on its own. The command line maps these errors to exit codes;
+    # argparse already uses exit code 2 for usage errors.
+    exit_code = 1
+
+
+class ConfigurationError(StempelWerkError):
+    # broken settings files, unknown encodings, data sources, or archives
+    exit_code = 3
+
+
+class MissingDirectoryError(StempelWerkError):
+    # template, output, or output sub-directory does not exist
+    exit_code = 4
+
+
+class MissingTemplatesError(StempelWerkError):
+    # template or stencil directory is empty
+    exit_code = 5
+
+
+class OutputError(StempelWerkError):
+    # rendered content cannot be split into files or saved
+    exit_code = 6
+
+
+class ChangeDetectionError(StempelWerkError):
+    # changes cannot be found in version control
+    exit_code = 7
+
+
+class TemplateBudgetExceeded(StempelWerkError):
+    # template exceeded its time or memory limit
+    exit_code = 8
+
+    def __init__(
+        self,
+        template_name,
+        reason,
+        running_time,
+    ):
+        self.template_name = template_name
+        self.reason = reason
+        self.running_time = running_time
+
+        super().__init__(
+            f'"{template_name}" {reason} (running for {running_time})'
+        )
+
+
+class SyntaxCheckError(StempelWerkError):
+    # templates or stencils cannot be compiled
+    exit_code = 9
+
+    def __init__(
+        self,
+        problems,
+    ):
+        self.problems = problems
+
+        lines = [f'{len(problems)} templates cannot be compiled:', '']
+        lines.extend(
+            f'  - {problem.template_name} (line {problem.line_number}): '
+            f'{problem.message}'
+            for problem in problems
+        )
+
+        super().__init__('\n'.join(lines))
+
+
+class RenderingError(StempelWerkError):
+    # templates failed while StempelWerk kept going
+    exit_code = 10
+
+
+class CoordinatorError(StempelWerkError):
+    # render workers cannot connect to or have lost their coordinator
+    exit_code = 11
@@ -0,0 +1,116 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import jinja2
+import jinja2.ext
+from jinja2 import nodes
+
+
+class FileExtension(jinja2.ext.Extension):
+    # Jinja extension providing "{% file name %}...{% endfile %}"
+    #
+    # The rendered contents of each block are handed to the file writer of
+    # the environment as soon as the block has been rendered, so output
+    # files need not be separated by markers and split afterwards. Blocks
+    # are removed from the template output.
+    tags = {'file'}
+
+    def __init__(
+        self,
+        environment,
+    ):
+        super().__init__(environment)
+
+        environment.extend(
+            file_writer=None,
+        )
+
+    def parse(
+        self,
+        parser,
+    ):
+        lineno = next(parser.stream).lineno
+        output_file_name = parser.parse_expression()
+
+        body = parser.parse_statements(
+            ['name:endfile'],
+            drop_needle=True,
+        )
+
+        call = self.call_method(
+            '_write_file',
+            [output_file_name],
+        )
+
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _write_file(
+        self,
+        output_file_name,
+        caller,
+    ):
+        # in async mode, the block is rendered by a coroutine
+        if self.environment.is_async:
+            return self._write_file_async(output_file_name, caller)
+
+        return self._save_file(output_file_name, caller())
+
+    async def _write_file_async(
+        self,
+        output_file_name,
+        caller,
+    ):
+        return self._save_file(output_file_name, await caller())
+
+    def _save_file(
+        self,
+        output_file_name,
+        content,
+    ):
+        file_writer = self.environment.file_writer
+
+        if file_writer is None:
+            raise jinja2.exceptions.TemplateRuntimeError(
+                f'cannot write file "{output_file_name}": no file writer'
+            )
+
+        file_writer(str(output_file_name), str(content))
+        return ''
@@ -0,0 +1,485 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import hashlib
+import json
+import os
+
+import jinja2
+import jinja2.ext
+import markupsafe
+from jinja2 import meta, nodes
+
+from stempelwerk.StempelWerkTracking import (
+    DYNAMIC_REFERENCE,
+    serialize_object,
+)
+
+Fragment = collections.namedtuple(
+    'Fragment',
+    ['content', 'is_markup', 'dependencies'],
+)
+
+
+class FragmentCacheExtension(jinja2.ext.Extension):
+    # Jinja extension providing "{% cache key, ... %}...{% endcache %}"
+    #
+    # Rendered blocks are looked up by the source code of the block, the
+    # source code of the templates and stencils it may use, the code of
+    # custom modules, and the values of its keys. Blocks are rendered
+    # normally when the environment has no fragment cache.
+    tags = {'cache'}
+
+    def __init__(
+        self,
+        environment,
+    ):
+        super().__init__(environment)
+
+        environment.extend(
+            fragment_cache=None,
+        )
+
+    def parse(
+        self,
+        parser,
+    ):
+        lineno = next(parser.stream).lineno
+
+        key_values = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_values.append(parser.parse_expression())
+
+        body = parser.parse_statements(
+            ['name:endcache'],
+            drop_needle=True,
+        )
+
+        # changing the code of a block invalidates its cached fragments
+        source_digest = hashlib.blake2b(
+            repr(body).encode('utf-8'),
+            digest_size=16,
+        ).hexdigest()
+
+        call = self.call_method(
+            '_render_fragment',
+            [
+                nodes.Const(parser.name),
+                nodes.Const(source_digest),
+                nodes.List(key_values),
+            ],
+        )
+
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _is_method_call(
+        self,
+        call_block,
+        method_name,
+    ):
+        call_node = call_block.call.node
+
+        return (
+            isinstance(call_node, nodes.ExtensionAttribute)
+            and call_node.name == method_name
+        )
+
+    def check_template(
+        self,
+        template_ast,
+        name,
+        filename,
+    ):
+        # imported stencils and macros are code, which is tracked separately
+        code_names = {
+            macro.name for macro in template_ast.find_all(nodes.Macro)
+        }
+
+        for import_node in template_ast.find_all(nodes.Import):
+            code_names.add(import_node.target)
+
+        for import_node in template_ast.find_all(nodes.FromImport):
+            for imported_name in import_node.names:
+                if isinstance(imported_name, tuple):
+                    imported_name = imported_name[1]
+
+                code_names.add(imported_name)
+
+        for call_block in template_ast.find_all(nodes.CallBlock):
+            if self._is_method_call(call_block, '_render_fragment'):
+                self._check_block(call_block, code_names, name, filename)
+
+    def _check_block(
+        self,
+        call_block,
+        code_names,
+        name,
+        filename,
+    ):
+        # cached fragments only contain the rendered output
+        for nested_block in call_block.find_all(nodes.CallBlock):
+            if self._is_method_call(nested_block, '_write_file'):
+                raise jinja2.TemplateSyntaxError(
+                    '"file" blocks inside "cache" blocks are not saved when '
+                    'the fragment is re-used',
+                    nested_block.lineno,
+                    name,
+                    filename,
+                )
+
+        # fragments are looked up by their keys, so any variable that is
+        # neither a key, a global variable, nor code would be frozen
+        key_values = call_block.call.args[2]
+        key_names = {node.name for node in key_values.find_all(nodes.Name)}
+
+        body = nodes.Template(call_block.body)
+        body.set_environment(self.environment)
+
+        free_names = (
+            meta.find_undeclared_variables(body)
+            - key_names
+            - code_names
+            - self.environment.globals.keys()
+            - {'globals'}
+        )
+
+        if free_names:
+            raise jinja2.TemplateSyntaxError(
+                '"cache" block uses variables that are not keys: '
+                f'{", ".join(sorted(free_names))}',
+                call_block.lineno,
+                name,
+                filename,
+            )
+
+    def _render_fragment(
+        self,
+        template_name,
+        source_digest,
+        key_values,
+        caller,
+    ):
+        fragment_cache = self.environment.fragment_cache
+
+        if fragment_cache is None:
+            return caller()
+
+        # macros of imported stencils, included templates, and custom
+        # filters may change without changing the block itself
+        source_digest += fragment_cache.get_code_digest(
+            self.environment,
+            template_name,
+        )
+
+        # in async mode, the block is rendered by a coroutine
+        if self.environment.is_async:
+            return fragment_cache.render_async(
+                source_digest,
+                key_values,
+                caller,
+            )
+
+        return fragment_cache.render(
+            source_digest,
+            key_values,
+            caller,
+        )
+
+
+class FragmentCache:
+    # Rendered fragments, kept in memory and optionally on disk
+    #
+    # Fragments store the global variables they accessed together with their
+    # digests. Cached fragments are discarded when any of these variables
+    # changes, and templates using a cached fragment still depend on them.
+    def __init__(
+        self,
+        globals_tracker,
+        cache_dir=None,
+        maximum_size=64 * 1024 * 1024,
+    ):
+        self.globals_tracker = globals_tracker
+        self.cache_dir = cache_dir
+        self.maximum_size = maximum_size
+
+        self._fragments = collections.OrderedDict()
+        self._size = 0
+
+        # digest of custom modules, which may define filters and globals
+        self.custom_code_digest = ''
+
+        # template name => digest of the code it may use
+        self._code_digests = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def render(
+        self,
+        source_digest,
+        key_values,
+        caller,
+    ):
+        key = self._get_key(source_digest, key_values)
+        fragment = self._load_current(key)
+
+        if fragment is not None:
+            return self._use_fragment(fragment)
+
+        with self.globals_tracker.recorder.recording() as accessed_paths:
+            content = caller()
+
+        return self._store_content(key, content, accessed_paths)
+
+    async def render_async(
+        self,
+        source_digest,
+        key_values,
+        caller,
+    ):
+        key = self._get_key(source_digest, key_values)
+        fragment = self._load_current(key)
+
+        if fragment is not None:
+            return self._use_fragment(fragment)
+
+        with self.globals_tracker.recorder.recording() as accessed_paths:
+            content = await caller()
+
+        return self._store_content(key, content, accessed_paths)
+
+    def _load_current(
+        self,
+        key,
+    ):
+        fragment = self._load(key)
+
+        if fragment and self.globals_tracker.is_current(fragment.dependencies):
+            self.hits += 1
+            return fragment
+
+        self.misses += 1
+        return None
+
+    def _use_fragment(
+        self,
+        fragment,
+    ):
+        for path, _ in fragment.dependencies:
+            self.globals_tracker.recorder.record(tuple(path))
+
+        if fragment.is_markup:
+            return markupsafe.Markup(fragment.content)
+
+        return fragment.content
+
+    def _store_content(
+        self,
+        key,
+        content,
+        accessed_paths,
+    ):
+        fragment = Fragment(
+            str(content),
+            isinstance(content, markupsafe.Markup),
+            self.globals_tracker.get_dependencies(accessed_paths),
+        )
+
+        self._store(key, fragment)
+        return content
+
+    def get_code_digest(
+        self,
+        environment,
+        template_name,
+    ):
+        code_digest = self._code_digests.get(template_name)
+        if code_digest is not None:
+            return code_digest
+
+        hasher = hashlib.blake2b(
+            self.custom_code_digest.encode('utf-8'),
+            digest_size=16,
+        )
+
+        used_templates = environment.find_referenced_templates(template_name)
+        used_templates.add(template_name)
+
+        # templates referenced by variables may be any template
+        if DYNAMIC_REFERENCE in used_templates:
+            used_templates = set(environment.list_templates())
+
+        for used_template in sorted(used_templates):
+            try:
+                source, _, _ = environment.loader.get_source(
+                    environment,
+                    used_template,
+                )
+            except jinja2.TemplateNotFound:
+                source = ''
+
+            hasher.update(used_template.encode('utf-8'))
+            hasher.update(b'\0')
+            hasher.update(source.encode('utf-8'))
+            hasher.update(b'\0')
+
+        code_digest = hasher.hexdigest()
+        self._code_digests[template_name] = code_digest
+
+        return code_digest
+
+    def _get_key(
+        self,
+        source_digest,
+        key_values,
+    ):
+        serialized_key = json.dumps(
+            [source_digest, key_values],
+            sort_keys=True,
+            default=serialize_object,
+        )
+
+        return hashlib.blake2b(
+            serialized_key.encode('utf-8'),
+            digest_size=16,
+        ).hexdigest()
+
+    def _get_fragment_path(
+        self,
+        key,
+    ):
+        return self.cache_dir / f'{key}.json'
+
+    def _load(
+        self,
+        key,
+    ):
+        fragment = self._fragments.get(key)
+
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+            return fragment
+
+        if self.cache_dir is None:
+            return None
+
+        fragment_path = self._get_fragment_path(key)
+
+        try:
+            fragment = Fragment(**json.loads(fragment_path.read_text('utf-8')))
+        except (OSError, ValueError, TypeError):
+            return None
+
+        # mark fragment as recently used
+        os.utime(fragment_path)
+
+        self._remember(key, fragment)
+        return fragment
+
+    def _store(
+        self,
+        key,
+        fragment,
+    ):
+        self._remember(key, fragment)
+
+        if self.cache_dir is None:
+            return
+
+        self.cache_dir.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+
+        # replace fragments atomically, so other processes never read
+        # partially written files
+        fragment_path = self._get_fragment_path(key)
+        temporary_path = fragment_path.with_suffix('.tmp')
+
+        temporary_path.write_text(
+            json.dumps(fragment._asdict(), ensure_ascii=False),
+            encoding='utf-8',
+        )
+        os.replace(temporary_path, fragment_path)
+
+    def _remember(
+        self,
+        key,
+        fragment,
+    ):
+        previous_fragment = self._fragments.pop(key, None)
+        if previous_fragment is not None:
+            self._size -= len(previous_fragment.content)
+
+        self._fragments[key] = fragment
+        self._size += len(fragment.content)
+
+        # evict least recently used fragments
+        while self._size > self.maximum_size and len(self._fragments) > 1:
+            _, evicted_fragment = self._fragments.popitem(last=False)
+            self._size -= len(evicted_fragment.content)
+
+    def prune(
+        self,
+    ):
+        # templates may be edited before the next run
+        self._code_digests.clear()
+
+        if self.cache_dir is None or not self.cache_dir.is_dir():
+            return
+
+        fragment_files = []
+        for fragment_path in self.cache_dir.glob('*.json'):
+            file_stats = fragment_path.stat()
+            fragment_files.append(
+                (file_stats.st_mtime_ns, file_stats.st_size, fragment_path)
+            )
+
+        # delete least recently used fragments
+        cache_size = sum(file_size for _, file_size, _ in fragment_files)
+
+        for _, file_size, fragment_path in sorted(fragment_files):
+            if cache_size <= self.maximum_size:
+                break
+
+            fragment_path.unlink()
+            cache_size -= file_size
@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import pathlib
+import subprocess
+
+
+def _run_git(
+    directory,
+    *arguments,
+):
+    try:
+        completed_process = subprocess.run(
+            ['git', '-C', str(directory), *arguments],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except FileNotFoundError as err:
+        raise RuntimeError('cannot find "git" executable') from err
+    except subprocess.CalledProcessError as err:
+        raise RuntimeError(err.stderr.strip()) from err
+
+    return completed_process.stdout
+
+
+def _split_paths(
+    output,
+):
+    # paths are separated by NUL characters ("-z")
+    return [path for path in output.split('\0') if path]
+
+
+def get_changed_paths(
+    directory,
+    since='HEAD',
+):
+    # Resolved paths of all files that differ from a git reference
+    #
+    # Files are compared to the common ancestor of the reference and "HEAD",
+    # so that a pull request only sees its own changes. The comparison
+    # includes uncommitted changes and untracked files; renamed files are
+    # reported under their old and their new name.
+    repository_dir = pathlib.Path(
+        _run_git(directory, 'rev-parse', '--show-toplevel').strip()
+    )
+
+    merge_base = _run_git(
+        repository_dir,
+        'merge-base',
+        since,
+        'HEAD',
+    ).strip()
+
+    changed_files = _split_paths(
+        _run_git(
+            repository_dir,
+            'diff',
+            '--name-only',
+            '--no-renames',
+            '-z',
+            merge_base,
+            '--',
+        )
+    )
+
+    untracked_files = _split_paths(
+        _run_git(
+            repository_dir,
+            'ls-files',
+            '--others',
+            '--exclude-standard',
+            '-z',
+        )
+    )
+
+    return {
+        (repository_dir / file_name).resolve()
+        for file_name in changed_files + untracked_files
+    }
@@ -0,0 +1,263 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import concurrent.futures
+import json
+import os
+import posixpath
+import time
+
+IndexEntry = collections.namedtuple(
+    'IndexEntry',
+    ['name', 'path', 'mtime'],
+)
+
+
+class DirectoryIndex:
+    # Persistent index of all files in a directory tree
+    #
+    # Adding, removing or renaming an entry changes the modification time of
+    # its parent directory, so directories with an unchanged modification
+    # time need not be listed again. Files are still examined to find
+    # modified ones. Directories of the same level are processed in
+    # parallel, as file systems (especially network file systems) spend
+    # most of the time waiting.
+    STATE_VERSION = 1
+
+    # directories modified shortly before a scan may be modified again
+    # without changing their timestamp (see "_store_last_run")
+    RACY_NANOSECONDS = 2 * 10**9
+
+    def __init__(
+        self,
+        root_dir,
+        index_file_path,
+        max_workers=None,
+    ):
+        self.root_dir = root_dir
+        self.index_file_path = index_file_path
+        self.max_workers = max_workers
+
+        self.listed_directories = 0
+        self.cached_directories = 0
+
+        self._directories = self._load_state()
+
+    def _load_state(
+        self,
+    ):
+        try:
+            state = json.loads(self.index_file_path.read_text('utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+        # ignore indices of other versions and directories
+        if state.get('version') != self.STATE_VERSION:
+            return {}
+
+        if state.get('root_dir') != os.fspath(self.root_dir):
+            return {}
+
+        return state['directories']
+
+    def _store_state(
+        self,
+    ):
+        state = {
+            'version': self.STATE_VERSION,
+            'root_dir': os.fspath(self.root_dir),
+            'directories': self._directories,
+        }
+
+        self.index_file_path.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+
+        # replace index atomically, so other processes never read partially
+        # written files
+        temporary_path = self.index_file_path.with_suffix('.tmp')
+        temporary_path.write_text(
+            json.dumps(state, ensure_ascii=False),
+            encoding='utf-8',
+        )
+        os.replace(temporary_path, self.index_file_path)
+
+    def scan(
+        self,
+    ):
+        trusted_before_ns = time.time_ns() - self.RACY_NANOSECONDS
+
+        directories = {}
+        pending_directories = ['']
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers,
+        ) as executor:
+            # process directory tree level by level
+            while pending_directories:
+                scan_results = executor.map(
+                    lambda directory_name: self._scan_directory(
+                        directory_name,
+                        trusted_before_ns,
+                    ),
+                    pending_directories,
+                )
+
+                pending_directories = []
+
+                for directory_name, directory, is_cached in scan_results:
+                    directories[directory_name] = directory
+
+                    if is_cached:
+                        self.cached_directories += 1
+                    else:
+                        self.listed_directories += 1
+
+                    for subdirectory_name in directory['directories']:
+                        pending_directories.append(
+                            posixpath.join(directory_name, subdirectory_name)
+                        )
+
+        self._directories = directories
+        self._store_state()
+
+        return self._collect_entries('')
+
+    def _scan_directory(
+        self,
+        directory_name,
+        trusted_before_ns,
+    ):
+        directory_path = self.root_dir / directory_name
+        mtime_ns = directory_path.stat().st_mtime_ns
+
+        cached_directory = self._directories.get(directory_name)
+
+        if (
+            cached_directory is not None
+            and cached_directory['mtime_ns'] == mtime_ns
+            and mtime_ns < trusted_before_ns
+        ):
+            try:
+                directory = self._update_files(
+                    directory_path,
+                    cached_directory,
+                )
+                return directory_name, directory, True
+            except FileNotFoundError:
+                # directory has changed during the scan
+                pass
+
+        directory = self._list_directory(
+            directory_path,
+            mtime_ns,
+        )
+        return directory_name, directory, False
+
+    def _update_files(
+        self,
+        directory_path,
+        cached_directory,
+    ):
+        files = {
+            file_name: (directory_path / file_name).stat().st_mtime_ns
+            for file_name in cached_directory['files']
+        }
+
+        return {
+            'mtime_ns': cached_directory['mtime_ns'],
+            'directories': cached_directory['directories'],
+            'files': files,
+        }
+
+    def _list_directory(
+        self,
+        directory_path,
+        mtime_ns,
+    ):
+        directories = []
+        files = {}
+
+        # like Herkules, ignore symbolic links to directories and files
+        with os.scandir(directory_path) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.is_dir(follow_symlinks=False):
+                    directories.append(directory_entry.name)
+                elif directory_entry.is_file(follow_symlinks=False):
+                    files[directory_entry.name] = (
+                        directory_entry.stat().st_mtime_ns
+                    )
+
+        return {
+            'mtime_ns': mtime_ns,
+            'directories': sorted(directories),
+            'files': files,
+        }
+
+    def _collect_entries(
+        self,
+        directory_name,
+    ):
+        directory = self._directories[directory_name]
+        entries = []
+
+        # list directories first, just like Herkules
+        for subdirectory_name in directory['directories']:
+            entries.extend(
+                self._collect_entries(
+                    posixpath.join(directory_name, subdirectory_name)
+                )
+            )
+
+        for file_name, mtime_ns in sorted(directory['files'].items()):
+            name = posixpath.join(directory_name, file_name)
+
+            entries.append(
+                IndexEntry(
+                    name,
+                    self.root_dir / name,
+                    mtime_ns / 1e9,
+                )
+            )
+
+        return entries
@@ -0,0 +1,296 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import json
+import logging
+import sys
+import threading
+import time
+
+# return to start of line and erase it
+CLEAR_LINE = '\r\x1b[K'
+
+# messages shown in normal verbosity, such as the names of output files
+DETAIL = 15
+
+# messages that are always shown, such as statistics
+NOTICE = 25
+
+logging.addLevelName(DETAIL, 'DETAIL')
+logging.addLevelName(NOTICE, 'NOTICE')
+
+
+class ConsoleFormatter(logging.Formatter):
+    # prefix errors, warnings, and debug messages with their level
+    PREFIXED_LEVELS = {logging.DEBUG, logging.WARNING, logging.ERROR}
+
+    def format(
+        self,
+        record,
+    ):
+        message = record.getMessage()
+
+        if message and record.levelno in self.PREFIXED_LEVELS:
+            message = f'{record.levelname}: {message}'
+
+        return message + getattr(record, 'end', '\n')
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(
+        self,
+        record,
+    ):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'message': record.getMessage().strip(),
+        }
+
+        # such as names of templates and output files
+        entry.update(getattr(record, 'fields', {}))
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def is_readable(
+    record,
+):
+    # blank lines and progress dots only make sense on a console
+    if getattr(record, 'cosmetic', False):
+        return False
+
+    return bool(record.getMessage().strip())
+
+
+class BufferedConsoleHandler(logging.Handler):
+    # Write messages to standard output in batches
+    #
+    # Writing every line on its own is slow, especially when the output is
+    # streamed to a CI server. Errors and warnings are written immediately,
+    # and a timer writes everything else once the flush interval has passed,
+    # even when a template takes ages and no new messages come in.
+    #
+    # Listing 100,000 output files is neither readable nor fast either. When
+    # a summary interval is given, messages with a "summary" attribute are
+    # only counted, and a summary of all counts is shown at most once per
+    # interval.
+    #
+    # On a terminal, messages with a "status" attribute replace the previous
+    # status line, which is kept below all other messages.
+    def __init__(
+        self,
+        capacity=256,
+        flush_interval=0.5,
+        summary_interval=None,
+    ):
+        super().__init__()
+        self.setFormatter(ConsoleFormatter())
+
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.summary_interval = summary_interval
+
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._flush_timer = None
+
+        self._status_line = ''
+        self._shown_status_line = ''
+
+        self._summary_counts = collections.Counter()
+        self._last_summary = time.monotonic()
+
+    def emit(
+        self,
+        record,
+    ):
+        status = getattr(record, 'status', False)
+
+        if status:
+            self._status_line = record.getMessage()
+        else:
+            message = self._summarize(record)
+            if message is None:
+                return
+
+            self._buffer.append(message)
+
+        # status lines are shown and cleared immediately
+        if (
+            len(self._buffer) >= self.capacity
+            or (status and not (self._status_line and self._shown_status_line))
+            or record.levelno >= logging.WARNING
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+        elif self._flush_timer is None:
+            self._start_flush_timer()
+
+    def _start_flush_timer(
+        self,
+    ):
+        # write buffered messages even if no further messages are emitted
+        self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def _summarize(
+        self,
+        record,
+    ):
+        summary = getattr(record, 'summary', None)
+        if self.summary_interval is None or summary is None:
+            return self.format(record)
+
+        # blank lines between templates are dropped
+        if not summary:
+            return None
+
+        self._summary_counts[summary] += 1
+
+        now = time.monotonic()
+        if now - self._last_summary < self.summary_interval:
+            return None
+
+        self._last_summary = now
+
+        counts = ', '.join(
+            f'{count} {summary}'
+            for summary, count in self._summary_counts.items()
+        )
+
+        return f'... {counts}\n'
+
+    def flush(
+        self,
+    ):
+        with self.lock:
+            self._last_flush = time.monotonic()
+
+            # buffered messages are written now
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            if (
+                not self._buffer
+                and self._status_line == self._shown_status_line
+            ):
+                return
+
+            output = ''.join(self._buffer)
+
+            # erase status line, write messages, and show status line again
+            if self._shown_status_line:
+                output = CLEAR_LINE + output
+
+            output += self._status_line
+
+            # look up standard output on every write, as it may have been
+            # replaced (for example, by pytest)
+            sys.stdout.write(output)
+            sys.stdout.flush()
+
+            self._buffer = []
+            self._shown_status_line = self._status_line
+
+    def close(
+        self,
+    ):
+        self.flush()
+        super().close()
+
+
+def create_logger(
+    level,
+    json_log_path=None,
+    summary_interval=None,
+    background=False,
+):
+    # loggers are not registered globally, so every printer has its own
+    logger = logging.Logger('stempelwerk', level)
+    handlers = []
+
+    # JSON lines replace the text output on standard output
+    if json_log_path != '-':
+        console_handler = BufferedConsoleHandler(
+            summary_interval=summary_interval,
+        )
+        handlers.append(console_handler)
+
+    if json_log_path:
+        if json_log_path == '-':
+            json_handler = logging.StreamHandler(sys.stdout)
+        else:
+            json_handler = logging.FileHandler(
+                json_log_path,
+                mode='w',
+                encoding='utf-8',
+            )
+
+        json_handler.setFormatter(JsonLinesFormatter())
+        json_handler.addFilter(is_readable)
+        handlers.append(json_handler)
+
+    listener = None
+
+    # format and write messages in a background thread; a single queue
+    # keeps messages in order
+    if background:
+        import queue
+        from logging.handlers import QueueHandler, QueueListener
+
+        message_queue = queue.SimpleQueue()
+        logger.addHandler(QueueHandler(message_queue))
+
+        listener = QueueListener(
+            message_queue,
+            *handlers,
+            respect_handler_level=True,
+        )
+        listener.start()
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    return logger, handlers, listener
@@ -0,0 +1,143 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import contextlib
+import json
+import tracemalloc
+
+MEGABYTE = 1024 * 1024
+
+PHASES = ('render', 'split', 'write')
+
+
+def format_megabytes(
+    size,
+):
+    return f'{size / MEGABYTE:.1f} MB'
+
+
+class PeakMemoryTracker:
+    # Measure peak memory of rendering, splitting, and writing each template
+    #
+    # Memory is traced with "tracemalloc", so only memory allocated by
+    # Python is counted. Tracing slows down rendering noticeably, so it
+    # should only be enabled when looking for memory hogs.
+    def __init__(
+        self,
+        warning_threshold=0,
+    ):
+        # zero disables warnings
+        self.warning_threshold = warning_threshold
+
+        # template name => phase => peak memory in bytes
+        self.peak_memory = {}
+
+        self._template_name = None
+        self._started_tracing = False
+
+    def start(
+        self,
+    ):
+        # do not interfere with tracing started by someone else
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(
+        self,
+    ):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def start_template(
+        self,
+        template_name,
+    ):
+        self._template_name = template_name
+        self.peak_memory[template_name] = dict.fromkeys(PHASES, 0)
+
+    @contextlib.contextmanager
+    def measure(
+        self,
+        phase,
+    ):
+        tracemalloc.reset_peak()
+        memory_before, _ = tracemalloc.get_traced_memory()
+
+        try:
+            yield
+        finally:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            phases = self.peak_memory[self._template_name]
+
+            # output files are written one after another
+            phases[phase] = max(
+                phases[phase],
+                peak_memory - memory_before,
+            )
+
+    def get_warnings(
+        self,
+    ):
+        if not self.warning_threshold:
+            return []
+
+        return [
+            (template_name, phase, peak_memory)
+            for template_name, phases in self.peak_memory.items()
+            for phase, peak_memory in phases.items()
+            if peak_memory > self.warning_threshold
+        ]
+
+    def store(
+        self,
+        report_file_path,
+    ):
+        report_file_path.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+
+        report_file_path.write_text(
+            json.dumps(self.peak_memory, ensure_ascii=False, indent=2),
+            encoding='utf-8',
+        )
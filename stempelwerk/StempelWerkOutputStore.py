@@ -0,0 +1,327 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import errno
+import hashlib
+import json
+import os
+import sys
+
+# see "linux/fs.h"
+FICLONE = 0x40049409
+
+# failures that depend on the file system, not on single files
+UNSUPPORTED_ERRORS = frozenset(
+    {
+        errno.EXDEV,
+        errno.EPERM,
+        errno.EINVAL,
+        errno.ENOTTY,
+        errno.EOPNOTSUPP,
+        errno.ENOSYS,
+    }
+)
+
+
+def clone_file(
+    source_path,
+    target_path,
+):
+    # reflinks share data blocks until one of the files is modified
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'reflinks are not supported')
+
+    import fcntl
+
+    # the incomplete target is removed when cloning fails
+    try:
+        with (
+            source_path.open('rb') as source_file,
+            target_path.open('wb') as target_file,
+        ):
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+    except OSError:
+        target_path.unlink(missing_ok=True)
+        raise
+
+
+class OutputStore:
+    # Content-addressed store that writes identical output files only once
+    #
+    # Every output file is hashed. Its content is stored once under its hash,
+    # and output files with the same content become reflinks or hardlinks to
+    # the stored object. When the file system supports neither, output files
+    # are copied. Output files that are already linked to the right object,
+    # or have its content, are left alone.
+    METHODS = ('reflink', 'hardlink')
+
+    def __init__(
+        self,
+        store_dir,
+    ):
+        self.store_dir = store_dir
+
+        # methods are dropped once the file system turns out not to support
+        # them
+        self.methods = list(self.METHODS)
+
+        # method => number of output files
+        self.statistics = dict.fromkeys(
+            ('unchanged', 'stored', *self.METHODS, 'copy'),
+            0,
+        )
+
+        self._used_objects = set()
+
+        # object name => size and modification time of the intact object
+        self._index_path = self.store_dir / 'index.json'
+        self._index = self._load_index()
+
+    def _load_index(
+        self,
+    ):
+        try:
+            return json.loads(self._index_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _store_index(
+        self,
+    ):
+        self.store_dir.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+
+        # never leave incomplete indexes behind
+        temporary_path = self._index_path.with_name(
+            f'index.json.{os.getpid()}.tmp'
+        )
+        temporary_path.write_text(json.dumps(self._index))
+        os.replace(temporary_path, self._index_path)
+
+    @staticmethod
+    def _get_digest(
+        output_data,
+    ):
+        return hashlib.blake2b(output_data, digest_size=20).hexdigest()
+
+    def _get_object_path(
+        self,
+        output_data,
+    ):
+        digest = self._get_digest(output_data)
+        return self.store_dir / digest[:2] / digest
+
+    def _remember_object(
+        self,
+        object_path,
+        object_stats,
+    ):
+        self._index[object_path.name] = [
+            object_stats.st_size,
+            object_stats.st_mtime_ns,
+        ]
+
+    def _store_object(
+        self,
+        object_path,
+        output_data,
+    ):
+        object_path.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+
+        # never leave incomplete objects behind
+        temporary_path = object_path.with_name(
+            f'{object_path.name}.{os.getpid()}.tmp'
+        )
+        temporary_path.write_bytes(output_data)
+        os.replace(temporary_path, object_path)
+
+        self._remember_object(object_path, object_path.stat())
+        self.statistics['stored'] += 1
+
+    def _is_intact(
+        self,
+        object_path,
+        output_data,
+    ):
+        # stored objects are changed when linked files are edited in place,
+        # which also changes their modification time
+        try:
+            object_stats = object_path.stat()
+        except FileNotFoundError:
+            return False
+
+        if object_stats.st_size != len(output_data):
+            return False
+
+        known_stats = [object_stats.st_size, object_stats.st_mtime_ns]
+        if self._index.get(object_path.name) == known_stats:
+            return True
+
+        # objects stored by earlier versions or changed since
+        try:
+            if object_path.read_bytes() != output_data:
+                return False
+        except FileNotFoundError:
+            return False
+
+        self._remember_object(object_path, object_stats)
+        return True
+
+    def _has_content(
+        self,
+        object_path,
+        output_file_path,
+        output_data,
+    ):
+        # reflinks and copies are separate files, so compare their content
+        try:
+            if output_file_path.stat().st_size != len(output_data):
+                return False
+
+            output_digest = self._get_digest(output_file_path.read_bytes())
+        except OSError:
+            return False
+
+        return output_digest == object_path.name
+
+    @staticmethod
+    def _is_linked(
+        object_path,
+        output_file_path,
+    ):
+        try:
+            return os.path.samefile(object_path, output_file_path)
+        except OSError:
+            return False
+
+    def _is_unchanged(
+        self,
+        object_path,
+        output_file_path,
+        output_data,
+    ):
+        if self._is_linked(object_path, output_file_path):
+            return True
+
+        # identical files are replaced by hardlinks to save space
+        if self.methods[:1] == ['hardlink']:
+            return False
+
+        return self._has_content(object_path, output_file_path, output_data)
+
+    def _link(
+        self,
+        method,
+        object_path,
+        output_file_path,
+    ):
+        if method == 'reflink':
+            clone_file(object_path, output_file_path)
+        else:
+            os.link(object_path, output_file_path)
+
+    def write(
+        self,
+        output_file_path,
+        output_data,
+    ):
+        object_path = self._get_object_path(output_data)
+        self._used_objects.add(object_path.name)
+
+        if not self._is_intact(object_path, output_data):
+            self._store_object(object_path, output_data)
+        elif self._is_unchanged(object_path, output_file_path, output_data):
+            self.statistics['unchanged'] += 1
+            return 'unchanged'
+
+        # writing into hardlinked files would change all of them
+        output_file_path.unlink(missing_ok=True)
+
+        for method in list(self.methods):
+            try:
+                self._link(method, object_path, output_file_path)
+            except OSError as err:
+                if err.errno in UNSUPPORTED_ERRORS:
+                    self.methods.remove(method)
+
+                # such as too many links to a single object
+                continue
+
+            self.statistics[method] += 1
+            return method
+
+        output_file_path.write_bytes(output_data)
+
+        self.statistics['copy'] += 1
+        return 'copy'
+
+    def prune(
+        self,
+    ):
+        if not self.store_dir.is_dir():
+            return
+
+        kept_objects = set()
+
+        # keep objects that have been used in this run or are still linked to
+        # output files
+        for object_path in self.store_dir.glob('*/*'):
+            if object_path.name in self._used_objects:
+                kept_objects.add(object_path.name)
+                continue
+
+            if object_path.stat().st_nlink > 1:
+                kept_objects.add(object_path.name)
+                continue
+
+            object_path.unlink()
+
+        self._index = {
+            object_name: object_stats
+            for object_name, object_stats in self._index.items()
+            if object_name in kept_objects
+        }
+        self._store_index()
@@ -0,0 +1,263 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import sys
+import threading
+import time
+
+
+def _parse_debug_info(
+    debug_info,
+):
+    # "1=13&2=16" => [(1, 13), (2, 16)]; see "jinja2.Template._debug_info"
+    if not debug_info:
+        return []
+
+    return [
+        tuple(int(number) for number in pair.split('='))
+        for pair in debug_info.split('&')
+    ]
+
+
+class TemplateProfiler:
+    # Sample the rendering thread and map time to lines of templates
+    #
+    # Jinja compiles templates to Python code, so profilers such as
+    # "cProfile" only show generated functions. Compiled templates know
+    # which template line every line of code was generated from, which is
+    # used to translate sampled stack frames. Time spent in filters and
+    # custom modules is attributed to the template line calling them.
+    SAMPLING_INTERVAL = 0.001
+
+    def __init__(
+        self,
+        interval=SAMPLING_INTERVAL,
+    ):
+        self.interval = interval
+
+        # stack of template lines (outermost first) => time in seconds
+        self.stacks = collections.defaultdict(float)
+
+        # debug information of compiled templates => line numbers
+        self._line_numbers = {}
+
+        self._thread_id = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+
+    def start(
+        self,
+    ):
+        # templates are rendered by the thread starting the profiler
+        self._thread_id = threading.get_ident()
+        self._stop_sampling.clear()
+
+        self._sampler = threading.Thread(
+            target=self._sample,
+            name='StempelWerk profiler',
+            daemon=True,
+        )
+        self._sampler.start()
+
+    def stop(
+        self,
+    ):
+        if self._sampler is None:
+            return
+
+        self._stop_sampling.set()
+        self._sampler.join()
+        self._sampler = None
+
+    def _sample(
+        self,
+    ):
+        last_sample = time.perf_counter()
+
+        while not self._stop_sampling.wait(self.interval):
+            stack = self._get_template_stack(
+                sys._current_frames().get(self._thread_id),
+            )
+
+            # samples may be delayed while the rendering thread holds the
+            # GIL, so they are weighted with the time that has passed
+            current_sample = time.perf_counter()
+
+            if stack:
+                self.stacks[stack] += current_sample - last_sample
+
+            last_sample = current_sample
+
+    def _get_template_line(
+        self,
+        frame,
+    ):
+        frame_globals = frame.f_globals
+
+        # code of compiled templates is executed in a namespace that holds
+        # the name and debug information of its template
+        if frame_globals.get('__file__') != frame.f_code.co_filename:
+            return None
+
+        template_name = frame_globals.get('name')
+        debug_info = frame_globals.get('debug_info')
+
+        if template_name is None or debug_info is None:
+            return None
+
+        line_numbers = self._line_numbers.get(debug_info)
+        if line_numbers is None:
+            line_numbers = _parse_debug_info(debug_info)
+            self._line_numbers[debug_info] = line_numbers
+
+        # see "jinja2.Template.get_corresponding_lineno()"
+        for template_line, code_line in reversed(line_numbers):
+            if code_line <= frame.f_lineno:
+                return template_name, template_line
+
+        return template_name, 1
+
+    def _get_template_stack(
+        self,
+        frame,
+    ):
+        stack = []
+
+        while frame is not None:
+            template_line = self._get_template_line(frame)
+
+            if template_line is not None:
+                stack.append(template_line)
+
+            frame = frame.f_back
+
+        return tuple(reversed(stack))
+
+    def get_line_times(
+        self,
+    ):
+        # (template name, line number) => [total time, self time]
+        line_times = collections.defaultdict(lambda: [0.0, 0.0])
+
+        for stack, seconds in self.stacks.items():
+            # recursive macros must not be counted twice
+            for template_line in set(stack):
+                line_times[template_line][0] += seconds
+
+            line_times[stack[-1]][1] += seconds
+
+        return dict(line_times)
+
+    def get_hot_lines(
+        self,
+        count=None,
+    ):
+        hot_lines = sorted(
+            self.get_line_times().items(),
+            key=lambda item: (-item[1][0], -item[1][1], item[0]),
+        )
+
+        return hot_lines[:count]
+
+    def store_folded_stacks(
+        self,
+        folded_file_path,
+    ):
+        # format of "flamegraph.pl" and compatible tools, in microseconds
+        lines = [
+            ';'.join(f'{name}:{line}' for name, line in stack)
+            + f' {round(seconds * 1_000_000)}'
+            for stack, seconds in sorted(self.stacks.items())
+        ]
+
+        folded_file_path.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+        folded_file_path.write_text(
+            ''.join(f'{line}\n' for line in lines),
+            encoding='utf-8',
+        )
+
+    def store_report(
+        self,
+        report_file_path,
+        template_dir,
+    ):
+        source_lines = {}
+        lines = [
+            f'{"total ms":>10}  {"self ms":>10}  template line',
+        ]
+
+        for (template_name, line_number), times in self.get_hot_lines():
+            if template_name not in source_lines:
+                source_lines[template_name] = self._read_source_lines(
+                    template_dir / template_name,
+                )
+
+            source_line = ''
+            if line_number <= len(source_lines[template_name]):
+                source_line = source_lines[template_name][line_number - 1]
+
+            total_time, self_time = times
+            lines.append(
+                f'{total_time * 1000:10.1f}  {self_time * 1000:10.1f}  '
+                f'{template_name}:{line_number}  {source_line.strip()}'
+            )
+
+        report_file_path.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+        report_file_path.write_text(
+            ''.join(f'{line}\n' for line in lines),
+            encoding='utf-8',
+        )
+
+    @staticmethod
+    def _read_source_lines(
+        template_path,
+    ):
+        try:
+            return template_path.read_text(encoding='utf-8').splitlines()
+        except (OSError, ValueError):
+            return []
@@ -0,0 +1,262 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import datetime
+import json
+import sys
+import time
+
+from stempelwerk.StempelWerkMemory import format_megabytes
+
+
+class TemplateTimings:
+    # Time needed for processing each template in earlier runs
+    STATE_VERSION = 1
+
+    def __init__(
+        self,
+        state_file_path,
+    ):
+        self.state_file_path = state_file_path
+        self.timings = self._load_state()
+
+    def _load_state(
+        self,
+    ):
+        try:
+            state = json.loads(self.state_file_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+        if state.get('version') != self.STATE_VERSION:
+            return {}
+
+        return state.get('templates', {})
+
+    def store_state(
+        self,
+        template_names,
+    ):
+        # forget about templates that have been deleted
+        template_names = set(template_names)
+        templates = {
+            template_name: timing
+            for template_name, timing in self.timings.items()
+            if template_name in template_names
+        }
+
+        state = {
+            'version': self.STATE_VERSION,
+            'templates': templates,
+        }
+
+        self.state_file_path.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+        self.state_file_path.write_text(
+            json.dumps(state, ensure_ascii=False),
+            encoding='utf-8',
+        )
+
+
+class ProgressReporter:
+    # Display throughput and estimated time of arrival while rendering
+    #
+    # On a terminal, a status line is updated in place. Otherwise (such as
+    # in CI logs), a summary line is written every few seconds.
+    #
+    # Runs may have 100,000 templates, so the estimate is updated as
+    # templates finish instead of being computed from scratch.
+    STATUS_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        printer,
+        template_names,
+        timings,
+        interval=10.0,
+        is_interactive=None,
+    ):
+        self.printer = printer
+        self.template_names = list(template_names)
+        self.timings = timings
+        self.interval = interval
+
+        if is_interactive is None:
+            is_interactive = sys.stdout.isatty()
+        self.is_interactive = is_interactive
+
+        self.processed_templates = 0
+        self.saved_files = 0
+        self.written_bytes = 0
+
+        # total time and number of templates with history
+        self._historical_time = sum(timings.timings.values())
+        self._historical_templates = len(timings.timings)
+
+        # remaining templates with history and their total time, and the
+        # number of remaining templates without history
+        self._remaining_time = 0.0
+        self._remaining_unknown_templates = 0
+
+        for template_name in self.template_names:
+            timing = timings.timings.get(template_name)
+
+            if timing is None:
+                self._remaining_unknown_templates += 1
+            else:
+                self._remaining_time += timing
+
+        self._start_of_processing = time.monotonic()
+        self._start_of_template = self._start_of_processing
+        self._last_report = self._start_of_processing
+
+        # show the status line right after the first template
+        self._last_status = self._start_of_processing - self.STATUS_INTERVAL
+
+    def start_template(
+        self,
+    ):
+        self._start_of_template = time.monotonic()
+
+    def finish_template(
+        self,
+        template_name,
+        saved_files,
+        written_bytes,
+    ):
+        now = time.monotonic()
+
+        self._update_timing(template_name, now - self._start_of_template)
+        self.processed_templates += 1
+        self.saved_files += saved_files
+        self.written_bytes += written_bytes
+
+        # redrawing the status line after every template is slow
+        if self.is_interactive:
+            if now - self._last_status >= self.STATUS_INTERVAL:
+                self._last_status = now
+                self.printer.status(self.format_progress(now))
+        elif now - self._last_report >= self.interval:
+            self._report(now)
+
+    def _update_timing(
+        self,
+        template_name,
+        timing,
+    ):
+        previous_timing = self.timings.timings.get(template_name)
+        self.timings.timings[template_name] = timing
+
+        if previous_timing is None:
+            self._historical_templates += 1
+            self._historical_time += timing
+            self._remaining_unknown_templates -= 1
+        else:
+            self._historical_time += timing - previous_timing
+            self._remaining_time -= previous_timing
+
+    def finish(
+        self,
+    ):
+        if self.is_interactive:
+            self.printer.status('')
+
+        self._report(time.monotonic())
+
+    def _report(
+        self,
+        now,
+    ):
+        self._last_report = now
+
+        self.printer.notice(
+            self.format_progress(now),
+            processed_templates=self.processed_templates,
+            total_templates=len(self.template_names),
+            saved_files=self.saved_files,
+            written_bytes=self.written_bytes,
+            eta_seconds=round(self.estimate_remaining_time(now), 3),
+        )
+
+    def estimate_remaining_time(
+        self,
+        now,
+    ):
+        if self.processed_templates >= len(self.template_names):
+            return 0.0
+
+        # templates without history take as long as the average template
+        if self._historical_templates:
+            fallback = self._historical_time / self._historical_templates
+        else:
+            elapsed_time = now - self._start_of_processing
+            fallback = elapsed_time / max(self.processed_templates, 1)
+
+        remaining_time = (
+            self._remaining_time + self._remaining_unknown_templates * fallback
+        )
+
+        # rounding errors must not turn into negative estimates
+        return max(remaining_time, 0.0)
+
+    def format_progress(
+        self,
+        now,
+    ):
+        elapsed_time = max(now - self._start_of_processing, 1e-9)
+        total_templates = len(self.template_names)
+        percentage = 100 * self.processed_templates / max(total_templates, 1)
+
+        remaining_time = datetime.timedelta(
+            seconds=round(self.estimate_remaining_time(now))
+        )
+
+        return (
+            f'[{percentage:3.0f}%] '
+            f'{self.processed_templates}/{total_templates} templates '
+            f'({self.processed_templates / elapsed_time:.1f}/s), '
+            f'{self.saved_files} files '
+            f'({self.saved_files / elapsed_time:.1f}/s), '
+            f'{format_megabytes(self.written_bytes)} written, '
+            f'ETA {remaining_time}'
+        )
@@ -0,0 +1,226 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import contextlib
+import os
+import pathlib
+import sqlite3
+import threading
+
+
+class ResourcePool:
+    # Pool of resources such as database connections
+    #
+    # Resources are created on demand and handed out exclusively, so they may
+    # be used by several threads. Forked processes never re-use resources of
+    # their parent.
+    def __init__(
+        self,
+        create,
+        close=None,
+    ):
+        self._create = create
+        self._close = close
+
+        self._lock = threading.Lock()
+        self._idle_resources = []
+        self._process_id = os.getpid()
+
+    def _acquire(
+        self,
+    ):
+        with self._lock:
+            if self._process_id != os.getpid():
+                self._idle_resources = []
+                self._process_id = os.getpid()
+
+            if self._idle_resources:
+                return self._idle_resources.pop()
+
+        return self._create()
+
+    def _release(
+        self,
+        resource,
+    ):
+        with self._lock:
+            if self._process_id == os.getpid():
+                self._idle_resources.append(resource)
+                return
+
+        self._close_resource(resource)
+
+    def _close_resource(
+        self,
+        resource,
+    ):
+        if self._close is not None:
+            self._close(resource)
+
+    @contextlib.contextmanager
+    def acquire(
+        self,
+    ):
+        resource = self._acquire()
+
+        try:
+            yield resource
+        finally:
+            self._release(resource)
+
+    def close(
+        self,
+    ):
+        with self._lock:
+            idle_resources = self._idle_resources
+            self._idle_resources = []
+
+        for resource in idle_resources:
+            self._close_resource(resource)
+
+
+class ConnectionPool(ResourcePool):
+    # Pool of SQLite connections, read-only by default
+    def __init__(
+        self,
+        database_path,
+        read_only=True,
+    ):
+        super().__init__(
+            self._connect,
+            sqlite3.Connection.close,
+        )
+
+        self.database_path = pathlib.Path(database_path)
+        self.read_only = read_only
+
+    def _connect(
+        self,
+    ):
+        database_uri = self.database_path.resolve().as_uri()
+        if self.read_only:
+            database_uri += '?mode=ro'
+
+        return sqlite3.connect(
+            database_uri,
+            uri=True,
+            check_same_thread=False,
+        )
+
+    def connection(
+        self,
+    ):
+        return self.acquire()
+
+
+# ----------------------------------------------------------------------------
+
+
+class ResourceRegistry:
+    # Resources shared by the custom modules of a project
+    #
+    # Filters look up resources by name instead of opening their own
+    # database connections on every call. Idle resources are closed at the
+    # end of each run and created again when they are needed.
+    def __init__(
+        self,
+        root_dir=None,
+    ):
+        # relative paths are resolved against the root directory of the
+        # project, not against the current working directory
+        self.root_dir = pathlib.Path(root_dir or '.')
+
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def register(
+        self,
+        name,
+        create,
+        close=None,
+    ):
+        # custom modules may register the same resource several times
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = ResourcePool(create, close)
+
+            return self._pools[name]
+
+    def register_sqlite(
+        self,
+        name,
+        database_path,
+        read_only=True,
+    ):
+        database_path = self.root_dir / database_path
+
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = ConnectionPool(database_path, read_only)
+
+            return self._pools[name]
+
+    def acquire(
+        self,
+        name,
+    ):
+        with self._lock:
+            pool = self._pools.get(name)
+
+        if pool is None:
+            raise KeyError(f'unknown resource "{name}"')
+
+        return pool.acquire()
+
+    def __contains__(
+        self,
+        name,
+    ):
+        return name in self._pools
+
+    def close(
+        self,
+    ):
+        with self._lock:
+            pools = list(self._pools.values())
+
+        for pool in pools:
+            pool.close()
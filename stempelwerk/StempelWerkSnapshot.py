@@ -0,0 +1,244 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import contextlib
+import datetime
+import hashlib
+import json
+import marshal
+import os
+import pathlib
+import sys
+import time
+
+_INVALID = object()
+
+
+class JsonSnapshot:
+    # Binary snapshot of parsed JSON files
+    #
+    # "marshal" handles all data types created by the JSON parser and loads
+    # them many times faster than "json" can parse the original file. The
+    # snapshot is reused as long as size, modification time (or, after the
+    # file has been touched, its hash) match those of the JSON file.
+    #
+    # The snapshot starts with the size of the header, so that the header can
+    # be checked without loading the data.
+    FORMAT_VERSION = 1
+    HEADER_SIZE_BYTES = 8
+
+    def __init__(
+        self,
+        snapshot_dir,
+    ):
+        self.snapshot_dir = pathlib.Path(snapshot_dir)
+        self.timings = {}
+
+        # snapshots cannot be stored in read-only checkouts or on full disks
+        self.write_error = None
+
+    def _timed(
+        self,
+        step,
+        function,
+        *args,
+    ):
+        start = time.perf_counter()
+        result = function(*args)
+
+        elapsed_time = time.perf_counter() - start
+        self.timings[step] = datetime.timedelta(seconds=elapsed_time)
+
+        return result
+
+    def _get_snapshot_path(
+        self,
+        json_file_path,
+    ):
+        resolved_path = str(json_file_path.resolve())
+
+        snapshot_name = hashlib.blake2b(
+            resolved_path.encode('utf-8'),
+            digest_size=16,
+        ).hexdigest()
+
+        return self.snapshot_dir / f'{snapshot_name}.marshal'
+
+    @staticmethod
+    def _get_digest(
+        json_bytes,
+    ):
+        return hashlib.blake2b(json_bytes).hexdigest()
+
+    def _create_header(
+        self,
+        file_stats,
+        digest,
+    ):
+        return {
+            'format': self.FORMAT_VERSION,
+            # the marshal format may change between Python versions
+            'python': list(sys.version_info[:2]),
+            'size': file_stats.st_size,
+            'mtime_ns': file_stats.st_mtime_ns,
+            'digest': digest,
+        }
+
+    def _read_header(
+        self,
+        snapshot_path,
+    ):
+        try:
+            with snapshot_path.open('rb') as snapshot_file:
+                header_size = snapshot_file.read(self.HEADER_SIZE_BYTES)
+                header_size = int.from_bytes(header_size, 'little')
+
+                header = marshal.loads(snapshot_file.read(header_size))
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if not isinstance(header, dict):
+            return None
+
+        if header.get('format') != self.FORMAT_VERSION:
+            return None
+
+        if header.get('python') != list(sys.version_info[:2]):
+            return None
+
+        return header
+
+    def _read_data(
+        self,
+        snapshot_path,
+    ):
+        try:
+            with snapshot_path.open('rb') as snapshot_file:
+                # skip header
+                header_size = snapshot_file.read(self.HEADER_SIZE_BYTES)
+                header_size = int.from_bytes(header_size, 'little')
+                snapshot_file.seek(header_size, os.SEEK_CUR)
+
+                # reading from memory is much faster than "marshal.load()"
+                return marshal.loads(snapshot_file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return _INVALID
+
+    def _write_snapshot(
+        self,
+        snapshot_path,
+        header,
+        data,
+    ):
+        self.snapshot_dir.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+
+        # never leave a half-written snapshot behind
+        temporary_path = snapshot_path.with_suffix('.tmp')
+
+        serialized_header = marshal.dumps(header)
+        header_size = len(serialized_header)
+
+        try:
+            with temporary_path.open('wb') as snapshot_file:
+                snapshot_file.write(
+                    header_size.to_bytes(self.HEADER_SIZE_BYTES, 'little')
+                )
+                snapshot_file.write(serialized_header)
+                snapshot_file.write(marshal.dumps(data))
+
+            os.replace(temporary_path, snapshot_path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                temporary_path.unlink(missing_ok=True)
+
+            raise
+
+    def load(
+        self,
+        json_file_path,
+    ):
+        json_file_path = pathlib.Path(json_file_path)
+        self.timings = {}
+        self.write_error = None
+
+        file_stats = json_file_path.stat()
+        snapshot_path = self._get_snapshot_path(json_file_path)
+        header = self._read_header(snapshot_path)
+
+        # file has not been touched since the snapshot was taken
+        if (
+            header is not None
+            and header['size'] == file_stats.st_size
+            and header['mtime_ns'] == file_stats.st_mtime_ns
+        ):
+            data = self._timed('load snapshot', self._read_data, snapshot_path)
+            if data is not _INVALID:
+                return data
+
+        json_bytes = self._timed('read JSON', json_file_path.read_bytes)
+        digest = self._timed('hash JSON', self._get_digest, json_bytes)
+        new_header = self._create_header(file_stats, digest)
+
+        # file has been touched, but not changed (such as after a checkout)
+        if header is not None and header['digest'] == digest:
+            data = self._timed('load snapshot', self._read_data, snapshot_path)
+        else:
+            data = _INVALID
+
+        if data is _INVALID:
+            data = self._timed('parse JSON', json.loads, json_bytes)
+
+        # the snapshot only speeds up later runs, so this run carries on
+        try:
+            self._timed(
+                'store snapshot',
+                self._write_snapshot,
+                snapshot_path,
+                new_header,
+                data,
+            )
+        except OSError as err:
+            self.write_error = err
+
+        return data
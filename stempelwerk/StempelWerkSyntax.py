@@ -0,0 +1,214 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import marshal
+import multiprocessing
+import os
+
+SyntaxProblem = collections.namedtuple(
+    'SyntaxProblem',
+    ['template_name', 'line_number', 'message'],
+)
+
+CompiledTemplate = collections.namedtuple(
+    'CompiledTemplate',
+    ['template_name', 'code', 'static_analysis'],
+)
+
+# instance of StempelWerk in a worker process
+_worker_instance = None
+
+
+def _compile_template(
+    jinja_environment,
+    template_name,
+):
+    import jinja2
+
+    try:
+        source, filename, _ = jinja_environment.loader.get_source(
+            jinja_environment,
+            template_name,
+        )
+
+        # parsing also analyzes the template
+        code = jinja_environment.compile(source, template_name, filename)
+
+    except jinja2.TemplateSyntaxError as err:
+        return SyntaxProblem(template_name, err.lineno, err.message)
+
+    except Exception as err:
+        return SyntaxProblem(template_name, None, repr(err))
+
+    return CompiledTemplate(
+        template_name,
+        # code objects cannot be pickled
+        marshal.dumps(code),
+        jinja_environment.static_analysis.get(template_name),
+    )
+
+
+def _start_worker(
+    settings,
+):
+    from stempelwerk.StempelWerk import StempelWerk
+
+    global _worker_instance
+
+    # custom modules add filters and tests, which Jinja checks while
+    # compiling
+    _worker_instance = StempelWerk(
+        settings,
+        StempelWerk.VERBOSITY_VERY_LOW,
+        show_version=False,
+        _is_render_worker=True,
+    )
+    _worker_instance.create_environment()
+
+
+def _compile_in_worker(
+    template_names,
+):
+    return [
+        _compile_template(_worker_instance.jinja_environment, template_name)
+        for template_name in template_names
+    ]
+
+
+class SyntaxChecker:
+    # Compile all templates and stencils before rendering
+    #
+    # Compiling thousands of templates takes a while, so this is done by
+    # several processes. Templates that compile are stored in the shared
+    # bytecode cache, so they need not be compiled again for rendering.
+    TEMPLATES_PER_TASK = 50
+
+    def __init__(
+        self,
+        settings,
+        jinja_environment,
+        processes=None,
+    ):
+        self.settings = settings
+        self.jinja_environment = jinja_environment
+        self.processes = processes or os.cpu_count() or 1
+
+    def _split(
+        self,
+        template_names,
+    ):
+        return [
+            template_names[index : index + self.TEMPLATES_PER_TASK]
+            for index in range(0, len(template_names), self.TEMPLATES_PER_TASK)
+        ]
+
+    def _compile_all(
+        self,
+        template_names,
+    ):
+        tasks = self._split(template_names)
+        processes = min(self.processes, len(tasks))
+
+        # starting processes does not pay off for a few templates
+        if processes <= 1:
+            return [
+                _compile_template(self.jinja_environment, template_name)
+                for template_name in template_names
+            ]
+
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_start_worker,
+            initargs=(self.settings,),
+        ) as executor:
+            return [
+                result
+                for results in executor.map(_compile_in_worker, tasks)
+                for result in results
+            ]
+
+    def _store(
+        self,
+        compiled_template,
+    ):
+        jinja_environment = self.jinja_environment
+        bytecode_cache = jinja_environment.bytecode_cache
+
+        jinja_environment.static_analysis[compiled_template.template_name] = (
+            compiled_template.static_analysis
+        )
+
+        # compiled code can only be kept in a bytecode cache
+        if bytecode_cache is None:
+            return
+
+        source, filename, _ = jinja_environment.loader.get_source(
+            jinja_environment,
+            compiled_template.template_name,
+        )
+
+        bucket = bytecode_cache.get_bucket(
+            jinja_environment,
+            compiled_template.template_name,
+            filename,
+            source,
+        )
+
+        bucket.code = marshal.loads(compiled_template.code)
+        bytecode_cache.set_bucket(bucket)
+
+    def check(
+        self,
+        template_names,
+    ):
+        problems = []
+
+        for result in self._compile_all(sorted(template_names)):
+            if isinstance(result, SyntaxProblem):
+                problems.append(result)
+            else:
+                self._store(result)
+
+        return problems
@@ -0,0 +1,568 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import contextlib
+import contextvars
+import hashlib
+import json
+
+# attributes of dictionaries shadow keys of the same name in Jinja's attribute
+# lookup ("globals.items"), so accessing them accesses the whole dictionary
+DICT_ATTRIBUTES = frozenset(dir(dict))
+
+# digest of global variables that do not exist
+MISSING_DIGEST = '-'
+
+_MISSING = object()
+
+# name of templates referenced by variables, such as "{% include name %}"
+DYNAMIC_REFERENCE = '*'
+
+
+def serialize_object(
+    value,
+):
+    # objects such as data sources describe their state with a fingerprint
+    fingerprint = getattr(value, 'fingerprint', None)
+
+    if callable(fingerprint):
+        return fingerprint()
+
+    return repr(value)
+
+
+class GlobalsRecorder:
+    def __init__(
+        self,
+    ):
+        # recordings may be nested, such as for cached fragments of templates;
+        # templates rendered concurrently on an event loop run in separate
+        # contexts and do not see each other's recordings
+        self._recordings = contextvars.ContextVar(
+            'recordings',
+            default=(),
+        )
+
+    def record(
+        self,
+        path,
+    ):
+        # only record while a template is being rendered
+        for accessed_paths in self._recordings.get():
+            accessed_paths.add(path)
+
+    @contextlib.contextmanager
+    def recording(
+        self,
+    ):
+        accessed_paths = set()
+        token = self._recordings.set(
+            self._recordings.get() + (accessed_paths,),
+        )
+
+        try:
+            yield accessed_paths
+        finally:
+            self._recordings.reset(token)
+
+
+class TrackedDict(dict):
+    # Dictionary that records which of its keys are accessed
+    #
+    # Templates see a regular dictionary, so filters such as "tojson" keep
+    # working. Nested dictionaries are wrapped up to the tracking depth;
+    # below that depth, any access is recorded as access to the whole value.
+    def __init__(
+        self,
+        data,
+        recorder,
+        path=(),
+        depth=1,
+    ):
+        super().__init__(data)
+
+        self._recorder = recorder
+        self._path = path
+        self._depth = depth
+        self._children = {}
+
+    def _get_tracked(
+        self,
+        key,
+        default,
+    ):
+        path = self._path + (key,)
+        value = super().get(key, default)
+
+        # record access to finer-grained keys further down
+        if isinstance(value, dict) and len(path) < self._depth:
+            child = self._children.get(key)
+
+            if child is None:
+                child = TrackedDict(value, self._recorder, path, self._depth)
+                self._children[key] = child
+
+            return child
+
+        # missing keys are recorded as well; adding them changes the output
+        self._recorder.record(path)
+        return value
+
+    def _record_whole(
+        self,
+    ):
+        self._recorder.record(self._path)
+
+    def __getitem__(
+        self,
+        key,
+    ):
+        value = self._get_tracked(key, _MISSING)
+
+        if value is _MISSING:
+            raise KeyError(key)
+
+        return value
+
+    def get(
+        self,
+        key,
+        default=None,
+    ):
+        return self._get_tracked(key, default)
+
+    def __contains__(
+        self,
+        key,
+    ):
+        self._recorder.record(self._path + (key,))
+        return super().__contains__(key)
+
+    def __iter__(
+        self,
+    ):
+        self._record_whole()
+        return super().__iter__()
+
+    def __len__(
+        self,
+    ):
+        self._record_whole()
+        return super().__len__()
+
+    def keys(
+        self,
+    ):
+        self._record_whole()
+        return super().keys()
+
+    def values(
+        self,
+    ):
+        self._record_whole()
+        return super().values()
+
+    def items(
+        self,
+    ):
+        self._record_whole()
+        return super().items()
+
+    def __repr__(
+        self,
+    ):
+        self._record_whole()
+        return super().__repr__()
+
+
+# ----------------------------------------------------------------------------
+
+
+def _unwind_chain(
+    node,
+    nodes,
+):
+    # collect attribute and item accesses from outermost to innermost
+    entries = []
+    dynamic_arguments = []
+
+    while isinstance(node, (nodes.Getattr, nodes.Getitem)):
+        if isinstance(node, nodes.Getattr):
+            entries.append(('attribute', node.attr))
+        elif isinstance(node.arg, nodes.Const):
+            entries.append(('item', node.arg.value))
+        else:
+            entries.append(('dynamic', None))
+            dynamic_arguments.append(node.arg)
+
+        node = node.node
+
+    return node, entries, dynamic_arguments
+
+
+def _resolve_chain(
+    node,
+    nodes,
+):
+    node, entries, dynamic_arguments = _unwind_chain(node, nodes)
+
+    if not isinstance(node, nodes.Name) or node.name != 'globals':
+        return None
+
+    path = []
+    is_dynamic = False
+
+    for entry_type, entry_value in reversed(entries):
+        if entry_type == 'dynamic':
+            is_dynamic = True
+            break
+
+        # "globals.items()" accesses the whole dictionary
+        if entry_type == 'attribute' and entry_value in DICT_ATTRIBUTES:
+            break
+
+        path.append(entry_value)
+
+    return tuple(path), is_dynamic, dynamic_arguments
+
+
+def _collect_global_paths(
+    node,
+    found_paths,
+    nodes,
+):
+    chain = _resolve_chain(node, nodes)
+
+    if chain is not None:
+        path, is_dynamic, child_nodes = chain
+
+        # keys computed at runtime (such as "globals[key]") are left to
+        # runtime tracking
+        if path or not is_dynamic:
+            found_paths.add(path)
+    elif isinstance(node, nodes.Name) and node.name == 'globals':
+        # "globals" is passed around as a whole
+        found_paths.add(())
+        child_nodes = []
+    else:
+        child_nodes = node.iter_child_nodes()
+
+    for child_node in child_nodes:
+        _collect_global_paths(child_node, found_paths, nodes)
+
+
+def analyze_template(
+    template_ast,
+):
+    from jinja2 import meta, nodes
+
+    global_paths = set()
+    _collect_global_paths(template_ast, global_paths, nodes)
+
+    # dynamically referenced templates ("None") may be any template
+    referenced_templates = {
+        DYNAMIC_REFERENCE if template_name is None else template_name
+        for template_name in meta.find_referenced_templates(template_ast)
+    }
+
+    return global_paths, referenced_templates
+
+
+# ----------------------------------------------------------------------------
+
+
+class GlobalsTracker:
+    STATE_VERSION = 2
+
+    def __init__(
+        self,
+        state_file_path,
+        tracking_depth=1,
+    ):
+        self.state_file_path = state_file_path
+        self.tracking_depth = max(1, tracking_depth)
+        self.recorder = GlobalsRecorder()
+
+        # accesses are only tracked when a partial run may need them
+        self.is_enabled = True
+
+        self._global_namespace = {}
+        self._digests = {}
+
+        self._has_loaded_state = False
+        self._dependencies = self._load_state()
+        self._updated_dependencies = {}
+
+    def _load_state(
+        self,
+    ):
+        try:
+            state = json.loads(self.state_file_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+        if state.get('version') != self.STATE_VERSION:
+            return {}
+
+        self._has_loaded_state = True
+        return state.get('templates', {})
+
+    def has_state(
+        self,
+    ):
+        return self.state_file_path.exists()
+
+    def store_state(
+        self,
+        template_names,
+    ):
+        if not self.is_enabled:
+            return
+
+        dependencies = {}
+
+        # forget about templates that have been deleted
+        for template_name in template_names:
+            if template_name in self._updated_dependencies:
+                template_dependencies = self._updated_dependencies[
+                    template_name
+                ]
+            elif template_name in self._dependencies:
+                template_dependencies = self._dependencies[template_name]
+            else:
+                continue
+
+            # failed templates are kept, so they are rendered again
+            dependencies[template_name] = template_dependencies
+
+        is_unchanged = (
+            self._has_loaded_state and dependencies == self._dependencies
+        )
+
+        self._has_loaded_state = True
+        self._dependencies = dependencies
+        self._updated_dependencies = {}
+
+        if is_unchanged:
+            return
+
+        state = {
+            'version': self.STATE_VERSION,
+            'templates': dependencies,
+        }
+
+        self.state_file_path.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+        self.state_file_path.write_text(
+            json.dumps(state, ensure_ascii=False),
+            encoding='utf-8',
+        )
+
+    def wrap(
+        self,
+        global_namespace,
+    ):
+        self._global_namespace = global_namespace
+        self._digests = {}
+
+        if not self.is_enabled:
+            return global_namespace
+
+        return TrackedDict(
+            global_namespace,
+            self.recorder,
+            depth=self.tracking_depth,
+        )
+
+    def get_digest(
+        self,
+        path,
+    ):
+        if path in self._digests:
+            return self._digests[path]
+
+        value = self._global_namespace
+        for key in path:
+            # items of lists and other values are not tracked separately
+            if not isinstance(value, dict):
+                break
+
+            if key not in value:
+                self._digests[path] = MISSING_DIGEST
+                return MISSING_DIGEST
+
+            value = value[key]
+
+        serialized_value = json.dumps(
+            value,
+            sort_keys=True,
+            default=serialize_object,
+        )
+
+        digest = hashlib.blake2b(
+            serialized_value.encode('utf-8'),
+            digest_size=16,
+        ).hexdigest()
+
+        self._digests[path] = digest
+        return digest
+
+    def _minimize_paths(
+        self,
+        paths,
+    ):
+        paths = {path[: self.tracking_depth] for path in paths}
+
+        # a dependency on a dictionary includes all of its keys
+        return sorted(
+            (
+                path
+                for path in paths
+                if not any(
+                    path[:length] in paths for length in range(len(path))
+                )
+            ),
+            key=repr,
+        )
+
+    def get_dependencies(
+        self,
+        accessed_paths,
+    ):
+        # without tracking, anything may depend on all global variables
+        if not self.is_enabled:
+            return [[[], self.get_digest(())]]
+
+        return [
+            [list(path), self.get_digest(path)]
+            for path in self._minimize_paths(accessed_paths)
+        ]
+
+    def is_current(
+        self,
+        dependencies,
+    ):
+        for path, digest in dependencies:
+            if self.get_digest(tuple(path)) != digest:
+                return False
+
+        return True
+
+    def record(
+        self,
+        template_name,
+        accessed_paths,
+        referenced_templates=(),
+    ):
+        if not self.is_enabled:
+            return
+
+        self._updated_dependencies[template_name] = {
+            'globals': self.get_dependencies(accessed_paths),
+            'templates': sorted(referenced_templates),
+        }
+
+    def forget(
+        self,
+        template_name,
+    ):
+        # templates without dependencies are rendered in every partial run
+        self._updated_dependencies[template_name] = None
+
+    def is_outdated(
+        self,
+        template_name,
+    ):
+        # templates rendered without tracking are judged by their
+        # modification times
+        if template_name not in self._dependencies:
+            return False
+
+        # templates that have failed are rendered again
+        dependencies = self._dependencies[template_name]
+        if dependencies is None:
+            return True
+
+        return not self.is_current(dependencies['globals'])
+
+    def get_referenced_templates(
+        self,
+        template_name,
+    ):
+        dependencies = self._dependencies.get(template_name)
+
+        # templates that have never been rendered successfully
+        if dependencies is None:
+            return None
+
+        return dependencies['templates']
+
+    @staticmethod
+    def get_static_dependencies(
+        static_analysis,
+        template_name,
+    ):
+        global_paths = set()
+        visited_templates = set()
+        pending_templates = [template_name]
+
+        # include global variables accessed by referenced stencils
+        while pending_templates:
+            current_template = pending_templates.pop()
+
+            if current_template in visited_templates:
+                continue
+            visited_templates.add(current_template)
+
+            if current_template not in static_analysis:
+                continue
+
+            paths, referenced_templates = static_analysis[current_template]
+
+            global_paths.update(paths)
+            pending_templates.extend(referenced_templates)
+
+        # stencils used by this template
+        visited_templates.discard(template_name)
+
+        return global_paths, visited_templates
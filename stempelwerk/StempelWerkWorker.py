@@ -0,0 +1,366 @@
+# ----------------------------------------------------------------------------
+#
+#  StempelWerk
+#  ===========
+#  Automatic code generation from Jinja2 templates
+#
+#  Copyright (c) 2020-2026 Martin Zuther (https://www.mzuther.de/)
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+#  INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+#  HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+#  STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+#  OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  Thank you for using free software!
+#
+# ----------------------------------------------------------------------------
+
+import collections
+import datetime
+import multiprocessing
+import traceback
+
+from stempelwerk.StempelWerkErrors import TemplateBudgetExceeded
+from stempelwerk.StempelWerkTracking import GlobalsTracker
+
+try:
+    import resource
+except ImportError:  # pragma: no coverage
+    # memory limits are not supported on Windows
+    resource = None
+
+MEGABYTE = 1024 * 1024
+
+RenderResult = collections.namedtuple(
+    'RenderResult',
+    ['content', 'tagged_files', 'accessed_paths', 'referenced_templates'],
+)
+
+
+class SupervisedRenderer:
+    # Render templates in a separate process with limited time and memory
+    #
+    # A single runaway template (think of a recursive macro that never
+    # terminates) must not stall the whole run. The worker process is
+    # killed when a template exceeds its budget and a new worker is started
+    # for the next template.
+    def __init__(
+        self,
+        settings,
+        verbosity,
+        time_limit=0,
+        memory_limit=0,
+    ):
+        self.settings = settings
+        self.verbosity = verbosity
+
+        # zero disables limit
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+
+        self._process = None
+        self._connection = None
+
+        # backtrace of the last error raised in the worker
+        self.worker_traceback = None
+
+    @staticmethod
+    def is_memory_limit_supported():
+        return resource is not None
+
+    def render(
+        self,
+        template_name,
+    ):
+        self.worker_traceback = None
+
+        if self._process is None:
+            self._start()
+
+        start_of_rendering = datetime.datetime.now()
+        self._connection.send(template_name)
+
+        # a worker that has died closes its connection, so "poll()" returns
+        # immediately and "recv()" raises an error
+        if not self._connection.poll(self.time_limit or None):
+            self._kill()
+
+            raise TemplateBudgetExceeded(
+                template_name,
+                f'exceeded time limit of {self.time_limit} seconds',
+                datetime.datetime.now() - start_of_rendering,
+            )
+
+        try:
+            status, payload = self._connection.recv()
+        except EOFError:
+            status, payload = 'died', None
+
+        running_time = datetime.datetime.now() - start_of_rendering
+
+        if status == 'error':
+            self._raise_error(payload)
+
+        if status == 'memory':
+            self._kill()
+
+            raise TemplateBudgetExceeded(
+                template_name,
+                f'exceeded memory limit of {self.memory_limit} MB',
+                running_time,
+            )
+
+        if status == 'died':
+            self._kill()
+
+            raise TemplateBudgetExceeded(
+                template_name,
+                'crashed the render worker',
+                running_time,
+            )
+
+        return payload
+
+    def _start(
+        self,
+    ):
+        # "spawn" works on all platforms and does not copy the state of
+        # threads, open files, or archives of this process
+        context = multiprocessing.get_context('spawn')
+        self._connection, worker_connection = context.Pipe()
+
+        self._process = context.Process(
+            target=run_worker,
+            args=(
+                worker_connection,
+                self.settings,
+                self.verbosity,
+                self.memory_limit,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+
+        # only the worker may use its end of the pipe
+        worker_connection.close()
+
+        # wait until templates and custom modules have been loaded, so
+        # their loading time does not count towards the time limit
+        try:
+            status, payload = self._connection.recv()
+        except EOFError:
+            status, payload = (
+                'error',
+                (RuntimeError('render worker died'), None),
+            )
+
+        if status == 'error':
+            self._kill()
+            self._raise_error(payload)
+
+    def _raise_error(
+        self,
+        payload,
+    ):
+        err, self.worker_traceback = payload
+        raise err
+
+    def _kill(
+        self,
+    ):
+        self._process.kill()
+        self._process.join()
+        self._connection.close()
+
+        self._process = None
+        self._connection = None
+
+    def close(
+        self,
+    ):
+        if self._process is None:
+            return
+
+        # ask worker to finish, so it can release its resources
+        try:
+            self._connection.send(None)
+            self._process.join(timeout=5)
+        except OSError:  # pragma: no coverage
+            pass
+
+        self._kill()
+
+
+def _set_memory_limit(
+    memory_limit,
+):
+    if resource is None:  # pragma: no coverage
+        return
+
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+
+    if not memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (hard_limit, hard_limit))
+        return
+
+    # limit memory that is allocated in addition to the memory that is
+    # already in use (interpreter, Jinja, compiled templates)
+    try:
+        with open('/proc/self/statm') as statm_file:
+            used_pages = int(statm_file.read().split()[0])
+
+        used_memory = used_pages * resource.getpagesize()
+    except OSError:  # pragma: no coverage
+        used_memory = 0
+
+    soft_limit = used_memory + memory_limit * MEGABYTE
+    if hard_limit != resource.RLIM_INFINITY:  # pragma: no coverage
+        soft_limit = min(soft_limit, hard_limit)
+
+    resource.setrlimit(resource.RLIMIT_AS, (soft_limit, hard_limit))
+
+
+def _send_error(
+    connection,
+    err,
+):
+    # the supervisor shows the full backtrace to simplify debugging
+    # templates
+    formatted_traceback = ''.join(traceback.format_exception(err))
+
+    # not all exceptions can be pickled
+    try:
+        connection.send(('error', (err, formatted_traceback)))
+    except Exception:  # pragma: no coverage
+        connection.send(
+            ('error', (RuntimeError(repr(err)), formatted_traceback)),
+        )
+
+
+def _render_template(
+    connection,
+    instance,
+    global_namespace,
+    template_name,
+    memory_limit,
+):
+    jinja_environment = instance.jinja_environment
+
+    # files created with "{% file name %}" are saved by the supervisor
+    tagged_files = []
+
+    def collect_tagged_file(output_file_name, content):
+        tagged_files.append((output_file_name, content))
+
+    jinja_environment.file_writer = collect_tagged_file
+
+    try:
+        _set_memory_limit(memory_limit)
+
+        jinja_template = jinja_environment.get_template(
+            template_name,
+            globals=global_namespace,
+        )
+
+        with instance.globals_tracker.recorder.recording() as accessed_paths:
+            content = jinja_template.render()
+
+    except MemoryError:
+        _set_memory_limit(0)
+        connection.send(('memory', None))
+        return
+
+    except Exception as err:
+        _set_memory_limit(0)
+        _send_error(connection, err)
+        return
+
+    _set_memory_limit(0)
+
+    static_paths, referenced_templates = (
+        GlobalsTracker.get_static_dependencies(
+            jinja_environment.static_analysis,
+            template_name,
+        )
+    )
+
+    render_result = RenderResult(
+        content,
+        tagged_files,
+        accessed_paths | static_paths,
+        referenced_templates,
+    )
+
+    connection.send(('done', render_result))
+
+
+def run_worker(
+    connection,
+    settings,
+    verbosity,
+    memory_limit,
+):
+    from stempelwerk.StempelWerk import StempelWerk
+
+    try:
+        instance = StempelWerk(
+            settings,
+            verbosity,
+            show_version=False,
+            _is_render_worker=True,
+        )
+        instance.create_environment()
+
+        # global variables have been prepared by the supervisor
+        global_namespace = instance.globals_tracker.wrap(
+            settings.global_namespace
+        )
+        global_namespace = {'globals': global_namespace}
+
+    except Exception as err:
+        _send_error(connection, err)
+        return
+
+    connection.send(('ready', None))
+
+    while True:
+        try:
+            template_name = connection.recv()
+        except EOFError:  # pragma: no coverage
+            break
+
+        # supervisor has finished
+        if template_name is None:
+            break
+
+        _render_template(
+            connection,
+            instance,
+            global_namespace,
+            template_name,
+            memory_limit,
+        )
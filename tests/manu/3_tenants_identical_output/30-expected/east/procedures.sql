@@ -0,0 +1,2 @@
+CREATE PROCEDURE cleanup AS
+  DELETE FROM sessions WHERE expired = 1;
@@ -7,10 +7,40 @@
 # names, but all personality traits have been made up. I hope they have as much
 # fun reading these tests as I had in writing them!
 
+import errno
+import hashlib
+import json
+import os
 import pathlib
+import shutil
+import socket
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import zipfile
 
 import pytest
 
+from stempelwerk.StempelWerk import StempelWerk, main_cli
+from stempelwerk.StempelWerkCoordinator import (
+    AUTHKEY_VARIABLE,
+    RenderCoordinator,
+    connect_to_coordinator,
+)
+from stempelwerk.StempelWerkEnvironment import shared_bytecode_cache
+from stempelwerk.StempelWerkErrors import (
+    ConfigurationError,
+    MissingDirectoryError,
+    MissingTemplatesError,
+    OutputError,
+    StempelWerkError,
+)
+from stempelwerk.StempelWerkOutputStore import OutputStore
+from stempelwerk.StempelWerkProgress import ProgressReporter, TemplateTimings
+from stempelwerk.StempelWerkWorker import RenderResult
+
 from .common import TestCommon
 
 FIXTURE_DIR = pathlib.Path('tests') / 'manu'
@@ -40,21 +70,16 @@ class TestManu(TestCommon):
     # file. Thankfully, she gets another error message.
     def test_error_on_missing_config_2(
         self,
-        capsys,
     ):
-        with pytest.raises(SystemExit):
+        with pytest.raises(ConfigurationError, match='not found'):
             self.run(
                 './settings.json',
             )
 
-        captured = capsys.readouterr()
-        assert 'not found' in captured.out
-
     # After creating a config file, Manu is impressed that StempelWerk helps
     # her by pointing out that the template directory is missing.
     def test_error_on_missing_template_directory(
         self,
-        capsys,
         tmp_path,
     ):
         custom_config = {}
@@ -68,21 +93,20 @@ class TestManu(TestCommon):
             config_path,
         )
 
-        with pytest.raises(SystemExit):
+        with pytest.raises(MissingDirectoryError) as exception_info:
             self.run(
                 config_path,
                 autocreate_main_directories=False,
             )
 
-        captured = capsys.readouterr()
-        assert 'does not exist' in captured.out
-        assert 'template directory' in captured.out
+        error_message = str(exception_info.value)
+        assert 'does not exist' in error_message
+        assert 'template directory' in error_message
 
     # She joyfully creates the template directory. In turn, StempelWerk
     # notifies her that she also has to create the output directory.
     def test_error_on_missing_output_directory(
         self,
-        capsys,
         tmp_path,
     ):
         custom_config = {}
@@ -100,15 +124,49 @@ class TestManu(TestCommon):
         template_path = config_dir_path / config['template_dir']
         template_path.mkdir()
 
-        with pytest.raises(SystemExit):
+        with pytest.raises(MissingDirectoryError) as exception_info:
             self.run(
                 config_path,
                 autocreate_main_directories=False,
             )
 
+        error_message = str(exception_info.value)
+        assert 'does not exist' in error_message
+        assert 'output directory' in error_message
+
+    # Manu's shell scripts check exit codes. She is happy to find out that
+    # each kind of error has its own exit code on the command line.
+    def test_error_exit_codes(
+        self,
+        capsys,
+        monkeypatch,
+        tmp_path,
+    ):
+        custom_config = {}
+
+        config_path = tmp_path / 'settings.json'
+        _ = self.create_config(
+            custom_config,
+            config_path,
+        )
+
+        monkeypatch.setattr(sys, 'argv', ['stempelwerk', str(config_path)])
+
+        with pytest.raises(SystemExit) as exception_info:
+            main_cli()
+
+        assert exception_info.value.code == MissingDirectoryError.exit_code
+
         captured = capsys.readouterr()
-        assert 'does not exist' in captured.out
-        assert 'output directory' in captured.out
+        assert 'ERROR: template directory' in captured.out
+
+        # broken settings file
+        config_path.write_text('{')
+
+        with pytest.raises(SystemExit) as exception_info:
+            main_cli()
+
+        assert exception_info.value.code == ConfigurationError.exit_code
 
     # Manu is pleased that she is able to concentrate on the task and does not
     # have to provide any templates.
@@ -127,7 +185,7 @@ class TestManu(TestCommon):
         )
 
         # check that StempelWerk runs without any templates
-        with self.does_not_raise(SystemExit):
+        with self.does_not_raise(StempelWerkError):
             _ = self.run(
                 config_path,
             )
@@ -155,7 +213,7 @@ class TestManu(TestCommon):
         )
 
         # check that StempelWerk runs without any templates
-        with self.does_not_raise(SystemExit):
+        with self.does_not_raise(StempelWerkError):
             _ = self.run(
                 config_path,
             )
@@ -182,7 +240,7 @@ class TestManu(TestCommon):
         )
 
         # check that StempelWerk runs without any templates
-        with self.does_not_raise(SystemExit):
+        with self.does_not_raise(StempelWerkError):
             _ = self.run(
                 config_path,
             )
@@ -274,7 +332,7 @@ class TestManu(TestCommon):
         custom_config = {}
 
         config_path = datafiles / 'settings.json'
-        with pytest.raises(SystemExit):
+        with pytest.raises(OutputError):
             self.run_and_compare(
                 custom_config,
                 config_path,
@@ -316,7 +374,7 @@ class TestManu(TestCommon):
         }
 
         config_path = datafiles / 'settings.json'
-        with pytest.raises(SystemExit):
+        with pytest.raises(MissingTemplatesError):
             self.run_and_compare(
                 custom_config,
                 config_path,
@@ -371,7 +429,7 @@ class TestManu(TestCommon):
         custom_config = {}
 
         config_path = datafiles / 'settings.json'
-        with pytest.raises(SystemExit):
+        with pytest.raises(MissingDirectoryError):
             self.run_and_compare(
                 custom_config,
                 config_path,
@@ -463,6 +521,296 @@ class TestManu(TestCommon):
             run_results['configuration'],
         )
 
+    # Back to ManuTalk: instead of changing file separators, Manu wraps each
+    # output file in a file block. Its contents are saved as they are, so
+    # separators in her code no longer matter. Old templates keep working.
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_template_9_file_tag')
+    def test_render_file_tag(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'create_directories': True,
+        }
+
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        assert run_results['processed_templates'] == 1
+        assert run_results['saved_files'] == 4
+
+    # Manu's CI pipeline runs on a slow network file system and deploys
+    # generated files straight from an archive. She checks that archives
+    # contain the same files as the output directory, newlines and all.
+    @pytest.mark.parametrize(
+        'archive_name',
+        [
+            'output.tar',
+            'output.tar.gz',
+            'output.zip',
+        ],
+    )
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_template_8_file_endings')
+    def test_render_into_archive(
+        self,
+        archive_name,
+        datafiles,
+    ):
+        custom_config = {
+            'newline': '\n',
+            'output_archive': archive_name,
+        }
+
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_with_config(
+            custom_config,
+            config_path,
+        )
+        assert run_results['saved_files'] == 2
+
+        # output directory is not touched
+        assert not list((datafiles / '20-output').iterdir())
+
+        archive_path = datafiles / archive_name
+        expected_dir = datafiles / '30-expected'
+
+        if archive_name.endswith('.zip'):
+            with zipfile.ZipFile(archive_path) as archive:
+                archived_files = {
+                    member_name: archive.read(member_name)
+                    for member_name in archive.namelist()
+                }
+        else:
+            with tarfile.open(archive_path) as archive:
+                archived_files = {
+                    member.name: archive.extractfile(member).read()
+                    for member in archive.getmembers()
+                }
+
+        expected_files = {
+            expected_path.relative_to(expected_dir).as_posix(): (
+                expected_path.read_bytes()
+            )
+            for expected_path in expected_dir.rglob('*')
+            if expected_path.is_file()
+        }
+
+        assert archived_files == expected_files
+
+    # Manu renders the same templates for dozens of tenants, and most of
+    # their files are identical. She asks StempelWerk to write every file
+    # only once and link the rest.
+    @pytest.mark.datafiles(FIXTURE_DIR / '3_tenants_identical_output')
+    def test_deduplicate_output(
+        self,
+        datafiles,
+        monkeypatch,
+    ):
+        custom_config = {
+            'create_directories': True,
+            'deduplicate_output': True,
+        }
+
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+        assert run_results['saved_files'] == 6
+
+        # procedures are stored once, tenant names three times
+        output_store = run_results['instance'].output_store
+        statistics = output_store.statistics
+        assert statistics['stored'] == 4
+
+        linked_files = sum(
+            statistics[method] for method in ('reflink', 'hardlink', 'copy')
+        )
+        assert linked_files == 6
+
+        output_dir = datafiles / '20-output'
+        if statistics['hardlink']:
+            assert os.path.samefile(
+                output_dir / 'east/procedures.sql',
+                output_dir / 'south/procedures.sql',
+            )
+
+        # modifying a linked file leaves the other ones alone
+        output_store.write(output_dir / 'north/procedures.sql', b'DROP ALL;')
+        assert (output_dir / 'north/procedures.sql').read_bytes() == (
+            b'DROP ALL;'
+        )
+        assert b'DELETE' in (output_dir / 'south/procedures.sql').read_bytes()
+
+        # files edited in place are written again, and so are the stored
+        # objects they share with other output files
+        with (output_dir / 'south/procedures.sql').open('r+b') as file:
+            file.write(b'--')
+
+        self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        # runs without deduplication do not write into stored objects
+        template_path = datafiles / '10-templates/tenants.jinja'
+        template = template_path.read_text()
+        template_path.write_text(template.replace('expired', 'idle'))
+
+        self.run_with_config(
+            {
+                'create_directories': True,
+            },
+            config_path,
+        )
+        assert b'idle' in (output_dir / 'east/procedures.sql').read_bytes()
+
+        store_dir = datafiles / '.stempelwerk_cache/outputs'
+        for object_path in store_dir.glob('*/*'):
+            digest = hashlib.blake2b(
+                object_path.read_bytes(),
+                digest_size=20,
+            ).hexdigest()
+            assert digest == object_path.name
+
+        template_path.write_text(template)
+
+        # objects that are no longer used are removed
+        stale_object_path = datafiles / '.stempelwerk_cache/outputs/00/00'
+        stale_object_path.parent.mkdir()
+        stale_object_path.write_text('stale')
+
+        # fall back to copies when the file system cannot link files
+        shutil.rmtree(output_dir)
+        output_dir.mkdir()
+
+        def refuse_to_link(
+            *args,
+        ):
+            raise OSError(errno.EXDEV, 'cross-device link')
+
+        monkeypatch.setattr(
+            'stempelwerk.StempelWerkOutputStore.clone_file',
+            refuse_to_link,
+        )
+        monkeypatch.setattr(os, 'link', refuse_to_link)
+
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        output_store = run_results['instance'].output_store
+        assert output_store.methods == []
+        assert output_store.statistics['copy'] == 6
+        assert output_store.statistics['stored'] == 0
+
+        store_dir = datafiles / '.stempelwerk_cache/outputs'
+        assert len(list(store_dir.glob('*/*'))) == 4
+        assert not stale_object_path.exists()
+        assert not os.path.samefile(
+            output_dir / 'east/procedures.sql',
+            output_dir / 'south/procedures.sql',
+        )
+
+    # Manu's laptop clones files with reflinks, which are separate files that
+    # share their data. Unchanged output files must keep their timestamps,
+    # and stored objects are not read on every write.
+    def test_deduplicate_output_reflinks(
+        self,
+        tmp_path,
+        monkeypatch,
+    ):
+        def clone_by_copying(
+            source_path,
+            target_path,
+        ):
+            shutil.copyfile(source_path, target_path)
+
+        monkeypatch.setattr(
+            'stempelwerk.StempelWerkOutputStore.clone_file',
+            clone_by_copying,
+        )
+
+        store_dir = tmp_path / 'outputs'
+        output_path = tmp_path / 'procedures.sql'
+        output_data = b'DELETE FROM tenants WHERE expired;'
+
+        output_store = OutputStore(store_dir)
+        assert output_store.write(output_path, output_data) == 'reflink'
+        output_store.prune()
+
+        output_stats = output_path.stat()
+
+        read_paths = []
+        original_read_bytes = pathlib.Path.read_bytes
+
+        def record_read_bytes(
+            path,
+        ):
+            read_paths.append(path)
+            return original_read_bytes(path)
+
+        monkeypatch.setattr(pathlib.Path, 'read_bytes', record_read_bytes)
+
+        # identical output files are left alone in later runs
+        output_store = OutputStore(store_dir)
+        assert output_store.write(output_path, output_data) == 'unchanged'
+        assert output_path.stat().st_ino == output_stats.st_ino
+        assert output_path.stat().st_mtime_ns == output_stats.st_mtime_ns
+
+        # stored objects are known to be intact, only the output is read
+        assert read_paths == [output_path]
+
+        # modified output files are cloned again
+        output_path.write_bytes(b'DROP ALL;')
+
+        assert output_store.write(output_path, output_data) == 'reflink'
+        assert output_path.read_bytes() == output_data
+
+    # Manu finds that changing newlines in code is cumbersome, so she moves
+    # the exceptions to her settings. While she's at it, she makes a legacy
+    # tool happy by encoding its batch files in UTF-16.
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_template_8_file_endings')
+    def test_render_file_endings_3(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'create_directories': True,
+            # invert logic
+            'newline': '\r\n',
+            'output_formats': {
+                '.txt': {
+                    'newline': '\n',
+                },
+            },
+        }
+
+        config_path = datafiles / 'settings.json'
+        self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        custom_config['output_formats']['.bat'] = {
+            'encoding': 'utf-16',
+        }
+
+        self.run_with_config(
+            custom_config,
+            config_path,
+        )
+
+        expected_path = datafiles / '30-expected/cd.bat'
+        output_path = datafiles / '20-output/cd.bat'
+
+        expected_content = expected_path.read_bytes().decode('utf-8')
+        assert output_path.read_bytes().decode('utf-16') == expected_content
+
     # After playing around with a single template, Manu is excited that
     # StempelWerk can process multiple templates. In a single run!!!
     @pytest.mark.datafiles(FIXTURE_DIR / '2_templates_1_no_stencil')
@@ -494,3 +842,455 @@ class TestManu(TestCommon):
             custom_config,
             config_path,
         )
+
+    # Manu's team maintains several projects. Starting StempelWerk for each of
+    # them takes longer than rendering their templates, so she passes all
+    # settings files at once. Templates the projects have in common are only
+    # compiled once.
+    @pytest.mark.datafiles(FIXTURE_DIR / '2_templates_2_with_stencil')
+    def test_render_multiple_projects(
+        self,
+        capsys,
+        datafiles,
+    ):
+        config_paths = self.create_projects(datafiles)
+
+        command_line_arguments = ['StempelWerk.py']
+        command_line_arguments.extend(
+            str(config_path) for config_path in config_paths
+        )
+
+        parsed_args = StempelWerk.CommandLineParser(command_line_arguments)
+        assert len(parsed_args.all_settings) == 2
+        assert parsed_args.settings is parsed_args.all_settings[0]
+
+        hits_before = shared_bytecode_cache.hits
+        run_results = StempelWerk.render_projects(parsed_args.all_settings)
+
+        # second project re-uses two templates and one stencil
+        assert shared_bytecode_cache.hits - hits_before >= 3
+
+        assert run_results['processed_templates'] == 4
+        assert run_results['saved_files'] == 4
+        assert len(run_results['projects']) == 2
+
+        for config_path in config_paths:
+            config = json.loads(config_path.read_text())
+            self.compare_directories(config)
+
+        captured = capsys.readouterr()
+        assert (
+            'ALL PROJECTS: 2 projects, 4 templates => 4 files' in captured.out
+        )
+
+        # render workers only know a single project
+        for worker_argument in ['--coordinate', '--worker']:
+            with pytest.raises(SystemExit) as exception_info:
+                StempelWerk.CommandLineParser(
+                    [
+                        *command_line_arguments,
+                        worker_argument,
+                        '127.0.0.1:4711',
+                    ]
+                )
+
+            assert exception_info.value.code == 2
+
+        captured = capsys.readouterr()
+        assert 'only support a single project' in captured.err
+
+    # Typing all settings files is tedious, so Manu lists them in a workspace
+    # file instead.
+    @pytest.mark.datafiles(FIXTURE_DIR / '2_templates_2_with_stencil')
+    def test_render_workspace(
+        self,
+        datafiles,
+    ):
+        config_paths = self.create_projects(datafiles)
+
+        # paths are relative to the workspace file
+        workspace_path = datafiles / 'workspace.json'
+        workspace = {
+            'settings_files': [
+                config_path.name for config_path in config_paths
+            ],
+        }
+        workspace_path.write_text(json.dumps(workspace))
+
+        command_line_arguments = [
+            'StempelWerk.py',
+            '--workspace',
+            str(workspace_path),
+        ]
+
+        parsed_args = StempelWerk.CommandLineParser(command_line_arguments)
+        assert parsed_args.settings_file_paths == config_paths
+
+        run_results = StempelWerk.render_projects(parsed_args.all_settings)
+        assert run_results['processed_templates'] == 4
+
+        for config_path in config_paths:
+            config = json.loads(config_path.read_text())
+            self.compare_directories(config)
+
+    # Manu's CI server chokes on long logs. She asks StempelWerk to only
+    # summarize what it does on the console and to write the details into a
+    # log file that her scripts can parse.
+    @pytest.mark.datafiles(FIXTURE_DIR / '2_templates_2_with_stencil')
+    def test_structured_log(
+        self,
+        capsys,
+        datafiles,
+    ):
+        config_paths = self.create_projects(datafiles)
+        log_path = datafiles / 'log.jsonl'
+
+        parsed_args = StempelWerk.CommandLineParser(
+            [
+                'StempelWerk.py',
+                '--log-json',
+                str(log_path),
+                '--summarize',
+                '3600',
+                '--log-thread',
+                *[str(config_path) for config_path in config_paths],
+            ]
+        )
+
+        run_results = StempelWerk.render_projects(
+            parsed_args.all_settings,
+            printer=parsed_args.printer,
+        )
+        assert run_results['saved_files'] == 4
+
+        parsed_args.printer.close()
+
+        # single templates and files are not listed on the console
+        captured = capsys.readouterr()
+        assert 'ab.jinja' not in captured.out
+        assert 'ALL PROJECTS: 2 projects' in captured.out
+
+        log_entries = [
+            json.loads(line) for line in log_path.read_text().splitlines()
+        ]
+
+        rendered_templates = [
+            log_entry['template']
+            for log_entry in log_entries
+            if 'template' in log_entry
+        ]
+        assert rendered_templates == [
+            'ab.jinja',
+            'cd.jinja',
+            'ab.jinja',
+            'cd.jinja',
+        ]
+
+        saved_files = [
+            log_entry['file']
+            for log_entry in log_entries
+            if 'file' in log_entry
+        ]
+        assert saved_files == ['ab.txt', 'cd.txt', 'ab.txt', 'cd.txt']
+
+        # log file contains no blank lines
+        assert all(log_entry['message'] for log_entry in log_entries)
+        assert log_entries[-1]['level'] == 'NOTICE'
+
+    # One of Manu's templates takes minutes to render. Messages written before
+    # it started must not wait in the buffer until it is done.
+    def test_log_flush_interval(
+        self,
+        capsys,
+    ):
+        printer = StempelWerk.LinePrinter(StempelWerk.VERBOSITY_NORMAL)
+        printer.detail('slow.jinja')
+
+        captured = capsys.readouterr()
+        assert 'slow.jinja' not in captured.out
+
+        # no further messages arrive, but the buffer is written anyway
+        time.sleep(1.5)
+
+        captured = capsys.readouterr()
+        assert 'slow.jinja\n' in captured.out
+
+        printer.close()
+
+    # A full run of Manu's project takes forty minutes. She wants to know
+    # whether it is on track, so she asks StempelWerk to show its progress.
+    @pytest.mark.datafiles(FIXTURE_DIR / '2_templates_2_with_stencil')
+    def test_progress(
+        self,
+        capsys,
+        datafiles,
+        monkeypatch,
+    ):
+        config_paths = self.create_projects(datafiles)
+
+        parsed_args = StempelWerk.CommandLineParser(
+            [
+                'StempelWerk.py',
+                '--progress',
+                str(config_paths[0]),
+            ]
+        )
+        assert parsed_args.show_progress
+
+        # the status line is updated in place on a terminal
+        monkeypatch.setattr(sys.stdout, 'isatty', lambda: True)
+
+        StempelWerk.render_projects(
+            parsed_args.all_settings,
+            printer=parsed_args.printer,
+            show_progress=parsed_args.show_progress,
+        )
+        parsed_args.printer.close()
+
+        captured = capsys.readouterr()
+        assert '\r\x1b[K' in captured.out
+        assert '[100%] 2/2 templates' in captured.out
+        assert 'ETA 0:00:00' in captured.out
+
+        # timings of templates are kept to estimate the next run
+        timings = json.loads(
+            (
+                datafiles / '.stempelwerk_cache' / 'template_timings.json'
+            ).read_text()
+        )
+        assert sorted(timings['templates']) == ['ab.jinja', 'cd.jinja']
+
+        # CI logs get plain summary lines instead
+        monkeypatch.setattr(sys.stdout, 'isatty', lambda: False)
+
+        StempelWerk.render_projects(
+            parsed_args.all_settings,
+            show_progress=True,
+        )
+
+        captured = capsys.readouterr()
+        assert '\x1b[K' not in captured.out
+        assert '[100%] 2/2 templates' in captured.out
+
+    # Manu's biggest project has 100,000 templates. Estimating the remaining
+    # time must not slow down rendering, and neither must the status line.
+    def test_progress_estimate(
+        self,
+        tmp_path,
+    ):
+        class StatusRecorder:
+            def __init__(
+                self,
+            ):
+                self.status_lines = []
+
+            def status(
+                self,
+                message,
+            ):
+                self.status_lines.append(message)
+
+        timings = TemplateTimings(tmp_path / 'template_timings.json')
+        timings.timings = {
+            'a.jinja': 4.0,
+            'b.jinja': 2.0,
+        }
+
+        printer = StatusRecorder()
+        progress_reporter = ProgressReporter(
+            printer,
+            ['a.jinja', 'b.jinja', 'c.jinja'],
+            timings,
+            is_interactive=True,
+        )
+
+        # templates without history take as long as the average template
+        now = time.monotonic()
+        assert progress_reporter.estimate_remaining_time(now) == 9.0
+
+        # "a.jinja" has just become much faster
+        progress_reporter.finish_template('a.jinja', 1, 10)
+        estimate = progress_reporter.estimate_remaining_time(now)
+        assert estimate == pytest.approx(3.0, abs=0.01)
+
+        # the status line is redrawn at most ten times per second
+        progress_reporter.finish_template('b.jinja', 1, 10)
+        assert len(printer.status_lines) == 1
+
+        progress_reporter.finish_template('c.jinja', 1, 10)
+        assert progress_reporter.estimate_remaining_time(now) == 0.0
+
+    # Manu's build nodes sit idle while one of them renders the slowest
+    # templates. She lets all of them pull templates from a coordinator
+    # instead, starting with a few workers on her laptop.
+    @pytest.mark.datafiles(FIXTURE_DIR / '4_distributed_rendering')
+    def test_coordinated_rendering(
+        self,
+        datafiles,
+        monkeypatch,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'track_globals': True,
+        }
+
+        global_namespace = json.dumps(
+            {
+                'company': 'Bricks & Mortar',
+                'motto': 'Build once, deploy everywhere.',
+            }
+        )
+
+        config_path = datafiles / 'settings.json'
+        self.create_config(
+            custom_config,
+            config_path,
+        )
+
+        instance, parsed_args = self.init_stempelwerk(
+            config_path,
+            global_namespace,
+        )
+
+        # the operating system picks a free port
+        run_results = instance.render_all_templates(
+            coordinator_address='127.0.0.1:0',
+            local_workers=2,
+        )
+        assert run_results['processed_templates'] == 7
+        assert run_results['saved_files'] == 7
+
+        self.compare_directories(json.loads(config_path.read_text()))
+
+        # every template has been rendered by one of the workers
+        assert sum(instance.render_workers.values()) == 7
+        assert len(instance.render_workers) <= 2
+
+        # clients that stall during the handshake do not keep workers out,
+        # and templates of workers that hang are handed to other workers
+        monkeypatch.setattr(RenderCoordinator, 'ITEM_TIMEOUT', 1.0)
+        coordinator = RenderCoordinator(
+            '127.0.0.1:0',
+            instance.settings,
+            instance.verbosity,
+            authkey=b'open sesame',
+        )
+
+        host, _, port = coordinator.address.rpartition(':')
+        stalled_client = socket.create_connection((host, int(port)))
+
+        hung_worker = connect_to_coordinator(
+            coordinator.address,
+            b'open sesame',
+        )
+
+        render_results = []
+
+        def collect_render_result(
+            template_names,
+        ):
+            render_results.extend(coordinator.render_all(template_names))
+
+        collector = threading.Thread(
+            target=collect_render_result,
+            args=(['amber.jinja'],),
+        )
+
+        try:
+            hung_worker.send('hung worker')
+            hung_worker.recv()
+            hung_worker.send(('ready', None))
+
+            collector.start()
+            assert hung_worker.recv() == 'amber.jinja'
+
+            with connect_to_coordinator(
+                coordinator.address,
+                b'open sesame',
+            ) as healthy_worker:
+                healthy_worker.send('healthy worker')
+                healthy_worker.recv()
+                healthy_worker.send(('ready', None))
+
+                template_name = healthy_worker.recv()
+                healthy_worker.send(
+                    ('done', RenderResult(template_name, [], set(), [])),
+                )
+
+                # no templates are left
+                assert healthy_worker.recv() is None
+
+            collector.join(timeout=30)
+        finally:
+            stalled_client.close()
+            hung_worker.close()
+            coordinator.close()
+
+        assert [result.content for result in render_results] == ['amber.jinja']
+        assert coordinator.rendered_templates == {'healthy worker': 1}
+
+        # workers report accessed global variables and used stencils
+        globals_tracker = instance.globals_tracker
+        assert not globals_tracker.is_outdated('amber.jinja')
+        assert globals_tracker.get_referenced_templates('amber.jinja') == [
+            'stencils/greeting.jinja'
+        ]
+
+        # workers on other hosts share a key with the coordinator and may
+        # be started first
+        monkeypatch.setenv(AUTHKEY_VARIABLE, 'open sesame')
+        socket_path = datafiles / 'coordinator.sock'
+
+        worker_process = subprocess.Popen(
+            [
+                sys.executable,
+                '-m',
+                'stempelwerk.StempelWerk',
+                '--worker',
+                str(socket_path),
+                str(config_path),
+            ],
+        )
+
+        try:
+            instance, _ = self.init_stempelwerk(
+                config_path,
+                global_namespace,
+            )
+
+            run_results = instance.render_all_templates(
+                coordinator_address=str(socket_path),
+            )
+        finally:
+            worker_process.wait(timeout=30)
+
+        assert worker_process.returncode == 0
+        assert run_results['saved_files'] == 7
+        assert list(instance.render_workers.values()) == [7]
+
+        self.compare_directories(json.loads(config_path.read_text()))
+
+    def create_projects(
+        self,
+        datafiles,
+    ):
+        config_paths = []
+
+        # both projects render the same templates into different directories
+        for output_dir in ['20-output', '21-output']:
+            custom_config = {
+                'output_dir': output_dir,
+                'stencil_dir_name': 'stencils',
+                'last_run_file': f'.last_run_{output_dir}',
+            }
+
+            config_path = datafiles / f'settings_{output_dir}.json'
+            self.create_config(
+                custom_config,
+                config_path,
+            )
+
+            (datafiles / output_dir).mkdir()
+            config_paths.append(config_path)
+
+        return config_paths
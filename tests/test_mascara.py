@@ -7,11 +7,32 @@
 # names, but all personality traits have been made up. I hope they have as much
 # fun reading these tests as I had in writing them!
 
+import contextlib
+import json
+import multiprocessing
+import os
 import pathlib
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import tracemalloc
 
 import jinja2
 import pytest
 
+from stempelwerk.StempelWerk import StempelWerk, main_cli
+from stempelwerk.StempelWerkEnvironment import shared_bytecode_cache
+from stempelwerk.StempelWerkErrors import (
+    ChangeDetectionError,
+    ConfigurationError,
+    RenderingError,
+    SyntaxCheckError,
+    TemplateBudgetExceeded,
+)
+from stempelwerk.StempelWerkSyntax import SyntaxChecker
+
 from .common import TestCommon
 
 FIXTURE_DIR = pathlib.Path('tests') / 'mascara'
@@ -24,9 +45,11 @@ class TestMascara(TestCommon):
         config_path,
         process_only_modified,
         must_match,
+        global_namespace=None,
     ):
         run_results = self.run(
             config_path,
+            global_namespace=global_namespace,
             process_only_modified=process_only_modified,
         )
 
@@ -245,6 +268,241 @@ class TestMascara(TestCommon):
         )
         assert run_results['saved_files'] == 1
 
+    # Mascara's templates live on a slow network share. She lets StempelWerk
+    # keep an index of the template directory and checks that unchanged
+    # directories are not listed again, while new templates are still found.
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_process_only_modified_1')
+    def test_directory_index(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'cache_directory_index': True,
+        }
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        config = run_results['configuration']
+        directory_index = run_results['instance'].directory_index
+        assert directory_index.listed_directories == 2
+        assert run_results['saved_files'] == 2
+
+        # directories modified shortly before a run are never trusted, so
+        # pretend that all templates are old
+        template_dir = datafiles / '10-templates'
+        self.backdate(template_dir)
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=False,
+            must_match=True,
+        )
+
+        # timestamps of directories have changed
+        directory_index = run_results['instance'].directory_index
+        assert directory_index.listed_directories == 2
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=False,
+            must_match=True,
+        )
+
+        # stencils are found without listing any directory
+        instance = run_results['instance']
+        assert instance.directory_index.listed_directories == 0
+        assert instance.directory_index.cached_directories == 2
+        assert instance._get_stencils(instance._get_templates())
+
+        # partial run still finds modified templates
+        template_path = template_dir / 'cd.jinja'
+        template_path.write_text(template_path.read_text())
+        os.utime(template_dir, (0, 0))
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+        )
+        assert run_results['processed_templates'] == 1
+        assert run_results['instance'].directory_index.listed_directories == 0
+
+        self.backdate(template_dir)
+
+        # adding a template lists its directory again
+        shutil.copyfile(template_dir / 'ab.jinja', template_dir / 'ef.jinja')
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+        )
+        assert run_results['processed_templates'] == 1
+        assert run_results['instance'].directory_index.listed_directories == 1
+
+    # Mascara's CI pipeline starts from a fresh clone, so timestamps are
+    # useless. She asks git which templates and stencils have changed.
+    @pytest.mark.skipif(
+        shutil.which('git') is None,
+        reason='git is not installed',
+    )
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_process_only_modified_1')
+    def test_process_changed_in_git(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+        }
+
+        def git(*arguments):
+            subprocess.run(
+                ['git', '-C', str(datafiles), *arguments],
+                check=True,
+                capture_output=True,
+            )
+
+        git('init', '--initial-branch', 'main')
+        git('config', 'user.name', 'Mascara')
+        git('config', 'user.email', 'mascara@example.com')
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        git('add', '--all')
+        git('commit', '--message', 'Initial commit')
+        git('switch', '--create', 'feature')
+
+        instance = run_results['instance']
+
+        # nothing has changed
+        run_results = instance.render_all_templates(changed_since='HEAD')
+        assert run_results['processed_templates'] == 0
+
+        # uncommitted changes of templates
+        template_path = datafiles / '10-templates/cd.jinja'
+        template_path.write_text(template_path.read_text() + '\n')
+
+        parsed_args = StempelWerk.CommandLineParser(
+            ['StempelWerk.py', '--changed', str(config_path)],
+        )
+        assert parsed_args.changed_since == 'HEAD'
+
+        run_results = instance.render_all_templates(
+            changed_since=parsed_args.changed_since,
+        )
+        assert run_results['processed_templates'] == 1
+
+        # committed changes of stencils affect all templates using them
+        git('commit', '--all', '--message', 'Update template')
+
+        stencil_path = datafiles / '10-templates/stencils/common.jinja'
+        stencil_path.write_text(stencil_path.read_text() + '\n')
+        git('commit', '--all', '--message', 'Update stencil')
+
+        run_results = instance.render_all_templates(changed_since='HEAD')
+        assert run_results['processed_templates'] == 0
+
+        run_results = instance.render_all_templates(changed_since='HEAD~1')
+        assert run_results['processed_templates'] == 2
+
+        # pull request sees all changes since branching off
+        run_results = instance.render_all_templates(changed_since='main')
+        assert run_results['processed_templates'] == 2
+
+        # unknown references are reported
+        with pytest.raises(ChangeDetectionError):
+            instance.render_all_templates(changed_since='no-such-branch')
+
+        # fresh clones have no cache directory; stencils used by templates
+        # are found in their code
+        shutil.rmtree(datafiles / '.stempelwerk_cache')
+
+        template_path.write_text(template_path.read_text() + '\n')
+
+        instance, _ = self.init_stempelwerk(config_path)
+        run_results = instance.render_all_templates(changed_since='HEAD')
+        assert run_results['processed_templates'] == 1
+
+        shutil.rmtree(datafiles / '.stempelwerk_cache')
+
+        instance, _ = self.init_stempelwerk(config_path)
+        run_results = instance.render_all_templates(changed_since='HEAD~1')
+        assert run_results['processed_templates'] == 2
+
+    def backdate(
+        self,
+        directory,
+    ):
+        for path in [directory, *directory.rglob('*')]:
+            os.utime(path, (0, 0))
+
+    # Mascara also heard that StempelWerk is meant to be used in pre-commit
+    # hooks. She checks that a partial run without any modified templates
+    # does not even bother to load Jinja or features she has not enabled.
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_process_only_modified_1')
+    def test_lean_startup(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+        }
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+        assert run_results['saved_files'] == 2
+
+        # run command line in a fresh interpreter
+        script = """
+import sys
+
+import stempelwerk.StempelWerk as module
+
+heavy_modules = ['argparse', 'herkules', 'jinja2']
+assert not [name for name in heavy_modules if name in sys.modules]
+
+sys.argv = ['stempelwerk', '--only-modified', sys.argv[1]]
+module.main_cli()
+
+assert 'jinja2' not in sys.modules
+
+# features that have not been enabled are not loaded either
+optional_modules = [
+    'stempelwerk.StempelWerkMemory',
+    'stempelwerk.StempelWerkOutputStore',
+    'stempelwerk.StempelWerkProfiler',
+    'stempelwerk.StempelWerkProgress',
+]
+assert not [name for name in optional_modules if name in sys.modules]
+"""
+
+        completed_process = subprocess.run(
+            [sys.executable, '-c', script, str(config_path)],
+            capture_output=True,
+            text=True,
+        )
+
+        assert completed_process.returncode == 0, completed_process.stderr
+
     # After having become a Python goddess, she wants to start a hacking
     # career. And what do hackers do? Delete files. Yes! YES!!!
     #
@@ -304,6 +562,671 @@ class TestMascara(TestCommon):
         # "last_run_file" is re-created
         assert last_run_file.is_file()
 
+    # Mascara has read that global variables are evil, so she changes them
+    # behind StempelWerk's back. Unimpressed, StempelWerk only renders the
+    # templates that access the changed variables.
+    @pytest.mark.datafiles(FIXTURE_DIR / '3_process_only_modified_globals')
+    def test_process_only_modified_globals(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'track_globals': True,
+        }
+
+        global_namespace = json.loads(
+            (datafiles / 'global.json').read_text(),
+        )
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=json.dumps(global_namespace),
+        )
+
+        config = run_results['configuration']
+        assert run_results['saved_files'] == 2
+
+        # partial run does not render templates when globals are unchanged
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 0
+
+        # partial run ignores changes to unused globals
+        global_namespace['unused'] = 2
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 0
+
+        # by default, changing a nested global re-renders all templates that
+        # access its top-level key
+        global_namespace['a']['note'] = 'not the last letter'
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 1
+
+        # partial run renders templates that access changed globals
+        global_namespace['a']['name'] = 'ALPHA'
+        self.update_file(datafiles / '30-expected_updated/ab.txt')
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 1
+
+        # partial run also tracks globals accessed with computed keys
+        global_namespace['c'] = 'GAMMA'
+        self.update_file(datafiles / '30-expected_updated/cd.txt')
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 1
+
+    # Her colleagues are annoyed by all the re-rendering, so Mascara tells
+    # StempelWerk to look deeper into the global variables.
+    @pytest.mark.datafiles(FIXTURE_DIR / '3_process_only_modified_globals')
+    def test_process_only_modified_nested_globals(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'globals_tracking_depth': 2,
+            'track_globals': True,
+        }
+
+        global_namespace = json.loads(
+            (datafiles / 'global.json').read_text(),
+        )
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=json.dumps(global_namespace),
+        )
+
+        config = run_results['configuration']
+        assert run_results['saved_files'] == 2
+
+        # partial run ignores changes to unused nested globals
+        global_namespace['a']['note'] = 'not the last letter'
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 0
+
+        # partial run renders templates that access changed nested globals
+        global_namespace['a']['name'] = 'ALPHA'
+        self.update_file(datafiles / '30-expected_updated/ab.txt')
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 1
+
+    # Mascara's colleague only ever renders everything and does not want to
+    # pay for tracking global variables. Once Mascara starts using partial
+    # runs, StempelWerk starts tracking, too.
+    @pytest.mark.datafiles(FIXTURE_DIR / '3_process_only_modified_globals')
+    def test_process_only_modified_globals_on_demand(
+        self,
+        datafiles,
+    ):
+        global_namespace = json.loads(
+            (datafiles / 'global.json').read_text(),
+        )
+        state_file_path = (
+            datafiles / '.stempelwerk_cache/globals_dependencies.json'
+        )
+
+        # full runs neither track global variables nor store dependencies
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            {},
+            config_path,
+            global_namespace=json.dumps(global_namespace),
+        )
+
+        config = run_results['configuration']
+        assert not run_results['instance'].globals_tracker.is_enabled
+        assert not state_file_path.exists()
+
+        # without earlier tracking, the first partial run relies on
+        # modification times
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['instance'].globals_tracker.is_enabled
+        assert run_results['saved_files'] == 0
+        assert state_file_path.exists()
+
+        # from now on, full runs keep track of global variables
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=False,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['instance'].globals_tracker.is_enabled
+
+        global_namespace['unused'] = 2
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 0
+
+        global_namespace['c'] = 'GAMMA'
+        self.update_file(datafiles / '30-expected_updated/cd.txt')
+
+        run_results = self.convenience_run(
+            config,
+            config_path,
+            process_only_modified=True,
+            must_match=True,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['saved_files'] == 1
+
+    # Mascara learned about loops and immediately wrote one that runs until
+    # the heat death of the universe. Her second template tries to hoard all
+    # the memory in the world. The nightly build shrugs and carries on.
+    @pytest.mark.skipif(
+        sys.platform == 'win32',
+        reason='memory limits are not supported on Windows',
+    )
+    @pytest.mark.datafiles(FIXTURE_DIR / '4_runaway_template')
+    def test_runaway_template(
+        self,
+        datafiles,
+        monkeypatch,
+    ):
+        custom_config = {
+            'template_time_limit_seconds': 2,
+            'template_memory_limit_megabytes': 256,
+        }
+
+        global_namespace = {
+            'motto': 'Less is more.',
+        }
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=json.dumps(global_namespace),
+        )
+        assert run_results['processed_templates'] == 1
+        assert run_results['saved_files'] == 2
+
+        budget_overruns = {
+            budget_overrun['template']: budget_overrun
+            for budget_overrun in run_results['budget_overruns']
+        }
+        assert sorted(budget_overruns) == ['endless.jinja', 'greedy.jinja']
+
+        endless_overrun = budget_overruns['endless.jinja']
+        assert 'time limit' in endless_overrun['reason']
+        assert endless_overrun['running_time'].total_seconds() >= 2
+
+        greedy_overrun = budget_overruns['greedy.jinja']
+        assert 'memory limit' in greedy_overrun['reason']
+
+        # runaway templates are rendered again in the next partial run
+        globals_tracker = run_results['instance'].globals_tracker
+        assert globals_tracker.is_outdated('endless.jinja')
+        assert globals_tracker.is_outdated('greedy.jinja')
+        assert not globals_tracker.is_outdated('modest.jinja')
+
+        # the nightly build still notices runaway templates
+        monkeypatch.setattr(
+            sys,
+            'argv',
+            [
+                'stempelwerk',
+                '--globals',
+                json.dumps(global_namespace),
+                str(config_path),
+            ],
+        )
+
+        with pytest.raises(SystemExit) as exception_info:
+            main_cli()
+
+        assert exception_info.value.code == TemplateBudgetExceeded.exit_code
+
+    # Mascara's nightly build used to fail after hours because of a typo in
+    # one of the last templates. Now she checks the syntax of all templates
+    # first and fixes every error in one go.
+    @pytest.mark.datafiles(FIXTURE_DIR / '5_syntax_errors')
+    def test_check_syntax(
+        self,
+        datafiles,
+        monkeypatch,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+        }
+
+        global_namespace = json.dumps(
+            {
+                'motto': 'Less is more.',
+            }
+        )
+
+        config_path = datafiles / 'settings.json'
+        self.create_config(
+            custom_config,
+            config_path,
+        )
+
+        instance, _ = self.init_stempelwerk(
+            config_path,
+            global_namespace,
+        )
+
+        with pytest.raises(SyntaxCheckError) as exc_info:
+            instance.render_all_templates(check_syntax=True)
+
+        # all errors are reported, including those in unused stencils
+        problems = exc_info.value.problems
+        assert [problem.template_name for problem in problems] == [
+            'stencils/wobbly.jinja',
+            'typo.jinja',
+            'unclosed.jinja',
+        ]
+        assert problems[1].line_number == 2
+        assert exc_info.value.exit_code == 9
+
+        # nothing has been rendered
+        assert not list((datafiles / '20-output').iterdir())
+
+        template_dir = datafiles / '10-templates'
+        (template_dir / 'stencils/wobbly.jinja').write_text(
+            '{% macro wobble() %}\n{% endmacro %}\n'
+        )
+        (template_dir / 'typo.jinja').write_text(
+            "{{ 'typo.txt' | start_new_file }}\n{{ globals.motto | upper }}\n"
+        )
+        (template_dir / 'unclosed.jinja').write_text(
+            "{{ 'unclosed.txt' | start_new_file }}\n"
+            '{% if globals.motto %}\nFinally finished.\n{% endif %}\n'
+        )
+
+        # templates are compiled by several processes
+        monkeypatch.setattr(SyntaxChecker, 'TEMPLATES_PER_TASK', 1)
+
+        syntax_checker = SyntaxChecker(
+            instance.settings,
+            instance.jinja_environment,
+            processes=2,
+        )
+        assert syntax_checker.check(instance._all_template_names) == []
+
+        # compiled templates are used for rendering
+        hits_before = shared_bytecode_cache.hits
+        misses_before = shared_bytecode_cache.misses
+
+        run_results = instance.render_all_templates()
+        assert run_results['saved_files'] == 3
+
+        assert shared_bytecode_cache.hits - hits_before == 3
+        assert shared_bytecode_cache.misses == misses_before
+
+        self.compare_directories(json.loads(config_path.read_text()))
+
+        # syntax can also be checked without rendering
+        parsed_args = StempelWerk.CommandLineParser(
+            ['StempelWerk.py', '--syntax-only', str(config_path)]
+        )
+        assert parsed_args.syntax_only
+
+        checked_templates = StempelWerk.check_projects(
+            parsed_args.all_settings,
+        )
+        assert checked_templates == 4
+
+    # Mascara's nightly build used to stop at the first broken template. Now
+    # she wants to see all of them in the morning, and get the rest anyway.
+    @pytest.mark.datafiles(FIXTURE_DIR / '6_keep_going')
+    def test_keep_going(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+        }
+
+        global_namespace = json.dumps(
+            {
+                'apples': 5,
+            }
+        )
+
+        config_path = datafiles / 'settings.json'
+        self.create_config(
+            custom_config,
+            config_path,
+        )
+
+        instance, _ = self.init_stempelwerk(
+            config_path,
+            global_namespace,
+        )
+
+        # by default, the first error stops StempelWerk
+        with pytest.raises(ZeroDivisionError):
+            instance.render_all_templates()
+
+        instance, _ = self.init_stempelwerk(
+            config_path,
+            global_namespace,
+        )
+
+        run_results = instance.render_all_templates(keep_going=True)
+        assert run_results['processed_templates'] == 1
+        assert run_results['saved_files'] == 1
+
+        # errors are located in the template that raised them
+        failed_templates = run_results['failed_templates']
+        assert [
+            (failed_template['template'], failed_template['location'])
+            for failed_template in failed_templates
+        ] == [
+            ('broken.jinja', 'stencils/divide.jinja:3'),
+            ('typo.jinja', 'typo.jinja:2'),
+        ]
+        assert failed_templates[0]['error'].startswith('ZeroDivisionError')
+        assert failed_templates[1]['error'].startswith('TemplateSyntaxError')
+
+        self.compare_directories(json.loads(config_path.read_text()))
+
+        # failed templates are rendered again in the next partial run
+        globals_tracker = instance.globals_tracker
+        assert globals_tracker.is_outdated('broken.jinja')
+        assert globals_tracker.is_outdated('typo.jinja')
+        assert not globals_tracker.is_outdated('fine.jinja')
+
+        # failures turn into an exit code on the command line
+        parsed_args = StempelWerk.CommandLineParser(
+            [
+                'StempelWerk.py',
+                '--keep-going',
+                '--globals',
+                global_namespace,
+                str(config_path),
+            ]
+        )
+        assert parsed_args.keep_going
+
+        total_results = StempelWerk.render_projects(
+            parsed_args.all_settings,
+            keep_going=parsed_args.keep_going,
+        )
+        assert len(total_results['failed_templates']) == 2
+        assert RenderingError.exit_code == 10
+
+    # Mascara's build server embeds StempelWerk and carries on after a failed
+    # run. Threads, worker processes, and connections of the failed run must
+    # not pile up until the server runs out of resources.
+    @pytest.mark.datafiles(FIXTURE_DIR / '6_keep_going')
+    def test_failed_run_cleanup(
+        self,
+        datafiles,
+        capsys,
+    ):
+        database_path = datafiles / 'apples.sqlite'
+
+        with contextlib.closing(sqlite3.connect(database_path)) as connection:
+            connection.execute('CREATE TABLE apples (name TEXT)')
+
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'custom_modules': [
+                'tests.tintin.custom.add_metadata_lookup',
+            ],
+            'data_sources': {
+                'apples': {
+                    'type': 'sqlite',
+                    'path': 'apples.sqlite',
+                },
+            },
+            'measure_peak_memory': True,
+            'profile_templates': True,
+            'output_archive': 'output.zip',
+        }
+
+        global_namespace = json.dumps(
+            {
+                'apples': 5,
+            }
+        )
+
+        config_path = datafiles / 'settings.json'
+        self.create_config(
+            custom_config,
+            config_path,
+        )
+
+        instance, _ = self.init_stempelwerk(
+            config_path,
+            global_namespace,
+        )
+
+        # open a connection, which is returned to the pool
+        data_source = instance.data_sources['apples']
+        assert data_source.table_names == ['apples']
+        assert data_source.pool._idle_resources
+
+        with pytest.raises(ZeroDivisionError):
+            instance.render_all_templates()
+
+        assert not any(
+            thread.name == 'StempelWerk profiler'
+            for thread in threading.enumerate()
+        )
+        assert not tracemalloc.is_tracing()
+
+        assert not data_source.pool._idle_resources
+        metadata_lookup = instance.jinja_environment.globals['metadata_lookup']
+        assert metadata_lookup.teardowns == 1
+
+        # a partial archive does not replace the archive of the last run
+        assert not (datafiles / 'output.zip').exists()
+        assert not (datafiles / 'output.zip.tmp').exists()
+
+        capsys.readouterr()
+
+        # templates with budgets are rendered by a worker process, which
+        # cannot be measured
+        del custom_config['measure_peak_memory']
+        del custom_config['profile_templates']
+        custom_config['template_time_limit_seconds'] = 60
+
+        self.create_config(
+            custom_config,
+            config_path,
+        )
+
+        instance, _ = self.init_stempelwerk(
+            config_path,
+            global_namespace,
+        )
+
+        with pytest.raises(ZeroDivisionError):
+            instance.render_all_templates()
+
+        assert instance.supervised_renderer is None
+        assert not multiprocessing.active_children()
+
+        # the backtrace of the worker is shown by this process
+        captured = capsys.readouterr()
+        worker_output = captured.out + captured.err
+        assert 'Traceback (most recent call last)' in worker_output
+        assert 'ZeroDivisionError' in worker_output
+
+    # The CI runners of Mascara's team are tiny. Before anyone buys new ones,
+    # she wants to know which template eats all the memory.
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_process_only_modified_1')
+    def test_peak_memory(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'measure_peak_memory': True,
+            'peak_memory_warning_megabytes': 2,
+        }
+
+        # a template creating a rather large file
+        template_path = datafiles / '10-templates/huge.jinja'
+        template_path.write_text(
+            "{{ 'huge.txt' | start_new_file }}\n{{ 'x' * 4_000_000 }}\n"
+        )
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_with_config(
+            custom_config,
+            config_path,
+        )
+        assert run_results['saved_files'] == 3
+
+        output_path = datafiles / '20-output/huge.txt'
+        assert output_path.stat().st_size >= 4_000_000
+
+        peak_memory = run_results['peak_memory']
+        assert sorted(peak_memory) == ['ab.jinja', 'cd.jinja', 'huge.jinja']
+
+        # every phase handles a copy of the content
+        for phase in ['render', 'split', 'write']:
+            assert peak_memory['huge.jinja'][phase] >= 4_000_000
+            assert peak_memory['ab.jinja'][phase] < 1_000_000
+
+        memory_tracker = run_results['instance'].memory_tracker
+        assert {
+            template_name
+            for template_name, _, _ in memory_tracker.get_warnings()
+        } == {'huge.jinja'}
+
+        # peak memory is also stored in machine-readable form
+        report_path = datafiles / '.stempelwerk_cache/peak_memory.json'
+        assert json.loads(report_path.read_text()) == peak_memory
+
+    # A single template slows down the whole build. Mascara wants to know
+    # which line of it to blame, not which function of Jinja's.
+    @pytest.mark.datafiles(FIXTURE_DIR / '7_template_profile')
+    def test_template_profile(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'profile_templates': True,
+        }
+
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+        assert run_results['saved_files'] == 2
+
+        template_profiler = run_results['instance'].template_profiler
+        hot_lines = template_profiler.get_hot_lines()
+
+        # time is attributed to the calling template and the stencil
+        assert {template_line for template_line, _ in hot_lines[:2]} == {
+            ('slow.jinja', 3),
+            ('stencils/busy.jinja', 4),
+        }
+
+        # time spent in the stencil is included in the calling line
+        line_times = template_profiler.get_line_times()
+        total_time, self_time = line_times[('slow.jinja', 3)]
+        assert total_time > 0.05
+        assert self_time < total_time / 2
+
+        # folded stacks for flame graphs
+        folded_path = datafiles / '.stempelwerk_cache/template_profile.folded'
+        folded_stacks = folded_path.read_text().splitlines()
+        assert any(
+            folded_stack.startswith('slow.jinja:3;stencils/busy.jinja:4 ')
+            for folded_stack in folded_stacks
+        )
+
+        # annotated report shows the source of every line
+        report_path = datafiles / '.stempelwerk_cache/template_profile.txt'
+        report = report_path.read_text()
+        assert 'slow.jinja:3  {{ busy.count_squares(100000) }}\n' in report
+
+        # the event loop of async rendering runs in the sampled thread
+        custom_config['async_rendering'] = True
+        run_results = self.run_with_config(
+            custom_config,
+            config_path,
+        )
+
+        template_profiler = run_results['instance'].template_profiler
+        assert ('slow.jinja', 3) in template_profiler.get_line_times()
+
+        # worker processes cannot be sampled
+        custom_config['template_time_limit_seconds'] = 60
+
+        with pytest.raises(ConfigurationError, match='profile_templates'):
+            self.run_with_config(
+                custom_config,
+                config_path,
+            )
+
     # Mascara, Destroyer of Worlds? Maybe not, but certainly Destroyer of
     # Files. And now: Destroyer of Templates. We stand in awe.
     @pytest.mark.datafiles(FIXTURE_DIR / '2_exception_syntax_error')
@@ -7,10 +7,24 @@
 # names, but all personality traits have been made up. I hope they have as much
 # fun reading these tests as I had in writing them!
 
+import contextlib
+import os
 import pathlib
+import shutil
+import sqlite3
+import sys
 
+import jinja2
 import pytest
 
+from stempelwerk.StempelWerk import StempelWerk
+from stempelwerk.StempelWerkDataSources import LazyTable
+from stempelwerk.StempelWerkEnvironment import (
+    StempelWerkEnvironment,
+    shared_bytecode_cache,
+)
+from stempelwerk.StempelWerkErrors import ConfigurationError
+
 from .common import TestCommon
 
 FIXTURE_DIR = pathlib.Path('tests') / 'tintin'
@@ -72,6 +86,551 @@ class TestTinTin(TestCommon):
             global_namespace=global_namespace_file,
         )
 
+    # Tin Tin is impatient: in prison, every second counts. He asks
+    # StempelWerk to keep a snapshot of his global variables and checks that
+    # it is only used until the JSON file changes.
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_global_variables')
+    def test_global_variables_snapshot(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'cache_globals': True,
+        }
+
+        global_namespace_file = datafiles / 'global.json'
+        snapshot_dir = datafiles / '.stempelwerk_cache/globals'
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+
+        config = run_results['configuration']
+        assert len(list(snapshot_dir.glob('*.marshal'))) == 1
+
+        # secretly change JSON file without changing its size or timestamp
+        file_stats = global_namespace_file.stat()
+
+        original_contents = global_namespace_file.read_text()
+        modified_contents = original_contents.replace('true', 'null')
+        assert len(modified_contents) == len(original_contents)
+
+        global_namespace_file.write_text(modified_contents)
+        os.utime(
+            global_namespace_file,
+            ns=(file_stats.st_atime_ns, file_stats.st_mtime_ns),
+        )
+
+        # snapshot is used, so the output does not change
+        self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+        self.compare_directories(config)
+
+        # updating the timestamp reveals the change
+        os.utime(
+            global_namespace_file,
+            ns=(file_stats.st_atime_ns, file_stats.st_mtime_ns + 10**9),
+        )
+
+        self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+        with pytest.raises(AssertionError):
+            self.compare_directories(config)
+
+        # projects rendered together keep snapshots in their own cache
+        # directory, even when the first project does not cache anything
+        plain_config_path = datafiles / 'settings_plain.json'
+        self.create_config(
+            {
+                'stencil_dir_name': 'stencils',
+                'cache_dir': '.plain_cache',
+            },
+            plain_config_path,
+        )
+
+        other_config_path = datafiles / 'settings_other.json'
+        self.create_config(
+            {
+                **custom_config,
+                'cache_dir': '.other_cache',
+            },
+            other_config_path,
+        )
+
+        parsed_args = StempelWerk.CommandLineParser(
+            [
+                'StempelWerk.py',
+                '--globals',
+                str(global_namespace_file),
+                str(plain_config_path),
+                str(other_config_path),
+            ]
+        )
+        parsed_args.printer.close()
+
+        other_snapshot_dir = datafiles / '.other_cache/globals'
+        assert len(list(other_snapshot_dir.glob('*.marshal'))) == 1
+        assert not (datafiles / '.plain_cache/globals').exists()
+
+        all_settings = parsed_args.all_settings
+        assert all_settings[0].global_namespace == (
+            all_settings[1].global_namespace
+        )
+        assert all_settings[0].global_namespace is not (
+            all_settings[1].global_namespace
+        )
+
+    # The prison's disk is full again. Tin Tin cannot store a snapshot of the
+    # global variables, but StempelWerk renders anyway and only complains.
+    @pytest.mark.datafiles(FIXTURE_DIR / '1_global_variables')
+    def test_global_variables_snapshot_not_writable(
+        self,
+        datafiles,
+        monkeypatch,
+        capsys,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'cache_globals': True,
+        }
+
+        def fail_to_replace(source, destination):
+            raise OSError('No space left on device')
+
+        monkeypatch.setattr(os, 'replace', fail_to_replace)
+
+        config_path = datafiles / 'settings.json'
+        self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=str(datafiles / 'global.json'),
+        )
+
+        snapshot_dir = datafiles / '.stempelwerk_cache/globals'
+        assert list(snapshot_dir.iterdir()) == []
+
+        captured = capsys.readouterr()
+        assert 'Cannot store snapshot of global variables' in captured.out
+
+    # The prison library keeps its catalogue in a database and a spreadsheet.
+    # Tin Tin renders it without loading everything into memory first, and
+    # checks that StempelWerk notices when a librarian changes the database.
+    @pytest.mark.datafiles(FIXTURE_DIR / '4_data_sources')
+    def test_data_sources(
+        self,
+        datafiles,
+    ):
+        metadata_path = datafiles / 'metadata'
+        database_path = metadata_path / 'schema.sqlite'
+
+        with contextlib.closing(sqlite3.connect(database_path)) as connection:
+            connection.executescript(
+                (metadata_path / 'schema.sql').read_text(),
+            )
+
+        custom_config = {
+            'data_sources': {
+                'schema': {
+                    'type': 'sqlite',
+                    'path': 'metadata/schema.sqlite',
+                },
+                'columns': {
+                    'type': 'csv',
+                    'path': 'metadata/columns.csv',
+                    'key': 'column_name',
+                },
+            },
+            'track_globals': True,
+        }
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+        assert run_results['saved_files'] == 3
+
+        # rows can also be looked up by key
+        columns = run_results['instance'].data_sources['columns']
+        assert columns['Other_Key']['column_type'] == 'INT'
+
+        tables = run_results['instance'].data_sources['schema']['tables']
+        assert tables['Target']['schema_name'] == 'DEMO'
+        assert len(tables) == 2
+
+        # rows are streamed; loops that stop early return their connection
+        schema = run_results['instance'].data_sources['schema']
+        rows = iter(tables)
+        assert next(rows)['table_name']
+        assert not schema.pool._idle_resources
+
+        rows.close()
+        assert len(schema.pool._idle_resources) == 1
+
+        # tables must implement all ways of accessing rows
+        with pytest.raises(TypeError):
+            LazyTable()
+
+        # partial run does not render anything when data is unchanged
+        run_results = self.run(
+            config_path,
+            process_only_modified=True,
+        )
+        assert run_results['saved_files'] == 0
+
+        # partial run renders templates accessing modified data sources
+        connection = sqlite3.connect(database_path)
+        with contextlib.closing(connection), connection:
+            connection.execute(
+                'UPDATE tables SET description = ? WHERE table_name = ?',
+                ('Catalogue of stolen goods', 'Other'),
+            )
+
+        run_results = self.run(
+            config_path,
+            process_only_modified=True,
+        )
+        assert run_results['processed_templates'] == 1
+        assert run_results['saved_files'] == 2
+
+    # Tin Tin's filters look up descriptions of his loot in a database. The
+    # warden complained about the number of open connections, so the filters
+    # now share a pool that is closed when the run is finished.
+    @pytest.mark.datafiles(FIXTURE_DIR / '7_shared_resources')
+    def test_shared_resources(
+        self,
+        datafiles,
+    ):
+        metadata_path = datafiles / 'metadata'
+        database_path = metadata_path / 'schema.sqlite'
+
+        with contextlib.closing(sqlite3.connect(database_path)) as connection:
+            connection.executescript(
+                (metadata_path / 'schema.sql').read_text(),
+            )
+
+        custom_config = {
+            'custom_modules': [
+                'tests.tintin.custom.add_metadata_lookup',
+            ],
+        }
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        # all lookups use the same connection, which is closed afterwards
+        instance = run_results['instance']
+        metadata_lookup = instance.jinja_environment.globals['metadata_lookup']
+
+        assert len(metadata_lookup.used_connections) == 1
+        assert metadata_lookup.teardowns == 1
+        assert 'metadata' in instance.resources
+
+        with pytest.raises(KeyError):
+            instance.resources.acquire('loot')
+
+        # resources are created again in the next run
+        (datafiles / '10-templates/descriptions.jinja').touch()
+        instance.render_all_templates()
+
+        assert len(metadata_lookup.used_connections) == 2
+        assert metadata_lookup.teardowns == 2
+
+    # Listing the columns of his loot takes ages, so Tin Tin wraps the stencil
+    # code in a cache block. Fragments are kept on disk across runs, but
+    # are rendered again when the columns change.
+    @pytest.mark.datafiles(FIXTURE_DIR / '5_fragment_cache')
+    def test_fragment_cache(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'cache_fragments': True,
+            'track_globals': True,
+        }
+
+        global_namespace_file = datafiles / 'global.json'
+        fragment_dir = datafiles / '.stempelwerk_cache/fragments'
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+
+        # second template re-uses fragment of first template
+        fragment_cache = run_results['instance'].fragment_cache
+        assert (fragment_cache.hits, fragment_cache.misses) == (1, 1)
+        assert len(list(fragment_dir.glob('*.json'))) == 1
+
+        # new instance loads fragment from disk
+        run_results = self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+
+        fragment_cache = run_results['instance'].fragment_cache
+        assert (fragment_cache.hits, fragment_cache.misses) == (2, 0)
+
+        # templates using cached fragments depend on the global variables
+        # accessed by these fragments
+        for template_path in (datafiles / '10-templates').rglob('*.jinja'):
+            os.utime(template_path, (0, 0))
+
+        global_namespace = global_namespace_file.read_text()
+        global_namespace_file.write_text(
+            global_namespace.replace('"value"', '"worth"'),
+        )
+
+        run_results = self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+            process_only_modified=True,
+        )
+        assert run_results['processed_templates'] == 2
+
+        fragment_cache = run_results['instance'].fragment_cache
+        assert (fragment_cache.hits, fragment_cache.misses) == (1, 1)
+
+        output_path = datafiles / '20-output/select_loot.sql'
+        assert 'worth' in output_path.read_text()
+
+    # Tin Tin polishes the wording of a stencil. Cached fragments calling
+    # its macros must not keep the old wording, even across runs.
+    @pytest.mark.datafiles(FIXTURE_DIR / '5_fragment_cache')
+    def test_fragment_cache_code_changes(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'cache_fragments': True,
+        }
+
+        template_dir = datafiles / '10-templates'
+        (template_dir / 'count.jinja').write_text(
+            "{% import 'stencils/describe.jinja' as describe %}\n"
+            "{{ 'count_loot.txt' | start_new_file }}\n"
+            "{% cache 'count', 'Loot' %}{{ describe.table('Loot') }}"
+            '{% endcache %}\n'
+        )
+
+        stencil_path = template_dir / 'stencils/describe.jinja'
+        stencil_path.write_text(
+            '{% macro table(name) %}OLD-{{ name }}{% endmacro %}\n'
+        )
+
+        global_namespace_file = datafiles / 'global.json'
+        output_path = datafiles / '20-output/count_loot.txt'
+
+        config_path = datafiles / 'settings.json'
+        self.run_with_config(
+            custom_config,
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+        assert output_path.read_text().strip() == 'OLD-Loot'
+
+        # the block itself has not changed, but the stencil it calls
+        stencil_path.write_text(
+            '{% macro table(name) %}NEW-{{ name }}{% endmacro %}\n'
+        )
+
+        run_results = self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+        assert output_path.read_text().strip() == 'NEW-Loot'
+
+        # fragments of unchanged code are still re-used
+        fragment_cache = run_results['instance'].fragment_cache
+        assert fragment_cache.hits == 2
+
+    # Tin Tin caches a block inside a loop, but forgets to pass the loop
+    # variable as key. StempelWerk refuses to compile the template instead of
+    # repeating the first fragment, and does the same for "file" blocks,
+    # whose files would not be saved when the fragment is re-used.
+    @pytest.mark.datafiles(FIXTURE_DIR / '5_fragment_cache')
+    def test_fragment_cache_undeclared_variables(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+        }
+
+        template_path = datafiles / '10-templates/count.jinja'
+        global_namespace_file = datafiles / 'global.json'
+        config_path = datafiles / 'settings.json'
+
+        template_path.write_text(
+            "{{ 'count.txt' | start_new_file }}\n"
+            "{% for name in ['Loot', 'Guards'] %}\n"
+            "{% cache 'count' %}{{ name }}{% endcache %}\n"
+            '{% endfor %}\n'
+        )
+
+        with pytest.raises(
+            jinja2.TemplateSyntaxError,
+            match='variables that are not keys: name',
+        ):
+            self.run_with_config(
+                custom_config,
+                config_path,
+                global_namespace=str(global_namespace_file),
+            )
+
+        template_path.write_text(
+            "{% cache 'count' %}\n"
+            "{% file 'count.txt' %}{{ globals.prison }}{% endfile %}\n"
+            '{% endcache %}\n'
+        )
+
+        with pytest.raises(
+            jinja2.TemplateSyntaxError,
+            match='"file" blocks inside "cache" blocks',
+        ):
+            self.run(
+                config_path,
+                global_namespace=str(global_namespace_file),
+            )
+
+        # loop variables passed as keys are fine
+        template_path.write_text(
+            "{{ 'count.txt' | start_new_file }}\n"
+            "{% for name in ['Loot', 'Guards'] %}\n"
+            "{% cache 'count', name %}{{ name }}{% endcache %}\n"
+            '{% endfor %}\n'
+        )
+
+        self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+
+        output_path = datafiles / '20-output/count.txt'
+        assert output_path.read_text().strip() == 'LootGuards'
+
+    # The prison keeps its records in a slow database, so Tin Tin's filters
+    # look up guards with coroutines. While one template waits for the
+    # database, StempelWerk renders the other templates.
+    @pytest.mark.datafiles(FIXTURE_DIR / '6_async_rendering')
+    def test_async_rendering(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'custom_modules': [
+                'tests.tintin.custom.add_async_lookups',
+            ],
+            'async_rendering': True,
+            'globals_tracking_depth': 2,
+            'track_globals': True,
+        }
+
+        global_namespace_file = datafiles / 'global.json'
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+        assert run_results['saved_files'] == 3
+
+        # lookups of all templates overlap
+        jinja_environment = run_results['instance'].jinja_environment
+        assert jinja_environment.is_async
+
+        async_lookups = jinja_environment.globals['async_lookups']
+        assert async_lookups.maximum_running_lookups == 3
+
+        # templates rendered at the same time only depend on the global
+        # variables they access themselves
+        for template_path in (datafiles / '10-templates').rglob('*.jinja'):
+            os.utime(template_path, (0, 0))
+
+        global_namespace = global_namespace_file.read_text()
+        global_namespace_file.write_text(
+            global_namespace.replace('"day"', '"early"'),
+        )
+
+        run_results = self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+            process_only_modified=True,
+        )
+        assert run_results['processed_templates'] == 1
+
+        output_path = datafiles / '20-output/bob.txt'
+        assert output_path.read_text() == 'Bob works the early shift.'
+
+    # Every template of Tin Tin's prison imports the same stencil, which looks
+    # up the name of the prison. The stencil is only evaluated once, but all
+    # templates still depend on the global variables it accesses.
+    @pytest.mark.datafiles(FIXTURE_DIR / '8_stencil_modules')
+    def test_stencil_modules(
+        self,
+        datafiles,
+    ):
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'track_globals': True,
+        }
+
+        global_namespace_file = datafiles / 'global.json'
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+            global_namespace=str(global_namespace_file),
+        )
+        assert run_results['processed_templates'] == 3
+
+        jinja_environment = run_results['instance'].jinja_environment
+        stencil_modules = jinja_environment.stencil_modules
+        assert (stencil_modules.misses, stencil_modules.hits) == (1, 2)
+
+        # the stencil looks up the prison with a computed key, so only
+        # runtime tracking knows about it
+        for template_path in (datafiles / '10-templates').rglob('*.jinja'):
+            os.utime(template_path, (0, 0))
+
+        global_namespace = global_namespace_file.read_text()
+        global_namespace_file.write_text(
+            global_namespace.replace('Alcatraz', 'Rikers'),
+        )
+
+        run_results = self.run(
+            config_path,
+            global_namespace=str(global_namespace_file),
+            process_only_modified=True,
+        )
+        assert run_results['processed_templates'] == 3
+
+        output_path = datafiles / '20-output/tin_tin.txt'
+        assert output_path.read_text() == 'Welcome to RIKERS, Tin_Tin!'
+
     # After a year of intense testing, Tin Tin moved on to custom modules. He
     # wanted to call them "prison_cell" and "inmate_canteen", but the author of
     # StempelWerk put his foot down.
@@ -95,6 +654,170 @@ class TestTinTin(TestCommon):
             config_path,
         )
 
+        # misspelled modules are reported as such, also when looking for
+        # changes in git
+        for module_name in ('tests.tintin.custom.add_filter', 'prison.cell'):
+            custom_config['custom_modules'] = [module_name]
+
+            with pytest.raises(ConfigurationError):
+                self.run_with_config(
+                    custom_config,
+                    config_path,
+                )
+
+            instance, _ = self.init_stempelwerk(config_path)
+            with pytest.raises(ConfigurationError):
+                instance._get_custom_module_paths()
+
+    # Tin Tin's cell mate renders his own project in the same service. Both
+    # define a filter called "shout", but only the cell mate's one needs the
+    # template context, so compiled templates must not be shared.
+    def test_custom_filters_compiled_code(
+        self,
+    ):
+        def shout(
+            value,
+        ):
+            return value.upper()
+
+        @jinja2.pass_context
+        def shout_with_context(
+            context,
+            value,
+        ):
+            return f'{value.upper()} {context["cell"]}'
+
+        templates = {
+            'shout.jinja': "{{ 'quiet' | shout }}",
+        }
+
+        tin_tin_environment = StempelWerkEnvironment(
+            loader=jinja2.DictLoader(templates),
+            bytecode_cache=shared_bytecode_cache,
+        )
+        tin_tin_environment.filters['shout'] = shout
+
+        cell_mate_environment = StempelWerkEnvironment(
+            loader=jinja2.DictLoader(templates),
+            bytecode_cache=shared_bytecode_cache,
+        )
+        cell_mate_environment.filters['shout'] = shout_with_context
+
+        template = tin_tin_environment.get_template('shout.jinja')
+        assert template.render() == 'QUIET'
+
+        template = cell_mate_environment.get_template('shout.jinja')
+        assert template.render(cell=42) == 'QUIET 42'
+
+    # Tin Tin's prison runs StempelWerk from a long-lived service. The warden
+    # noticed that every run loaded the custom modules again and made the
+    # module search path grow, so Tin Tin checks that modules are only loaded
+    # again when their code changes.
+    @pytest.mark.datafiles(FIXTURE_DIR / '2_custom_module')
+    def test_custom_module_reuse(
+        self,
+        datafiles,
+    ):
+        module_path = datafiles / 'tin_tin_filters.py'
+        shutil.copyfile(
+            pathlib.Path('tests/tintin/custom/add_filters.py'),
+            module_path,
+        )
+
+        custom_config = {
+            'stencil_dir_name': 'stencils',
+            'custom_modules': [
+                'tin_tin_filters',
+                'tests.tintin.custom.add_tests',
+            ],
+        }
+
+        # set up StempelWerk and execute full run
+        config_path = datafiles / 'settings.json'
+        run_results = self.run_and_compare(
+            custom_config,
+            config_path,
+        )
+
+        module_key = (datafiles.resolve(), 'tin_tin_filters')
+        imported_modules = run_results['instance']._imported_modules
+        _, first_module = imported_modules[module_key]
+
+        search_path_length = len(sys.path)
+
+        # unchanged modules are re-used
+        run_results = self.run(config_path)
+        assert run_results['instance'].module_load_times
+        assert imported_modules[module_key][1] is first_module
+        assert len(sys.path) == search_path_length
+
+        # modified modules are loaded again
+        with module_path.open('a') as module_file:
+            module_file.write('\n# he is innocent, really!\n')
+
+        self.run(config_path)
+        assert imported_modules[module_key][1] is not first_module
+        assert len(sys.path) == search_path_length
+
+    # Tin Tin and his cell mate both keep their filters in "custom/cell.py".
+    # When their projects are rendered together, each of them must get his
+    # own filters.
+    def test_custom_module_per_project(
+        self,
+        tmp_path,
+    ):
+        config_paths = []
+
+        for inmate in ('tin-tin', 'cell-mate'):
+            project_dir = tmp_path / inmate
+            (project_dir / '10-templates').mkdir(parents=True)
+            (project_dir / '20-output').mkdir()
+            (project_dir / 'custom').mkdir()
+
+            (project_dir / '10-templates/cell.jinja').write_text(
+                "{{ 'cell.txt' | start_new_file }}\n{{ 'x' | inmate }}\n"
+            )
+
+            (project_dir / 'custom/cell.py').write_text(
+                'from stempelwerk.StempelWerk import StempelWerk\n'
+                '\n'
+                'class CustomCode(StempelWerk.CustomCodeTemplate):\n'
+                '    def update_environment(self, jinja_environment):\n'
+                '        jinja_environment.filters["inmate"] = (\n'
+                f'            lambda value: {inmate!r}\n'
+                '        )\n'
+                '        return jinja_environment\n'
+            )
+
+            config_path = project_dir / 'settings.json'
+            self.create_config(
+                {
+                    'custom_modules': ['custom.cell'],
+                },
+                config_path,
+            )
+            config_paths.append(config_path)
+
+        parsed_args = StempelWerk.CommandLineParser(
+            [
+                'StempelWerk.py',
+                *[str(config_path) for config_path in config_paths],
+            ]
+        )
+
+        StempelWerk.render_projects(
+            parsed_args.all_settings,
+            printer=parsed_args.printer,
+        )
+        parsed_args.printer.close()
+
+        for inmate in ('tin-tin', 'cell-mate'):
+            output_path = tmp_path / inmate / '20-output/cell.txt'
+            assert output_path.read_text().strip() == inmate
+
+        # parent packages are not imported, so they cannot leak either
+        assert 'custom' not in sys.modules
+
     # Only 148 years to go! At Tin Tin's current pace, he will run out of work
     # by the end of the century ...
     #
@@ -0,0 +1,5 @@
+-- Another table
+CREATE TABLE DEMO.Other
+(
+    Other_Key        INT
+);
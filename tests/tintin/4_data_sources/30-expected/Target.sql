@@ -0,0 +1,6 @@
+-- Target of a merge
+CREATE TABLE DEMO.Target
+(
+    Key_Column       INT,
+    Name_Column      NVARCHAR(200)
+);
@@ -0,0 +1,9 @@
+CREATE TABLE tables
+(
+    table_name TEXT PRIMARY KEY,
+    schema_name TEXT NOT NULL,
+    description TEXT
+);
+
+INSERT INTO tables VALUES ('Other', 'DEMO', 'Another table');
+INSERT INTO tables VALUES ('Target', 'DEMO', 'Target of a merge');
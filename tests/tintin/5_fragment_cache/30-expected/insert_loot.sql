@@ -0,0 +1,5 @@
+INSERT INTO Loot (
+    id,
+    owner,
+    value
+) VALUES (?, ?, ?);
\ No newline at end of file
@@ -0,0 +1,5 @@
+SELECT
+    id,
+    owner,
+    value
+FROM Loot;
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+
+from stempelwerk.StempelWerk import StempelWerk
+
+
+class CustomCode(StempelWerk.CustomCodeTemplate):
+    def __init__(
+        self,
+        copy_of_settings,
+        printer,
+    ):
+        super().__init__(copy_of_settings, printer)
+
+        # number of lookups waiting at the same time
+        self.running_lookups = 0
+        self.maximum_running_lookups = 0
+
+    async def _look_up(
+        self,
+        value,
+    ):
+        self.running_lookups += 1
+        self.maximum_running_lookups = max(
+            self.maximum_running_lookups,
+            self.running_lookups,
+        )
+
+        # pretend to query a slow database
+        await asyncio.sleep(0.05)
+
+        self.running_lookups -= 1
+        return value
+
+    def update_environment(
+        self,
+        jinja_environment,
+    ):
+        jinja_environment = super().update_environment(
+            jinja_environment,
+        )
+
+        async def describe_shift(
+            shift,
+        ):
+            return await self._look_up(f'{shift} shift')
+
+        async def warden():
+            return await self._look_up('Warden Norton')
+
+        jinja_environment.filters['describe_shift'] = describe_shift
+        jinja_environment.globals['warden'] = warden
+        jinja_environment.globals['async_lookups'] = self
+
+        return jinja_environment
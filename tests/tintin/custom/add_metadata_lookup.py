@@ -0,0 +1,51 @@
+from stempelwerk.StempelWerk import StempelWerk
+
+
+class CustomCode(StempelWerk.CustomCodeTemplate):
+    def __init__(
+        self,
+        copy_of_settings,
+        printer,
+    ):
+        super().__init__(copy_of_settings, printer)
+
+        self.used_connections = set()
+        self.teardowns = 0
+
+    def update_environment(
+        self,
+        jinja_environment,
+    ):
+        jinja_environment = super().update_environment(
+            jinja_environment,
+        )
+
+        # connections are shared by all filters and templates
+        self.resources.register_sqlite(
+            'metadata',
+            'metadata/schema.sqlite',
+        )
+
+        def describe_table(
+            table_name,
+        ):
+            with self.resources.acquire('metadata') as connection:
+                self.used_connections.add(connection)
+
+                row = connection.execute(
+                    'SELECT description FROM tables WHERE table_name = ?',
+                    (table_name,),
+                ).fetchone()
+
+            return row[0]
+
+        jinja_environment.filters['describe_table'] = describe_table
+        jinja_environment.globals['metadata_lookup'] = self
+
+        return jinja_environment
+
+    def teardown(
+        self,
+    ):
+        super().teardown()
+        self.teardowns += 1